@@ -69,10 +69,18 @@ if not _modules_path in sys.path:
     sys.path.append(_modules_path)
 del _modules_path
 
-from io_scene_nif import properties, operators, ui
+from io_scene_nif.utility.nif_workers import NifWorkers
 
-import bpy
-import bpy.props
+try:
+    import bpy
+except ImportError:
+    # not running inside blender, which is fine for modules that do not
+    # need bpy, such as io_scene_nif.geometrysys.mesh_utils and its tests
+    bpy = None
+
+if bpy:
+    from io_scene_nif import properties, operators, ui
+    import bpy.props
 
 import logging
 
@@ -115,6 +123,7 @@ def unregister():
     bpy.types.INFO_MT_file_import.remove(menu_func_import)
     bpy.types.INFO_MT_file_export.remove(menu_func_export)
     bpy.utils.unregister_module(__name__)
+    NifWorkers.shutdown()
     
 
 if __name__ == "__main__":
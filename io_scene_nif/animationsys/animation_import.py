@@ -37,8 +37,12 @@
 #
 # ***** END LICENSE BLOCK *****
 import bpy
+import mathutils
+import numpy as np
 from pyffi.formats.nif import NifFormat
 
+from io_scene_nif.animationsys import bspline, key_reduction, keyframe_math, keyframe_writer
+
 from io_scene_nif.utility import nif_utils
 from io_scene_nif.utility.nif_logging import NifLog
 from io_scene_nif.utility.nif_global import NifOp
@@ -50,7 +54,37 @@ class AnimationHelper():
         self.object_animation = ObjectAnimation(parent)
         self.material_animation = MaterialAnimation(parent)
         self.armature_animation = ArmatureAnimation(parent)
+        # channel -> number of keys, and number of keys removed by key
+        # reduction
+        self.key_reduction_stats = {}
     
+    def add_fcurves(self, action, data_path, frames, values, group, interpolation, cyclic):
+        """Write the keys of a vector property into fcurves, after removing
+        redundant keys if key reduction is enabled."""
+        reduction = NifOp.props.animation_key_reduction
+        if reduction != "NONE":
+            channel = data_path.rsplit(".", 1)[-1]
+            frames, values = keyframe_writer.last_key_per_frame(frames, values)
+            if reduction == "LOSSLESS":
+                tolerance = 0.0
+            elif channel.startswith("rotation"):
+                tolerance = NifOp.props.animation_key_angle_tolerance
+            else:
+                tolerance = NifOp.props.animation_key_tolerance
+            reduced_frames, values = key_reduction.reduce_keys(
+                frames, values, tolerance, angular=(channel == "rotation_quaternion"),
+                interpolation=interpolation)
+            num_keys, num_removed = self.key_reduction_stats.get(channel, (0, 0))
+            self.key_reduction_stats[channel] = (num_keys + len(frames),
+                                                 num_removed + len(frames) - len(reduced_frames))
+            frames = reduced_frames
+        return keyframe_writer.add_fcurves(action, data_path, frames, values, group, interpolation, cyclic)
+
+    def report_key_reduction(self):
+        """Report the number of keys removed per channel."""
+        for channel, (num_keys, num_removed) in sorted(self.key_reduction_stats.items()):
+            NifLog.info("Key reduction: removed {0} of {1} {2} keys".format(num_removed, num_keys, channel))
+
 
     def import_kf_root(self, kf_root, root):
         """Merge kf into nif.
@@ -69,11 +103,12 @@ class AnimationHelper():
 
 
         # go over all controlled blocks
+        block_index = self.nif_import.block_index
         for controlledblock in kf_root.controlled_blocks:
             # get the name
             nodename = controlledblock.get_node_name()
             # match from nif tree?
-            node = root.find(block_name = nodename)
+            node = block_index.find(block_name=nodename, root=root)
             if not node:
                 NifLog.info("Animation for {0} but no such node found in nif tree".format(nodename))
                 continue
@@ -82,12 +117,12 @@ class AnimationHelper():
             if not controllertype:
                 NifLog.info("Animation for {0} without controller type, so skipping".format(nodename))
                 continue
-            controller = nif_utils.find_controller(node, getattr(NifFormat, controllertype))
+            controller = block_index.find_controller(node, getattr(NifFormat, controllertype))
             if not controller:
                 NifLog.info("No {1} Controller found in corresponding animation node {0}, creating one".format(controllertype, nodename))
                 controller = getattr(NifFormat, controllertype)()
                 # TODO:set all the fields of this controller
-                node.add_controller(controller)
+                block_index.add_controller(node, controller)
             # yes! attach interpolator
             controller.interpolator = controlledblock.interpolator
             # in case of a NiTransformInterpolator without a data block
@@ -147,7 +182,7 @@ class AnimationHelper():
         if isinstance(niBlock, NifFormat.NiControllerSequence):
             txk = niBlock.text_keys
         else:
-            txk = niBlock.find(block_type=NifFormat.NiTextKeyExtraData)
+            txk = self.nif_import.block_index.find(block_type=NifFormat.NiTextKeyExtraData, root=niBlock)
         if txk:
             # get animation text buffer, and clear it if it already exists
             # TODO:git rid of try-except block here
@@ -167,41 +202,42 @@ class AnimationHelper():
             bpy.context.scene.getRenderingContext().startFrame(1)
             bpy.context.scene.getRenderingContext().endFrame(frame)
 
-    def get_frames_per_second(self, roots):
-        """Scan all blocks and return a reasonable number for FPS."""
+    def get_frames_per_second(self, block_indices):
+        """Scan all blocks and return a reasonable number for FPS.
+
+        :param block_indices: The block indices of the files to scan.
+        """
         # find all key times
         key_times = []
-        for root in roots:
-            for kfd in root.tree(block_type=NifFormat.NiKeyframeData):
+        for block_index in block_indices:
+            for kfd in block_index.get_blocks(NifFormat.NiKeyframeData):
                 key_times.extend(key.time for key in kfd.translations.keys)
                 key_times.extend(key.time for key in kfd.scales.keys)
                 key_times.extend(key.time for key in kfd.quaternion_keys)
                 key_times.extend(key.time for key in kfd.xyz_rotations[0].keys)
                 key_times.extend(key.time for key in kfd.xyz_rotations[1].keys)
                 key_times.extend(key.time for key in kfd.xyz_rotations[2].keys)
-            for kfi in root.tree(block_type=NifFormat.NiBSplineInterpolator):
+            for kfi in block_index.get_blocks(NifFormat.NiBSplineInterpolator):
                 if not kfi.basis_data:
                     # skip bsplines without basis data (eg bowidle.kf in
                     # Oblivion)
                     continue
+                num_frames = kfi.basis_data.num_control_points - 2
                 key_times.extend(
-                    point * (kfi.stop_time - kfi.start_time)
-                    / (kfi.basis_data.num_control_points - 2)
-                    for point in range(kfi.basis_data.num_control_points - 2))
-            for uvdata in root.tree(block_type=NifFormat.NiUVData):
+                    np.arange(num_frames) * (kfi.stop_time - kfi.start_time) / num_frames)
+            for uvdata in block_index.get_blocks(NifFormat.NiUVData):
                 for uvgroup in uvdata.uv_groups:
                     key_times.extend(key.time for key in uvgroup.keys)
         # not animated, return a reasonable default
         if not key_times:
             return 30
+        key_times = np.asarray(key_times, dtype=np.float64)
         # calculate FPS
         fps = 30
-        lowest_diff = sum(abs(int(time * fps + 0.5) - (time * fps))
-                          for time in key_times)
+        lowest_diff = np.abs(np.floor(key_times * fps + 0.5) - key_times * fps).sum()
         # for fps in range(1,120): #disabled, used for testing
         for test_fps in [20, 25, 35]:
-            diff = sum(abs(int(time * test_fps + 0.5)-(time * test_fps))
-                       for time in key_times)
+            diff = np.abs(np.floor(key_times * test_fps + 0.5) - key_times * test_fps).sum()
             if diff < lowest_diff:
                 lowest_diff = diff
                 fps = test_fps
@@ -258,20 +294,23 @@ class AnimationHelper():
         NifLog.info("Animation")
         NifLog.info("Importing animation data for {0}".format(b_obj.name))
         assert(isinstance(kfd, NifFormat.NiKeyframeData))
-        # create an Ipo for this object
-        b_ipo = ObjectAnimation.get_object_ipo(b_obj)
+        # create an action for this object
+        b_obj.animation_data_create()
+        if not b_obj.animation_data.action:
+            b_obj.animation_data.action = bpy.data.actions.new(b_obj.name)
+        action = b_obj.animation_data.action
+        fps = self.nif_import.fps
+        cyclic = self.nif_import.get_cyclic_from_flags(kfc.flags)
         # get the animation keys
         translations = kfd.translations
         scales = kfd.scales
         # add the keys
-        NifLog.debug('Scale keys...')
-        for key in scales.keys:
-            frame = 1+int(key.time * self.fps + 0.5) # time 0.0 is frame 1
-            Blender.Set('curframe', frame)
-            b_obj.SizeX = key.value
-            b_obj.SizeY = key.value
-            b_obj.SizeZ = key.value
-            b_obj.insertIpoKey(Blender.Object.SIZE)
+        if scales.keys:
+            NifLog.debug('Scale keys...')
+            frames = keyframe_writer.get_frames([key.time for key in scales.keys], fps)
+            self.add_fcurves(
+                action, "scale", frames, [(key.value,) * 3 for key in scales.keys], "Scale",
+                self.nif_import.get_b_interpolation_from_n_ipol(scales.interpolation), cyclic)
 
         # detect the type of rotation keys
         rotation_type = kfd.rotation_type
@@ -280,41 +319,36 @@ class AnimationHelper():
             xkeys = kfd.xyz_rotations[0].keys
             ykeys = kfd.xyz_rotations[1].keys
             zkeys = kfd.xyz_rotations[2].keys
-            NifLog.debug('Rotation keys...(euler)')
-            for (xkey, ykey, zkey) in zip(xkeys, ykeys, zkeys):
-                frame = 1+int(xkey.time * self.fps + 0.5) # time 0.0 is frame 1
+            if xkeys:
+                NifLog.debug('Rotation keys...(euler)')
                 # XXX we assume xkey.time == ykey.time == zkey.time
-                Blender.Set('curframe', frame)
                 # both in radians, no conversion needed
-                b_obj.RotX = xkey.value
-                b_obj.RotY = ykey.value
-                b_obj.RotZ = zkey.value
-                b_obj.insertIpoKey(Blender.Object.ROT)
+                xyzkeys = list(zip(xkeys, ykeys, zkeys))
+                frames = keyframe_writer.get_frames([xkey.time for (xkey, ykey, zkey) in xyzkeys], fps)
+                self.add_fcurves(
+                    action, "rotation_euler", frames,
+                    [(xkey.value, ykey.value, zkey.value) for (xkey, ykey, zkey) in xyzkeys],
+                    "Rotation", self.nif_import.get_b_interpolation_from_n_ipol(kfd.xyz_rotations[0].interpolation),
+                    cyclic)
         else:
             # uses quaternions
             if kfd.quaternion_keys:
                 NifLog.debug('Rotation keys...(quaternions)')
-            for key in kfd.quaternion_keys:
-                frame = 1+int(key.time * self.fps + 0.5) # time 0.0 is frame 1
-                Blender.Set('curframe', frame)
-                rot = mathutils.Quaternion(key.value.w, key.value.x, key.value.y, key.value.z).toEuler()
-                # Blender euler is in degrees, object RotXYZ is in radians
-                b_obj.RotX = rot.x * self.D2R
-                b_obj.RotY = rot.y * self.D2R
-                b_obj.RotZ = rot.z * self.D2R
-                b_obj.insertIpoKey(Blender.Object.ROT)
+                frames = keyframe_writer.get_frames([key.time for key in kfd.quaternion_keys], fps)
+                # euler is in radians
+                self.add_fcurves(
+                    action, "rotation_euler", frames,
+                    [tuple(mathutils.Quaternion([key.value.w, key.value.x, key.value.y, key.value.z]).to_euler())
+                     for key in kfd.quaternion_keys],
+                    "Rotation", self.nif_import.get_b_interpolation_from_n_ipol(rotation_type), cyclic)
 
         if translations.keys:
             NifLog.debug('Translation keys...')
-        for key in translations.keys:
-            frame = 1+int(key.time * self.nif_import.fps + 0.5) # time 0.0 is frame 1
-            Blender.Set('curframe', frame)
-            b_obj.LocX = key.value.x
-            b_obj.LocY = key.value.y
-            b_obj.LocZ = key.value.z
-            b_obj.insertIpoKey(Blender.Object.LOC)
-
-        Blender.Set('curframe', 1)
+            frames = keyframe_writer.get_frames([key.time for key in translations.keys], fps)
+            self.add_fcurves(
+                action, "location", frames,
+                [(key.value.x, key.value.y, key.value.z) for key in translations.keys], "Location",
+                self.nif_import.get_b_interpolation_from_n_ipol(translations.interpolation), cyclic)
 
 
 class ObjectAnimation():
@@ -457,68 +491,40 @@ class ArmatureAnimation():
         
         
     def import_armature_animation(self, b_armature):
+        """Import the bone animation of an armature: one action per decoded
+        keyframe sequence, or a single action from the controllers in the
+        nif tree if there are none."""
+        NifLog.info('Importing Animations')
+        b_armature.animation_data_create()
+        if self.nif_import.kf_sequences:
+            for sequence_name, cyclic, bone_keys in self.nif_import.kf_sequences:
+                NifLog.info("Importing sequence {0}".format(sequence_name))
+                action = bpy.data.actions.new(sequence_name)
+                # keep the actions that are not assigned to the armature
+                action.use_fake_user = True
+                for bone_name, b_posebone in b_armature.pose.bones.items():
+                    niBone = self.nif_import.dict_blocks[bone_name]
+                    if niBone.name in bone_keys:
+                        self.import_bone_keys(action, bone_name, niBone, bone_keys[niBone.name], cyclic)
+                if not b_armature.animation_data.action:
+                    b_armature.animation_data.action = action
+            return
+
         # create an action
         action = bpy.data.actions.new(b_armature.name)
-        bpy.types.NlaTrack.select = b_armature #action.setActive(b_armature)
+        b_armature.animation_data.action = action
+        # control points of each B-spline data block, decoded once
+        spline_points = {}
         # go through all armature pose bones
-        # see http://www.elysiun.com/forum/viewtopic.php?t=58693
-        NifLog.info('Importing Animations')
         for bone_name, b_posebone in b_armature.pose.bones.items():
             # denote progress
-            NifLog.debug('Importing animation for bone %s'.format(bone_name))
+            NifLog.debug('Importing animation for bone {0}'.format(bone_name))
             niBone = self.nif_import.dict_blocks[bone_name]
 
-            # get bind matrix (NIF format stores full transformations in keyframes,
-            # but Blender wants relative transformations, hence we need to know
-            # the bind position for conversion). Since
-            # [ SRchannel 0 ]    [ SRbind 0 ]   [ SRchannel * SRbind         0 ]   [ SRtotal 0 ]
-            # [ Tchannel  1 ] *  [ Tbind  1 ] = [ Tchannel  * SRbind + Tbind 1 ] = [ Ttotal  1 ]
-            # with
-            # 'total' the transformations as stored in the NIF keyframes,
-            # 'bind' the Blender bind pose, and
-            # 'channel' the Blender IPO channel,
-            # it follows that
-            # Schannel = Stotal / Sbind
-            # Rchannel = Rtotal * inverse(Rbind)
-            # Tchannel = (Ttotal - Tbind) * inverse(Rbind) / Sbind
-            bone_bm = nif_utils.import_matrix(niBone) # base pose
-            niBone_bind_scale, niBone_bind_rot, niBone_bind_trans = self.decompose_srt(bone_bm)
-            niBone_bind_rot_inv = mathutils.Matrix(niBone_bind_rot)
-            niBone_bind_rot_inv.invert()
-            niBone_bind_quat_inv = niBone_bind_rot_inv.to_quaternion()
-            # we also need the conversion of the original matrix to the
-            # new bone matrix, say X,
-            # B' = X * B
-            # (with B' the Blender matrix and B the NIF matrix) because we
-            # need that
-            # C' * B' = X * C * B
-            # and therefore
-            # C' = X * C * B * inverse(B') = X * C * inverse(X),
-            # where X = B' * inverse(B)
-            #
-            # In detail:
-            # [ SRX 0 ]   [ SRC 0 ]            [ SRX 0 ]
-            # [ TX  1 ] * [ TC  1 ] * inverse( [ TX  1 ] ) =
-            # [ SRX * SRC       0 ]   [ inverse(SRX)         0 ]
-            # [ TX * SRC + TC   1 ] * [ -TX * inverse(SRX)   1 ] =
-            # [ SRX * SRC * inverse(SRX)              0 ]
-            # [ (TX * SRC + TC - TX) * inverse(SRX)   1 ]
-            # Hence
-            # SC' = SX * SC / SX = SC
-            # RC' = RX * RC * inverse(RX)
-            # TC' = (TX * SC * RC + TC - TX) * inverse(RX) / SX
-            extra_matrix_scale, extra_matrix_rot, extra_matrix_trans = self.decompose_srt(self.nif_import.dict_bones_extra_matrix[niBone])
-            extra_matrix_quat = extra_matrix_rot.to_quaternion()
-            extra_matrix_rot_inv = mathutils.Matrix(extra_matrix_rot)
-            extra_matrix_rot_inv.invert()
-            extra_matrix_quat_inv = extra_matrix_rot_inv.to_quaternion()
-            # now import everything
-            # ##############################
-
             # get controller, interpolator, and data
             # note: the NiKeyframeController check also includes
             #       NiTransformController (see hierarchy!)
-            kfc = nif_utils.find_controller(niBone,
+            kfc = self.nif_import.block_index.find_controller(niBone,
                                        NifFormat.NiKeyframeController)
             # old style: data directly on controller
             kfd = kfc.data if kfc else None
@@ -532,238 +538,249 @@ class ArmatureAnimation():
                 # for now, in this case, ignore interpolator
                 kfi = None
 
-            # B-spline curve import
-            if isinstance(kfi, NifFormat.NiBSplineInterpolator):
-                times = list(kfi.get_times())
-                translations = list(kfi.get_translations())
-                scales = list(kfi.get_scales())
-                rotations = list(kfi.get_rotations())
-
-                # if we have translation keys, we make a dictionary of
-                # rot_keys and scale_keys, this makes the script work MUCH
-                # faster in most cases
-                if translations:
-                    scale_keys_dict = {}
-                    rot_keys_dict = {}
-
-                # scales: ignore for now, implement later
-                #         should come here
-                scales = None
-
-                # rotations
-                if rotations:
-                    NifLog.debug('Rotation keys...(bspline quaternions)')
-                    for time, quat in zip(times, rotations):
-                        frame = 1 + int(time * self.nif_import.fps + 0.5)
-                        quat = mathutils.Quaternion(
-                            [quat[0], quat[1], quat[2], quat[3]])
-                        # beware, CrossQuats takes arguments in a
-                        # counter-intuitive order:
-                        # q1.to_matrix() * q2.to_matrix() == CrossQuats(q2, q1).to_matrix()
-                        quatVal = CrossQuats(niBone_bind_quat_inv, quat) # Rchannel = Rtotal * inverse(Rbind)
-                        rot = CrossQuats(CrossQuats(extra_matrix_quat_inv, quatVal), extra_matrix_quat) # C' = X * C * inverse(X)
-                        b_posebone.quat = rot
-                        b_posebone.insertKey(b_armature, frame,
-                                             [Blender.Object.Pose.ROT])
-                        # fill optimizer dictionary
-                        if translations:
-                            rot_keys_dict[frame] = mathutils.Quaternion(rot)
-
-                # translations
-                if translations:
-                    NifLog.debug('Translation keys...(bspline)')
-                    for time, translation in zip(times, translations):
-                        # time 0.0 is frame 1
-                        frame = 1 + int(time * self.nif_import.fps + 0.5)
-                        trans = mathutils.Vector(*translation)
-                        locVal = (trans - niBone_bind_trans) * niBone_bind_rot_inv * (niBone_bind_scale)# Tchannel = (Ttotal - Tbind) * inverse(Rbind) / Sbind
-                        # the rotation matrix is needed at this frame (that's
-                        # why the other keys are inserted first)
-                        if rot_keys_dict:
-                            try:
-                                rot = rot_keys_dict[frame].to_matrix()
-                            except KeyError:
-                                # fall back on slow method
-                                ipo = action.getChannelIpo(bone_name)
-                                quat = mathutils.Quaternion()
-                                quat.x = ipo.getCurve('QuatX').evaluate(frame)
-                                quat.y = ipo.getCurve('QuatY').evaluate(frame)
-                                quat.z = ipo.getCurve('QuatZ').evaluate(frame)
-                                quat.w = ipo.getCurve('QuatW').evaluate(frame)
-                                rot = quat.to_matrix()
-                        else:
-                            rot = mathutils.Matrix([[1.0, 0.0, 0.0],
-                                                    [0.0, 1.0, 0.0],
-                                                    [0.0, 0.0, 1.0]])
-                        # we also need the scale at this frame
-                        if scale_keys_dict:
-                            try:
-                                sizeVal = scale_keys_dict[frame]
-                            except KeyError:
-                                ipo = action.getChannelIpo(bone_name)
-                                if ipo.getCurve('SizeX'):
-                                    sizeVal = ipo.getCurve('SizeX').evaluate(frame) # assume uniform scale
-                                else:
-                                    sizeVal = 1.0
-                        else:
-                            sizeVal = 1.0
-                        size = mathutils.Matrix([[sizeVal, 0.0, 0.0],
-                                                 [0.0, sizeVal, 0.0],
-                                                 [0.0, 0.0, sizeVal]])
-                        # now we can do the final calculation
-                        loc = (extra_matrix_trans * size * rot + locVal - extra_matrix_trans) * extra_matrix_rot_inv * (extra_matrix_scale) # C' = X * C * inverse(X)
-                        b_posebone.loc = loc
-                        b_posebone.insertKey(b_armature, frame, [Blender.Object.Pose.LOC])
-
-                # delete temporary dictionaries
-                if translations:
-                    del scale_keys_dict
-                    del rot_keys_dict
-
-            # NiKeyframeData and NiTransformData import
-            elif isinstance(kfd, NifFormat.NiKeyframeData):
-
-                translations = kfd.translations
-                scales = kfd.scales
-                # if we have translation keys, we make a dictionary of
-                # rot_keys and scale_keys, this makes the script work MUCH
-                # faster in most cases
-                if translations:
-                    scale_keys_dict = {}
-                    rot_keys_dict = {}
-                # add the keys
-
-                # Scaling
-                if scales.keys:
-                    NifLog.debug('Scale keys...')
-                for scaleKey in scales.keys:
-                    # time 0.0 is frame 1
-                    frame = 1 + int(scaleKey.time * self.nif_import.fps + 0.5)
-                    sizeVal = scaleKey.value
-                    size = sizeVal / niBone_bind_scale # Schannel = Stotal / Sbind
-                    b_posebone.size = mathutils.Vector(size, size, size)
-                    b_posebone.insertKey(b_armature, frame, [Blender.Object.Pose.SIZE]) # this is very slow... :(
-                    # fill optimizer dictionary
-                    if translations:
-                        scale_keys_dict[frame] = size
-
-                # detect the type of rotation keys
-                rotation_type = kfd.rotation_type
-
-                # Euler Rotations
-                if rotation_type == 4:
-                    # uses xyz rotation
-                    if kfd.xyz_rotations[0].keys:
-                        NifLog.debug('Rotation keys...(euler)')
-                    for xkey, ykey, zkey in zip(kfd.xyz_rotations[0].keys,
-                                                 kfd.xyz_rotations[1].keys,
-                                                 kfd.xyz_rotations[2].keys):
-                        # time 0.0 is frame 1
-                        # XXX it is assumed that all the keys have the
-                        # XXX same times!!!
-                        if (abs(xkey.time - ykey.time) > self.properties.epsilon
-                            or abs(xkey.time - zkey.time) > self.properties.epsilon):
-                            NifLog.warn("XYZ key times do not correspond, animation may not be correctly imported")
-                        frame = 1 + int(xkey.time * self.nif_import.fps + 0.5)
-                        euler = mathutils.Euler(
-                            [xkey.value * 180.0 / math.pi,
-                             ykey.value * 180.0 / math.pi,
-                             zkey.value * 180.0 / math.pi])
-                        quat = euler.toQuat()
-
-                        # beware, CrossQuats takes arguments in a counter-intuitive order:
-                        # q1.to_matrix() * q2.to_matrix() == CrossQuats(q2, q1).to_matrix()
-
-                        quatVal = CrossQuats(niBone_bind_quat_inv, quat) # Rchannel = Rtotal * inverse(Rbind)
-                        rot = CrossQuats(CrossQuats(extra_matrix_quat_inv, quatVal), extra_matrix_quat) # C' = X * C * inverse(X)
-                        b_posebone.quat = rot
-                        b_posebone.insertKey(b_armature, frame, [Blender.Object.Pose.ROT]) # this is very slow... :(
-                        # fill optimizer dictionary
-                        if translations:
-                            rot_keys_dict[frame] = mathutils.Quaternion(rot) 
-
-                # Quaternion Rotations
-                else:
-                    # TODO:take rotation type into account for interpolation
-                    if kfd.quaternion_keys:
-                        NifLog.debug('Rotation keys...(quaternions)')
-                    quaternion_keys = kfd.quaternion_keys
-                    for key in quaternion_keys:
-                        frame = 1 + int(key.time * self.nif_import.fps + 0.5)
-                        keyVal = key.value
-                        quat = mathutils.Quaternion([keyVal.w, keyVal.x, keyVal.y, keyVal.z])
-                        # beware, CrossQuats takes arguments in a
-                        # counter-intuitive order:
-                        # q1.to_matrix() * q2.to_matrix() == CrossQuats(q2, q1).to_matrix()
-                        quatVal = CrossQuats(niBone_bind_quat_inv, quat) # Rchannel = Rtotal * inverse(Rbind)
-                        rot = CrossQuats(CrossQuats(extra_matrix_quat_inv, quatVal), extra_matrix_quat) # C' = X * C * inverse(X)
-                        b_posebone.quat = rot
-                        b_posebone.insertKey(b_armature, frame,
-                                             [Blender.Object.Pose.ROT])
-                        # fill optimizer dictionary
-                        if translations:
-                            rot_keys_dict[frame] = mathutils.Quaternion(rot)
-                    #else:
-                    #    print("Rotation keys...(unknown)" + 
-                    #          "WARNING: rotation animation data of type" +
-                    #          " %i found, but this type is not yet supported; data has been skipped""" % rotation_type)                        
-    
-                # Translations
-                if translations.keys:
-                    NifLog.debug('Translation keys...')
-                for key in translations.keys:
-                    # time 0.0 is frame 1
-                    frame = 1 + int(key.time * self.nif_import.fps + 0.5)
-                    keyVal = key.value
-                    trans = mathutils.Vector(keyVal.x, keyVal.y, keyVal.z)
-                    locVal = (trans - niBone_bind_trans) * niBone_bind_rot_inv * (niBone_bind_scale)# Tchannel = (Ttotal - Tbind) * inverse(Rbind) / Sbind
-                    # the rotation matrix is needed at this frame (that's
-                    # why the other keys are inserted first)
-                    if rot_keys_dict:
-                        try:
-                            rot = rot_keys_dict[frame].to_matrix()
-                        except KeyError:
-                            # fall back on slow method
-                            ipo = action.getChannelIpo(bone_name)
-                            quat = mathutils.Quaternion()
-                            quat.x = ipo.getCurve('QuatX').evaluate(frame)
-                            quat.y = ipo.getCurve('QuatY').evaluate(frame)
-                            quat.z = ipo.getCurve('QuatZ').evaluate(frame)
-                            quat.w = ipo.getCurve('QuatW').evaluate(frame)
-                            rot = quat.to_matrix()
-                    else:
-                        rot = mathutils.Matrix([[1.0, 0.0, 0.0],
-                                                [0.0, 1.0, 0.0],
-                                                [0.0, 0.0, 1.0]])
-                    # we also need the scale at this frame
-                    if scale_keys_dict:
-                        try:
-                            sizeVal = scale_keys_dict[frame]
-                        except KeyError:
-                            ipo = action.getChannelIpo(bone_name)
-                            if ipo.getCurve('SizeX'):
-                                sizeVal = ipo.getCurve('SizeX').evaluate(frame) # assume uniform scale
-                            else:
-                                sizeVal = 1.0
-                    else:
-                        sizeVal = 1.0
-                    size = mathutils.Matrix([[sizeVal, 0.0, 0.0],
-                                             [0.0, sizeVal, 0.0],
-                                             [0.0, 0.0, sizeVal]])
-                    # now we can do the final calculation
-                    loc = (extra_matrix_trans * size * rot + locVal - extra_matrix_trans) * extra_matrix_rot_inv * (extra_matrix_scale) # C' = X * C * inverse(X)
-                    b_posebone.loc = loc
-                    b_posebone.insertKey(b_armature, frame, [Blender.Object.Pose.LOC])
-                if translations:
-                    del scale_keys_dict
-                    del rot_keys_dict
-            # set extend mode for all ipo curves
-            if kfc:
-                try:
-                    ipo = action.getChannelIpo(bone_name)
-                except ValueError:
-                    # no channel for bone_name
-                    pass
+            keys = self.decode_keys(kfd, kfi, spline_points, NifOp.props.epsilon)
+            cyclic = bool(kfc) and self.nif_import.get_cyclic_from_flags(kfc.flags)
+            self.import_bone_keys(action, bone_name, niBone, keys, cyclic)
+
+    def decode_sequence(self, kf_root, epsilon):
+        """Decode the bone keys of a controller sequence. Does not touch bpy,
+        so sequences can be decoded by the workers.
+
+        :return: The name of the sequence, whether it loops, and a dictionary
+            from node name to the (scale, rotation, translation) keys of
+            that node, as returned by :meth:`decode_keys`.
+        """
+        spline_points = {}
+        bone_keys = {}
+        for controlledblock in kf_root.controlled_blocks:
+            kfi = controlledblock.interpolator
+            if isinstance(kfi, NifFormat.NiTransformInterpolator):
+                if kfi.data:
+                    keys = self.decode_keys(kfi.data, None, spline_points, epsilon)
                 else:
-                    for b_curve in ipo:
-                        b_curve.extend = self.nif_import.get_extend_from_flags(kfc.flags)
+                    keys = self.decode_pose_keys(kfi)
+            elif isinstance(kfi, NifFormat.NiBSplineTransformInterpolator):
+                keys = self.decode_keys(None, kfi, spline_points, epsilon)
+            else:
+                continue
+            bone_keys[controlledblock.get_node_name()] = keys
+        cyclic = kf_root.cycle_type == NifFormat.CycleType.CYCLE_LOOP
+        return kf_root.name.decode(), cyclic, bone_keys
+
+    def decode_pose_keys(self, kfi):
+        """Single keys for a NiTransformInterpolator without data, from its
+        pose, as import_kf_root fills in for the merged tree."""
+        rot_keys = ([0.0], [(kfi.rotation.w, kfi.rotation.x, kfi.rotation.y, kfi.rotation.z)], 'LINEAR')
+        if kfi.translation.x < -1000000:
+            # invalid, happens in fallout 3, e.g. h2haim.kf
+            trans_keys = None
+        else:
+            trans_keys = ([0.0], [(kfi.translation.x, kfi.translation.y, kfi.translation.z)], 'LINEAR')
+        # ignore scale, usually contains invalid data in interpolator
+        return None, rot_keys, trans_keys
+
+    def decode_keys(self, kfd, kfi, spline_points, epsilon):
+        """Decode the keys of keyframe data or of a B-spline interpolator.
+
+        :param spline_points: Dictionary caching the decoded control points
+            of each NiBSplineData block.
+        :param epsilon: Tolerance on the times of euler rotation keys.
+        :return: The scale, rotation and translation keys, each as (times,
+            values, interpolation) or None. Rotations are quaternions.
+        """
+        fps = self.nif_import.fps
+        # the keys of each channel, as (times, values, interpolation)
+        scale_keys = None
+        rot_keys = None
+        trans_keys = None
+
+        # B-spline curve import
+        if isinstance(kfi, NifFormat.NiBSplineTransformInterpolator):
+            # evaluate the curves at each frame
+            times = bspline.get_sample_times(kfi.start_time, kfi.stop_time, fps)
+            translations, rotations, scales = self.get_bspline_tracks(kfi, times, spline_points)
+
+            if scales is not None:
+                NifLog.debug('Scale keys...(bspline)')
+                scale_keys = (times, scales[:, 0], 'LINEAR')
+            if rotations is not None:
+                NifLog.debug('Rotation keys...(bspline quaternions)')
+                rotations /= np.linalg.norm(rotations, axis=1)[:, None]
+                rot_keys = (times, rotations, 'LINEAR')
+            if translations is not None:
+                NifLog.debug('Translation keys...(bspline)')
+                trans_keys = (times, translations, 'LINEAR')
+
+        # NiKeyframeData and NiTransformData import
+        elif isinstance(kfd, NifFormat.NiKeyframeData):
+
+            # Scaling
+            if kfd.scales.keys:
+                NifLog.debug('Scale keys...')
+                scale_keys = ([key.time for key in kfd.scales.keys],
+                              [key.value for key in kfd.scales.keys],
+                              self.nif_import.get_b_interpolation_from_n_ipol(kfd.scales.interpolation))
+
+            # Euler Rotations
+            if kfd.rotation_type == 4:
+                # uses xyz rotation
+                xkeys, ykeys, zkeys = (kfd.xyz_rotations[i].keys for i in range(3))
+                if xkeys:
+                    NifLog.debug('Rotation keys...(euler)')
+                    # XXX it is assumed that all the keys have the
+                    # XXX same times!!!
+                    for xkey, ykey, zkey in zip(xkeys, ykeys, zkeys):
+                        if (abs(xkey.time - ykey.time) > epsilon
+                            or abs(xkey.time - zkey.time) > epsilon):
+                            NifLog.warn("XYZ key times do not correspond, animation may not be correctly imported")
+                            break
+                    # both in radians
+                    rot_keys = ([xkey.time for xkey, ykey, zkey in zip(xkeys, ykeys, zkeys)],
+                                keyframe_math.euler_to_quat([(xkey.value, ykey.value, zkey.value)
+                                                             for xkey, ykey, zkey in zip(xkeys, ykeys, zkeys)]),
+                                self.nif_import.get_b_interpolation_from_n_ipol(kfd.xyz_rotations[0].interpolation))
+
+            # Quaternion Rotations
+            elif kfd.quaternion_keys:
+                NifLog.debug('Rotation keys...(quaternions)')
+                rot_keys = ([key.time for key in kfd.quaternion_keys],
+                            [(key.value.w, key.value.x, key.value.y, key.value.z)
+                             for key in kfd.quaternion_keys],
+                            self.nif_import.get_b_interpolation_from_n_ipol(kfd.rotation_type))
+
+            # Translations
+            if kfd.translations.keys:
+                NifLog.debug('Translation keys...')
+                trans_keys = ([key.time for key in kfd.translations.keys],
+                              [(key.value.x, key.value.y, key.value.z)
+                               for key in kfd.translations.keys],
+                              self.nif_import.get_b_interpolation_from_n_ipol(kfd.translations.interpolation))
+        return scale_keys, rot_keys, trans_keys
+
+    def import_bone_keys(self, action, bone_name, niBone, keys, cyclic):
+        """Convert the keys of a bone to its bind pose and write them into
+        the fcurves of action."""
+        fps = self.nif_import.fps
+        scale_keys, rot_keys, trans_keys = keys
+
+        # get bind matrix (NIF format stores full transformations in keyframes,
+        # but Blender wants relative transformations, hence we need to know
+        # the bind position for conversion). Since
+        # [ SRchannel 0 ]    [ SRbind 0 ]   [ SRchannel * SRbind         0 ]   [ SRtotal 0 ]
+        # [ Tchannel  1 ] *  [ Tbind  1 ] = [ Tchannel  * SRbind + Tbind 1 ] = [ Ttotal  1 ]
+        # with
+        # 'total' the transformations as stored in the NIF keyframes,
+        # 'bind' the Blender bind pose, and
+        # 'channel' the Blender IPO channel,
+        # it follows that
+        # Schannel = Stotal / Sbind
+        # Rchannel = Rtotal * inverse(Rbind)
+        # Tchannel = (Ttotal - Tbind) * inverse(Rbind) / Sbind
+        bone_bm = nif_utils.import_matrix(niBone) # base pose
+        niBone_bind_scale, niBone_bind_rot, niBone_bind_trans = nif_utils.decompose_srt(bone_bm)
+        niBone_bind_rot_inv = mathutils.Matrix(niBone_bind_rot)
+        niBone_bind_rot_inv.invert()
+        niBone_bind_quat_inv = niBone_bind_rot_inv.to_quaternion()
+        # we also need the conversion of the original matrix to the
+        # new bone matrix, say X,
+        # B' = X * B
+        # (with B' the Blender matrix and B the NIF matrix) because we
+        # need that
+        # C' * B' = X * C * B
+        # and therefore
+        # C' = X * C * B * inverse(B') = X * C * inverse(X),
+        # where X = B' * inverse(B)
+        #
+        # In detail:
+        # [ SRX 0 ]   [ SRC 0 ]            [ SRX 0 ]
+        # [ TX  1 ] * [ TC  1 ] * inverse( [ TX  1 ] ) =
+        # [ SRX * SRC       0 ]   [ inverse(SRX)         0 ]
+        # [ TX * SRC + TC   1 ] * [ -TX * inverse(SRX)   1 ] =
+        # [ SRX * SRC * inverse(SRX)              0 ]
+        # [ (TX * SRC + TC - TX) * inverse(SRX)   1 ]
+        # Hence
+        # SC' = SX * SC / SX = SC
+        # RC' = RX * RC * inverse(RX)
+        # TC' = (TX * SC * RC + TC - TX) * inverse(RX) / SX
+        extra_matrix_scale, extra_matrix_rot, extra_matrix_trans = nif_utils.decompose_srt(self.nif_import.dict_bones_extra_matrix[niBone])
+        extra_matrix_quat = extra_matrix_rot.to_quaternion()
+        extra_matrix_rot_inv = mathutils.Matrix(extra_matrix_rot)
+        extra_matrix_rot_inv.invert()
+        extra_matrix_quat_inv = extra_matrix_rot_inv.to_quaternion()
+        # now import everything
+        # ##############################
+
+        # write each channel in one go
+        data_path = 'pose.bones["{0}"].'.format(bone_name)
+        # the rotation and scale at each translation frame are needed
+        # for the translation keys, so these are converted first
+        if scale_keys:
+            times, values, interpolation = scale_keys
+            scale_frames = keyframe_writer.get_frames(times, fps)
+            sizes = np.asarray(values, dtype=np.float64) / niBone_bind_scale # Schannel = Stotal / Sbind
+            self.nif_import.animationhelper.add_fcurves(
+                action, data_path + "scale", scale_frames, np.repeat(sizes[:, None], 3, axis=1),
+                bone_name, interpolation, cyclic)
+
+        if rot_keys:
+            times, values, interpolation = rot_keys
+            rot_frames = keyframe_writer.get_frames(times, fps)
+            rots = keyframe_math.bone_rotations(
+                values, niBone_bind_quat_inv, extra_matrix_quat, extra_matrix_quat_inv)
+            self.nif_import.animationhelper.add_fcurves(
+                action, data_path + "rotation_quaternion", rot_frames, rots,
+                bone_name, interpolation, cyclic)
+
+        if trans_keys:
+            times, values, interpolation = trans_keys
+            frames = keyframe_writer.get_frames(times, fps)
+            # the rotation and scale at the translation frames,
+            # exact at their own keys and interpolated in between
+            if rot_keys:
+                frame_rots = keyframe_math.interpolate_rotations(frames, rot_frames, rots)
+            else:
+                frame_rots = np.tile((1.0, 0.0, 0.0, 0.0), (len(frames), 1))
+            if scale_keys:
+                frame_sizes = keyframe_math.interpolate_keys(frames, scale_frames, sizes) # assume uniform scale
+            else:
+                frame_sizes = np.ones(len(frames))
+            locs = keyframe_math.bone_translations(
+                values, frame_rots, frame_sizes,
+                niBone_bind_trans, niBone_bind_rot_inv, niBone_bind_scale,
+                extra_matrix_trans, extra_matrix_rot_inv, extra_matrix_scale)
+            self.nif_import.animationhelper.add_fcurves(
+                action, data_path + "location", frames, locs, bone_name, interpolation, cyclic)
+
+
+    def get_bspline_tracks(self, kfi, times, spline_points):
+        """Evaluate the translation, rotation and scale tracks of a B-spline
+        interpolator at the given times.
+
+        :param spline_points: Dictionary caching the float and short control
+            points of each NiBSplineData block as arrays.
+        :return: Translations, rotations and scales, each None if the track
+            is not present.
+        """
+        if not kfi.basis_data or not kfi.spline_data:
+            # eg bowidle.kf in Oblivion
+            return None, None, None
+        if kfi.spline_data not in spline_points:
+            spline_points[kfi.spline_data] = (
+                np.fromiter(kfi.spline_data.float_control_points, dtype=np.float64),
+                np.fromiter(kfi.spline_data.short_control_points, dtype=np.float64))
+        float_points, short_points = spline_points[kfi.spline_data]
+        num_control_points = kfi.basis_data.num_control_points
+        tracks = []
+        for track, size in (("translation", 3), ("rotation", 4), ("scale", 1)):
+            offset = getattr(kfi, track + "_offset")
+            if isinstance(kfi, NifFormat.NiBSplineCompTransformInterpolator):
+                control_points = bspline.get_comp_control_points(
+                    short_points, offset, num_control_points, size,
+                    getattr(kfi, track + "_bias"), getattr(kfi, track + "_multiplier"))
+            else:
+                control_points = bspline.get_control_points(float_points, offset, num_control_points, size)
+            if control_points is None:
+                tracks.append(None)
+            else:
+                tracks.append(bspline.evaluate(control_points, kfi.start_time, kfi.stop_time, times))
+        return tracks
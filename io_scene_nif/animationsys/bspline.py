@@ -0,0 +1,127 @@
+"""Decoding and evaluation of the B-spline tracks of NiBSplineInterpolator
+blocks, on arrays of control points."""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+
+# Gamebryo tracks are open uniform cubic B-splines, whose number of control
+# points is the number of frames of animation plus the degree minus one.
+DEGREE = 3
+
+# Offset of a track that is not present.
+NO_TRACK = 65535
+
+
+def get_control_points(spline_points, offset, num_control_points, size):
+    """The float control points of a track.
+
+    :param spline_points: Float control points of the spline data, as array.
+    :param offset: Offset of the track in the spline data.
+    :param size: Number of values per control point.
+    :return: Control points, shape (num_control_points, size), or None if
+        there is no track.
+    """
+    if offset == NO_TRACK:
+        return None
+    points = np.asarray(spline_points[offset:offset + num_control_points * size], dtype=np.float64)
+    return points.reshape(num_control_points, size)
+
+
+def get_comp_control_points(spline_points, offset, num_control_points, size, bias, multiplier):
+    """The control points of a compressed track, stored as shorts x that
+    decode to bias + x * multiplier / 32767.
+
+    :param spline_points: Short control points of the spline data, as array.
+    :return: Control points, shape (num_control_points, size), or None if
+        there is no track.
+    """
+    points = get_control_points(spline_points, offset, num_control_points, size)
+    if points is None:
+        return None
+    return bias + points * (multiplier / 32767.0)
+
+
+def get_knots(num_control_points, degree=DEGREE):
+    """The open uniform knot vector, of which the inner knots are the
+    integers 0 to num_control_points - degree."""
+    num_spans = num_control_points - degree
+    return np.concatenate((np.zeros(degree), np.arange(num_spans + 1), np.full(degree, num_spans)))
+
+
+def get_sample_times(start_time, stop_time, fps):
+    """The time of each frame in the animation, time 0.0 being frame 1,
+    including both ends."""
+    first = np.ceil(start_time * fps)
+    last = max(np.floor(stop_time * fps), first)
+    times = np.arange(first, last + 1) / fps
+    return np.clip(times, start_time, stop_time)
+
+
+def evaluate(control_points, start_time, stop_time, times):
+    """Evaluate a track at the given times, by de Boor's algorithm on all
+    times at once.
+
+    :param control_points: Control points, shape (n, size).
+    :param times: Times to evaluate, clamped to the animation, shape (m,).
+    :return: Values at the times, shape (m, size).
+    """
+    control_points = np.asarray(control_points, dtype=np.float64)
+    num_control_points = len(control_points)
+    # short tracks fall back to a lower degree
+    degree = min(DEGREE, num_control_points - 1)
+    times = np.asarray(times, dtype=np.float64)
+    if degree <= 0:
+        return np.repeat(control_points[:1], len(times), axis=0)
+    knots = get_knots(num_control_points, degree)
+    num_spans = num_control_points - degree
+    if stop_time > start_time:
+        params = np.clip((times - start_time) / (stop_time - start_time), 0, 1) * num_spans
+    else:
+        params = np.zeros(len(times))
+    # index of the knot span, with the last knot in the last span
+    spans = np.minimum(np.floor(params).astype(np.intp), num_spans - 1) + degree
+    # the degree + 1 control points that influence each time
+    points = control_points[spans[:, None] + np.arange(-degree, 1)]
+    for level in range(1, degree + 1):
+        for j in range(degree, level - 1, -1):
+            left = knots[spans + j - degree]
+            right = knots[spans + j + 1 - level]
+            alpha = ((params - left) / (right - left))[:, None]
+            points[:, j] = (1 - alpha) * points[:, j - 1] + alpha * points[:, j]
+    return points[:, degree]
@@ -0,0 +1,157 @@
+"""Removal of redundant animation keys, on arrays of keys."""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+
+# Keys closer than this to the line through their neighbours are treated
+# as exactly on it by the lossless mode, to absorb float rounding.
+LOSSLESS_EPSILON = 1e-6
+
+
+def get_errors(frames, values, start, end, angular=False):
+    """The error of linearly interpolating the keys between start and end
+    from these two keys alone.
+
+    :param frames: Frame of each key, shape (n,).
+    :param values: Value of each key, shape (n, k).
+    :param angular: Whether the values are quaternions, in which case the
+        error is the angle in radians between the normalized interpolated
+        and the actual rotation, otherwise it is the distance between them.
+    :return: Errors of the keys start + 1 to end - 1.
+    """
+    factors = (frames[start + 1:end] - frames[start]) / (frames[end] - frames[start])
+    interpolated = values[start] + factors[:, None] * (values[end] - values[start])
+    actual = values[start + 1:end]
+    if angular:
+        cos_half = np.abs(np.einsum('ij,ij->i', interpolated, actual))
+        cos_half /= np.linalg.norm(interpolated, axis=1) * np.linalg.norm(actual, axis=1)
+        return 2 * np.arccos(np.clip(cos_half, 0, 1))
+    return np.linalg.norm(interpolated - actual, axis=1)
+
+
+def get_lossless_mask(frames, values):
+    """Which keys to keep so that linear interpolation of the kept keys
+    gives back every key: the first and last key, and each key that is not
+    on the line through its neighbours. A run of keys on one line, such as
+    a constant run, keeps only its ends.
+
+    :return: Boolean mask, shape (n,).
+    """
+    keep = np.ones(len(frames), dtype=bool)
+    if len(frames) > 2:
+        factors = (frames[1:-1] - frames[:-2]) / (frames[2:] - frames[:-2])
+        interpolated = values[:-2] + factors[:, None] * (values[2:] - values[:-2])
+        keep[1:-1] = np.abs(interpolated - values[1:-1]).max(axis=1) > LOSSLESS_EPSILON
+    return keep
+
+
+def get_constant_mask(values, tolerance, angular=False):
+    """Which keys to keep so that stepped interpolation of the kept keys is
+    within tolerance of every key: the first and last key, and each key
+    that differs from the last kept key.
+
+    :return: Boolean mask, shape (n,).
+    """
+    tolerance = max(tolerance, LOSSLESS_EPSILON)
+    keep = np.ones(len(values), dtype=bool)
+    last = values[0]
+    for index in range(1, len(values) - 1):
+        value = values[index]
+        if angular:
+            cos_half = abs(value.dot(last)) / (np.linalg.norm(value) * np.linalg.norm(last))
+            error = 2 * np.arccos(min(cos_half, 1.0))
+        else:
+            error = np.abs(value - last).max()
+        if error > tolerance:
+            last = value
+        else:
+            keep[index] = False
+    return keep
+
+
+def get_lossy_mask(frames, values, tolerance, angular=False):
+    """Which keys to keep so that linear interpolation of the kept keys is
+    within tolerance of every key, by the Ramer-Douglas-Peucker algorithm.
+
+    :return: Boolean mask, shape (n,).
+    """
+    keep = np.zeros(len(frames), dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, len(frames) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        errors = get_errors(frames, values, start, end, angular)
+        worst = np.argmax(errors)
+        if errors[worst] > tolerance:
+            split = start + 1 + worst
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+    return keep
+
+
+def reduce_keys(frames, values, tolerance=0.0, angular=False, interpolation='LINEAR'):
+    """Remove the keys that interpolation of the remaining keys reproduces
+    within tolerance; a tolerance of zero only removes keys that are exactly
+    on the line through their neighbours, or for stepped keys, equal to the
+    key before them. Keys with bezier interpolation are kept as they are,
+    as their automatic handles depend on the neighbouring keys.
+
+    :param frames: Sorted frames without duplicates, shape (n,).
+    :param values: Value of each key, shape (n,) or (n, k).
+    :param tolerance: Largest distance, or angle in radians for rotations,
+        between a removed key and the interpolation of the remaining keys.
+    :param angular: Whether the values are (w, x, y, z) quaternions.
+    :param interpolation: Blender interpolation mode of the keys.
+    :return: Frames and values of the remaining keys.
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(frames) < 3 or interpolation == 'BEZIER':
+        return frames, values
+    columns = values.reshape(len(frames), -1)
+    if interpolation == 'CONSTANT':
+        keep = get_constant_mask(columns, tolerance, angular)
+    elif tolerance > 0:
+        keep = get_lossy_mask(frames, columns, tolerance, angular)
+    else:
+        keep = get_lossless_mask(frames, columns)
+    return frames[keep], values[keep]
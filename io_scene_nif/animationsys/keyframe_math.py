@@ -0,0 +1,144 @@
+"""Bind pose conversion of whole keyframe channels, on arrays of keys."""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+
+from io_scene_nif.animationsys import keyframe_writer
+
+# Quaternions are stored as (w, x, y, z) rows, as in blender, and
+# matrices act on row vectors, as vector * matrix in blender 2.7x.
+
+
+def quat_multiply(q1, q2):
+    """The product q1 * q2 of quaternion arrays, broadcasting over rows."""
+    w1, x1, y1, z1 = np.moveaxis(np.asarray(q1, dtype=np.float64), -1, 0)
+    w2, x2, y2, z2 = np.moveaxis(np.asarray(q2, dtype=np.float64), -1, 0)
+    return np.stack((w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                     w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                     w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2), axis=-1)
+
+
+def quat_to_matrix(quats):
+    """The rotation matrix of each unit quaternion, as Quaternion.to_matrix.
+
+    :param quats: Quaternions, shape (n, 4).
+    :return: Matrices, shape (n, 3, 3).
+    """
+    w, x, y, z = np.asarray(quats, dtype=np.float64).T
+    return np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y),
+                     2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x),
+                     2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)),
+                    axis=-1).reshape(-1, 3, 3)
+
+
+def euler_to_quat(eulers):
+    """The quaternion of each XYZ euler rotation in radians, as
+    Euler.to_quaternion.
+
+    :param eulers: Angles, shape (n, 3).
+    :return: Quaternions, shape (n, 4).
+    """
+    half = 0.5 * np.asarray(eulers, dtype=np.float64).reshape(-1, 3)
+    zeros = np.zeros(len(half))
+    cos, sin = np.cos(half), np.sin(half)
+    quat_x = np.column_stack((cos[:, 0], sin[:, 0], zeros, zeros))
+    quat_y = np.column_stack((cos[:, 1], zeros, sin[:, 1], zeros))
+    quat_z = np.column_stack((cos[:, 2], zeros, zeros, sin[:, 2]))
+    return quat_multiply(quat_z, quat_multiply(quat_y, quat_x))
+
+
+def bone_rotations(quats, bind_quat_inv, extra_quat, extra_quat_inv):
+    """Convert nif rotation keys into pose bone rotations.
+
+    Rchannel = Rtotal * inverse(Rbind), followed by C' = X * C * inverse(X),
+    which the per key importer wrote as
+    CrossQuats(CrossQuats(extra_quat_inv, CrossQuats(bind_quat_inv, quat)), extra_quat);
+    CrossQuats(q1, q2) is the product q1 * q2, so each key becomes
+    extra_quat_inv * bind_quat_inv * quat * extra_quat.
+
+    :param quats: Rotation keys, shape (n, 4).
+    :return: Pose bone rotations, shape (n, 4).
+    """
+    quats = np.asarray(quats, dtype=np.float64).reshape(-1, 4)
+    return quat_multiply(quat_multiply(extra_quat_inv, quat_multiply(bind_quat_inv, quats)), extra_quat)
+
+
+def bone_translations(translations, rots, sizes, bind_trans, bind_rot_inv, bind_scale,
+                      extra_trans, extra_rot_inv, extra_scale):
+    """Convert nif translation keys into pose bone locations.
+
+    Tchannel = (Ttotal - Tbind) * inverse(Rbind) / Sbind, followed by
+    TC' = (TX * SC * RC + TC - TX) * inverse(RX) / SX, on row vectors, as
+    the per key importer wrote
+    (extra_trans * size * rot + locVal - extra_trans) * extra_rot_inv * extra_scale.
+
+    :param translations: Translation keys, shape (n, 3).
+    :param rots: Pose bone rotation at each key, shape (n, 4).
+    :param sizes: Pose bone scale at each key, shape (n,).
+    :return: Pose bone locations, shape (n, 3).
+    """
+    translations = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+    extra_trans = np.asarray(extra_trans, dtype=np.float64)
+    loc_vals = (translations - bind_trans).dot(bind_rot_inv) * bind_scale
+    # extra_trans * size * rot, per key
+    extra_vals = np.einsum('j,ijk->ik', extra_trans, quat_to_matrix(rots)) * np.asarray(sizes)[:, None]
+    return (extra_vals + loc_vals - extra_trans).dot(extra_rot_inv) * extra_scale
+
+
+def interpolate_keys(frames, key_frames, key_values):
+    """Evaluate channels of keys at the given frames, exactly at the key
+    frames and linearly in between, held constant outside the keys.
+
+    :param frames: Frames to evaluate, shape (m,).
+    :param key_frames: Frame of each key, shape (n,).
+    :param key_values: Value of each key, shape (n,) or (n, k).
+    :return: Values at the frames, shape (m,) or (m, k).
+    """
+    key_frames, key_values = keyframe_writer.last_key_per_frame(key_frames, key_values)
+    if key_values.ndim == 1:
+        return np.interp(frames, key_frames, key_values)
+    return np.column_stack([np.interp(frames, key_frames, column) for column in key_values.T])
+
+
+def interpolate_rotations(frames, key_frames, key_quats):
+    """As interpolate_keys, for rotations, normalizing the quaternions as
+    blender does when it evaluates the pose."""
+    quats = interpolate_keys(frames, key_frames, key_quats)
+    return quats / np.linalg.norm(quats, axis=1)[:, None]
@@ -0,0 +1,100 @@
+"""Bulk creation of blender fcurves from arrays of keys, through foreach_set."""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+
+
+def get_frames(times, fps):
+    """Return the blender frame of each key time, time 0.0 being frame 1."""
+    return 1 + np.floor(np.asarray(times, dtype=np.float64) * fps + 0.5)
+
+
+def last_key_per_frame(frames, values):
+    """Keep one key per frame, the last one, as when inserting the keys one
+    at a time, and sort the keys by frame.
+
+    :param frames: Frame of each key, shape (n,).
+    :param values: Value of each key, shape (n,) or (n, k).
+    :return: Frames and values of the remaining keys.
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    unique_frames, last = np.unique(frames[::-1], return_index=True)
+    return unique_frames, values[len(frames) - 1 - last]
+
+
+def add_fcurve(action, data_path, frames, values, index=0, group="",
+               interpolation='LINEAR', cyclic=False):
+    """Create an fcurve holding all keys at once.
+
+    :param frames: Frame of each key, shape (n,).
+    :param values: Value of each key, shape (n,).
+    :param interpolation: Blender interpolation mode of the keys.
+    :param cyclic: Whether the curve repeats, otherwise it is held constant
+        before the first and after the last key.
+    :return: The new fcurve.
+    """
+    frames, values = last_key_per_frame(frames, values)
+    b_fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+    b_fcurve.keyframe_points.add(len(frames))
+    b_fcurve.keyframe_points.foreach_set(
+        "co", np.column_stack((frames, values)).astype(np.float32).ravel())
+    # enum properties cannot be set through foreach_set
+    for b_key in b_fcurve.keyframe_points:
+        b_key.interpolation = interpolation
+    if cyclic:
+        b_fcurve.modifiers.new('CYCLES')
+    else:
+        b_fcurve.extrapolation = 'CONSTANT'
+    b_fcurve.update()
+    return b_fcurve
+
+
+def add_fcurves(action, data_path, frames, values, group="",
+                interpolation='LINEAR', cyclic=False):
+    """Create one fcurve per column of values, for vector properties such as
+    location or rotation_quaternion.
+
+    :param values: Values of the keys, shape (n, k).
+    :return: The k new fcurves.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(len(frames), -1)
+    return [add_fcurve(action, data_path, frames, values[:, index], index, group,
+                       interpolation, cyclic)
+            for index in range(values.shape[1])]
@@ -38,6 +38,7 @@
 # ***** END LICENSE BLOCK *****
 
 import os
+from collections import OrderedDict
 
 import bpy
 import mathutils
@@ -309,7 +310,12 @@ class Armature():
 
 
 	def mark_armatures_bones(self, niBlock):
-		"""Mark armatures and bones by peeking into NiSkinInstance blocks."""
+		"""Mark armatures and bones by peeking into NiSkinInstance blocks.
+
+		:param niBlock: The root block; its tree is looked up in the block
+			index of the import.
+		"""
+		block_index = self.nif_import.block_index
 		# case where we import skeleton only,
 		# or importing an Oblivion or Fallout 3 skeleton:
 		# do all NiNode's as bones
@@ -323,50 +329,46 @@ class Armature():
 					"cannot import skeleton: root is not a NiNode")
 			# for morrowind, take the Bip01 node to be the skeleton root
 			if self.nif_import.data.version == 0x04000002:
-				skelroot = niBlock.find(block_name='Bip01',
-										block_type=NifFormat.NiNode)
+				skelroot = block_index.find(block_name='Bip01',
+											block_type=NifFormat.NiNode, root=niBlock)
 				if not skelroot:
 					skelroot = niBlock
 			else:
 				skelroot = niBlock
-			if skelroot not in self.nif_import.dict_armatures:
-				self.nif_import.dict_armatures[skelroot] = []
+			self.add_armature(skelroot)
 			NifLog.info("Selecting node '%s' as skeleton root".format(skelroot.name))
 			# add bones
-			for bone in skelroot.tree():
+			for bone in block_index.get_blocks(NifFormat.NiNode, root=skelroot):
 				if bone is skelroot:
 					continue
-				if not isinstance(bone, NifFormat.NiNode):
-					continue
 				if self.nif_import.is_grouping_node(bone):
 					continue
-				if bone not in self.nif_import.dict_armatures[skelroot]:
-					self.nif_import.dict_armatures[skelroot].append(bone)
+				self.add_bone(skelroot, bone)
 			return # done!
 
 		# attaching to selected armature -> first identify armature and bones
 		elif NifOp.props.skeleton == "GEOMETRY_ONLY" and not self.nif_import.dict_armatures:
-			skelroot = niBlock.find(
-							block_name=self.nif_import.selected_objects[0].name)
+			skelroot = block_index.find(
+							block_name=self.nif_import.selected_objects[0].name, root=niBlock)
 			if not skelroot:
 				raise nif_utils.NifError("nif has no armature '%s'" % 
 									self.nif_import.selected_objects[0].name)
 			NifLog.debug("Identified '{0}' as armature".format(skelroot.name))
-			self.nif_import.dict_armatures[skelroot] = []
+			self.add_armature(skelroot)
 			for bone_name in self.nif_import.selected_objects[0].data.bones.keys():
 				# blender bone naming -> nif bone naming
 				nif_bone_name = self.nif_import.get_bone_name_for_nif(bone_name)
 				# find a block with bone name
-				bone_block = skelroot.find(block_name=nif_bone_name)
+				bone_block = block_index.find(block_name=nif_bone_name, root=skelroot)
 				# add it to the name list if there is a bone with that name
 				if bone_block:
 					NifLog.info("Identified nif block '{0}' with bone '{1}' in selected armature".format(nif_bone_name, bone_name))
 					self.nif_import.dict_names[bone_block] = bone_name
-					self.nif_import.dict_armatures[skelroot].append(bone_block)
+					self.add_bone(skelroot, bone_block)
 					self.complete_bone_tree(bone_block, skelroot)
 
 		# search for all NiTriShape or NiTriStrips blocks...
-		if isinstance(niBlock, NifFormat.NiTriBasedGeom):
+		for niBlock in block_index.get_blocks(NifFormat.NiTriBasedGeom, root=niBlock):
 			# yes, we found one, get its skin instance
 			if niBlock.is_skin():
 				NifLog.debug("Skin found on block '{0}'".format(niBlock.name))
@@ -376,8 +378,7 @@ class Armature():
 				skininst = niBlock.skin_instance
 				skelroot = skininst.skeleton_root
 				if NifOp.props.skeleton == "EVERYTHING":
-					if skelroot not in self.nif_import.dict_armatures:
-						self.nif_import.dict_armatures[skelroot] = []
+					if self.add_armature(skelroot):
 						NifLog.debug("'{0}' is an armature".format(skelroot.name))
 				elif NifOp.props.skeleton == "GEOMETRY_ONLY":
 					if skelroot not in self.nif_import.dict_armatures:
@@ -391,8 +392,7 @@ class Armature():
 					# boneBlock can be None; see pyffi issue #3114079
 					if not boneBlock:
 						continue
-					if boneBlock not in self.nif_import.dict_armatures[skelroot]:
-						self.nif_import.dict_armatures[skelroot].append(boneBlock)
+					if self.add_bone(skelroot, boneBlock):
 						NifLog.debug("'{0}' is a bone of armature '{1}'".format(boneBlock.name, skelroot.name))
 					# now we "attach" the bone to the armature:
 					# we make sure all NiNodes from this bone all the way
@@ -402,28 +402,21 @@ class Armature():
 				# mark all nodes as bones if asked
 				if self.nif_import.IMPORT_EXTRANODES:
 					# add bones
-					for bone in skelroot.tree():
+					for bone in block_index.get_blocks(NifFormat.NiNode, root=skelroot):
 						if bone is skelroot:
 							continue
-						if not isinstance(bone, NifFormat.NiNode):
-							continue
 						if isinstance(bone, NifFormat.NiLODNode):
 							# LOD nodes are never bones
 							continue
 						if self.nif_import.is_grouping_node(bone):
 							continue
-						if bone not in self.nif_import.dict_armatures[skelroot]:
-							self.nif_import.dict_armatures[skelroot].append(bone)
+						if self.add_bone(skelroot, bone):
 							NifLog.debug("'{0}' marked as extra bone of armature '{1}'".format(bone.name, skelroot.name))
 							# we make sure all NiNodes from this bone
 							# all the way down to the armature NiNode
 							# are marked as bones
 							self.complete_bone_tree(bone, skelroot)
 
-		# continue down the tree
-		for child in niBlock.get_refs():
-			if not isinstance(child, NifFormat.NiAVObject): continue # skip blocks that don't have transforms
-			self.mark_armatures_bones(child)
 
 	def complete_bone_tree(self, bone, skelroot):
 		"""Make sure that the bones actually form a tree all the way
@@ -437,9 +430,8 @@ class Armature():
 		boneparent = bone._parent
 		if boneparent != skelroot:
 			# parent is not the skeleton root
-			if boneparent not in self.nif_import.dict_armatures[skelroot]:
+			if self.add_bone(skelroot, boneparent):
 				# neither is it marked as a bone: so mark the parent as a bone
-				self.nif_import.dict_armatures[skelroot].append(boneparent)
 				# store the coordinates for realignement autodetection 
 				NifLog.debug("'{0}' is a bone of armature '{1}'".format(boneparent.name, skelroot.name))
 			# now the parent is marked as a bone
@@ -447,14 +439,29 @@ class Armature():
 			# this time starting from the parent bone
 			self.complete_bone_tree(boneparent, skelroot)
 
+	def add_armature(self, skelroot):
+		"""Mark a block as armature. Returns whether it was not marked yet."""
+		if skelroot in self.nif_import.dict_armatures:
+			return False
+		self.nif_import.dict_armatures[skelroot] = OrderedDict()
+		return True
+
+	def add_bone(self, skelroot, bone):
+		"""Mark a block as bone of an armature, keeping the bones in the
+		order in which they are found. Returns whether it was not marked yet.
+		"""
+		bones = self.nif_import.dict_armatures[skelroot]
+		if bone in bones:
+			return False
+		bones[bone] = None
+		self.nif_import.dict_bone_armatures.setdefault(bone, skelroot)
+		return True
+
 	def is_bone(self, niBlock):
 		"""Tests a NiNode to see if it's a bone."""
 		if not niBlock :
 			return False
-		for bones in self.nif_import.dict_armatures.values():
-			if niBlock in bones:
-				return True
-		return False
+		return niBlock in self.nif_import.dict_bone_armatures
 
 	def is_armature_root(self, niBlock):
 		"""Tests a block to see if it's an armature."""
@@ -478,13 +485,8 @@ class Armature():
 		"""Retrieves the Blender object or Blender bone matching the block."""
 		if self.is_bone(niBlock):
 			bone_name = self.nif_import.dict_names[niBlock]
-			armatureName = None
-			for armatureBlock, boneBlocks in self.nif_import.dict_armatures.items():
-				if niBlock in boneBlocks:
-					armatureName = self.nif_import.dict_names[armatureBlock]
-					break
-				else:
-					raise nif_utils.NifError("cannot find bone '%s'" % bone_name)
+			armatureBlock = self.nif_import.dict_bone_armatures[niBlock]
+			armatureName = self.nif_import.dict_names[armatureBlock]
 			armatureObject = bpy.types.Object(armatureName)
 			return armatureObject.data.bones[bone_name]
 		else:
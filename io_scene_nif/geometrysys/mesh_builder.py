@@ -0,0 +1,173 @@
+"""Bulk creation of blender mesh data from arrays, through foreach_set."""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+
+from io_scene_nif.geometrysys import mesh_utils
+
+# Element types of the blender mesh attributes, foreach_get and foreach_set
+# need buffers of exactly these types.
+_DTYPES = {
+    "co": np.float32,
+    "normal": np.float32,
+    "uv": np.float32,
+    "color": np.float32,
+    "vertex_index": np.int32,
+    "loop_start": np.int32,
+    "loop_total": np.int32,
+    "material_index": np.int32,
+    "use_smooth": np.bool_,
+}
+
+
+def get_array(collection, attr, width=1):
+    """Return an attribute of all elements of a bpy collection as an array
+    of shape (len(collection), width), or (len(collection),) if width is 1."""
+    values = np.empty(len(collection) * width, dtype=_DTYPES[attr])
+    collection.foreach_get(attr, values)
+    if width == 1:
+        return values
+    return values.reshape(-1, width)
+
+
+def set_array(collection, attr, values, start=0):
+    """Set an attribute of the elements of a bpy collection, starting at
+    element start. foreach_set can only write whole collections, so any
+    elements before start are read back first."""
+    values = np.asarray(values, dtype=_DTYPES[attr])
+    if not values.size:
+        return
+    if start:
+        width = values.size // max(len(collection) - start, 1)
+        head = get_array(collection, attr, width).reshape(-1)[:start * width]
+        values = np.concatenate((head, values.reshape(-1)))
+    collection.foreach_set(attr, values.reshape(-1))
+
+
+def add_vertices(b_mesh, coords):
+    """Append vertices to a mesh, with a single allocation.
+
+    :param coords: Vertex coordinates, shape (n, 3).
+    :return: Index of the first new vertex.
+    """
+    start = len(b_mesh.vertices)
+    b_mesh.vertices.add(len(coords))
+    set_array(b_mesh.vertices, "co", coords, start)
+    return start
+
+
+def add_polygons(b_mesh, faces):
+    """Append polygons with their loops to a mesh, with a single allocation
+    for each.
+
+    :param faces: Blender vertex indices of the polygons, shape (m, k), so
+        all polygons have k corners.
+    :return: Index of the first new polygon.
+    """
+    faces = np.asarray(faces, dtype=np.int32)
+    num_faces, num_corners = faces.shape
+    poly_start = len(b_mesh.polygons)
+    loop_start = len(b_mesh.loops)
+    b_mesh.polygons.add(num_faces)
+    b_mesh.loops.add(faces.size)
+    set_array(b_mesh.loops, "vertex_index", faces.reshape(-1), loop_start)
+    set_array(b_mesh.polygons, "loop_start",
+              np.arange(loop_start, loop_start + faces.size, num_corners), poly_start)
+    set_array(b_mesh.polygons, "loop_total", np.full(num_faces, num_corners), poly_start)
+    return poly_start
+
+
+def add_shape_key(b_obj, name, indices, coords):
+    """Add a shape key to an object, with a single read and write of its
+    coordinates. The new key starts from the basis, so vertices that are not
+    in indices, and the basis itself, are left untouched.
+
+    :param indices: Blender vertex index for each row of coords.
+    :param coords: Coordinates of the moved vertices, shape (n, 3).
+    :return: The new shape key.
+    """
+    b_key = b_obj.shape_key_add(name=name, from_mix=False)
+    b_coords = get_array(b_key.data, "co", 3)
+    mesh_utils.scatter_rows(b_coords, indices, coords)
+    set_array(b_key.data, "co", b_coords)
+    return b_key
+
+
+def get_mesh_arrays(b_mesh):
+    """Read everything the exporter needs from a mesh, with one foreach_get
+    per attribute.
+
+    :return: Dict of arrays: per vertex "coords" and "normals"; per polygon
+        "loop_starts", "loop_totals", "material_indices", "smooth" and
+        "poly_normals"; per loop "loop_vertices", "uv_layers", a dict of
+        the uvs of each uv layer by name, and "vertex_colors", a list of
+        the colors of each vertex color layer.
+    """
+    return {
+        "coords": get_array(b_mesh.vertices, "co", 3),
+        "normals": get_array(b_mesh.vertices, "normal", 3),
+        "loop_starts": get_array(b_mesh.polygons, "loop_start"),
+        "loop_totals": get_array(b_mesh.polygons, "loop_total"),
+        "material_indices": get_array(b_mesh.polygons, "material_index"),
+        "smooth": get_array(b_mesh.polygons, "use_smooth"),
+        "poly_normals": get_array(b_mesh.polygons, "normal", 3),
+        "loop_vertices": get_array(b_mesh.loops, "vertex_index"),
+        "uv_layers": {b_uv_layer.name: get_array(b_uv_layer.data, "uv", 2)
+                      for b_uv_layer in b_mesh.uv_layers},
+        "vertex_colors": [get_array(b_vcol_layer.data, "color", 3)
+                          for b_vcol_layer in b_mesh.vertex_colors],
+    }
+
+
+def get_vertex_weights(b_mesh):
+    """Read the vertex group weights of all vertices in a single pass.
+
+    :return: (vertices, groups, weights): for each vertex group membership
+        the vertex, the vertex group index and the weight.
+    """
+    vertices = []
+    groups = []
+    weights = []
+    for b_vert in b_mesh.vertices:
+        for b_group in b_vert.groups:
+            vertices.append(b_vert.index)
+            groups.append(b_group.group)
+            weights.append(b_group.weight)
+    return (np.array(vertices, dtype=np.int64), np.array(groups, dtype=np.int64),
+            np.array(weights, dtype=np.float64))
@@ -0,0 +1,500 @@
+"""Array based helpers for mesh geometry, shared by the nif import and export.
+
+This module does not use bpy, so it can be tested outside of blender."""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import numpy as np
+
+
+def label_rows(keys):
+    """Label the rows of an integer array so that equal rows, and only those,
+    get equal labels.
+
+    Columns are packed into as few 64 bit words as their value ranges allow,
+    so typical vertex keys need one or two one dimensional sorts, which is
+    much faster than :func:`numpy.unique` with axis=0.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    keys = keys.reshape(len(keys), -1)
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    words = []
+    word = np.zeros(len(keys), dtype=np.int64)
+    capacity = 1
+    for column in keys.T:
+        low = column.min()
+        span = int(column.max()) - int(low) + 1
+        if capacity * span > 2 ** 62:
+            words.append(word)
+            word = np.zeros(len(keys), dtype=np.int64)
+            capacity = 1
+        word = word * span + (column - low)
+        capacity *= span
+    words.append(word)
+    labels = words[0]
+    for word in words[1:]:
+        # relabel to get both labels below len(keys), so this cannot overflow
+        _, labels = np.unique(labels, return_inverse=True)
+        _, word_labels = np.unique(word, return_inverse=True)
+        labels = labels.reshape(-1) * len(keys) + word_labels.reshape(-1)
+    return labels
+
+
+def weld_vertices(verts, normals=None, vertex_resolution=1000, normal_resolution=100,
+                  combine=True, start_index=0):
+    """Merge vertices with the same position and normal, up to the given
+    resolutions.
+
+    Matches the historic dict based importer exactly, including its quirk of
+    treating the first nif vertex as never having been added, so that the
+    second vertex sharing its key is added again.
+
+    :param verts: Vertex positions, shape (n, 3).
+    :param normals: Vertex normals, shape (n, 3), or None.
+    :param combine: If False, every vertex is kept.
+    :param start_index: Index of the first new blender vertex.
+    :return: (v_map, new_verts): v_map[i] is the blender vertex of nif vertex
+        i, and new_verts holds the nif indices of the vertices to add, in
+        order of their blender index.
+    """
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    num_verts = len(verts)
+    if not combine or num_verts == 0:
+        return np.arange(start_index, start_index + num_verts), np.arange(num_verts)
+
+    # int() truncates towards zero, and so does astype
+    keys = (verts * vertex_resolution).astype(np.int64)
+    if normals is not None and len(normals):
+        normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+        keys = np.hstack((keys, (normals * normal_resolution).astype(np.int64)))
+    _, first, inverse = np.unique(label_rows(keys), return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # index of the vertex that each vertex is merged into
+    rep = first[inverse]
+    # quirk: vertex 0 maps to key index 0, which tests as not added
+    group = np.flatnonzero(inverse == inverse[0])
+    if len(group) > 1:
+        rep[group[1:]] = group[1]
+    is_new = rep == np.arange(num_verts)
+    new_verts = np.flatnonzero(is_new)
+    b_index = np.empty(num_verts, dtype=np.int64)
+    b_index[new_verts] = np.arange(start_index, start_index + len(new_verts))
+    return b_index[rep], new_verts
+
+
+def transform_points(points, matrix):
+    """Transform points by a 4x4 matrix the way ``vector * matrix`` does in
+    blender 2.7x, that is, treating the points as row vectors with w = 1.
+
+    :param points: Points, shape (n, 3).
+    :param matrix: A 4x4 matrix, such as a :class:`mathutils.Matrix`.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return np.asarray(points, dtype=np.float64).dot(matrix[:3, :3]) + matrix[3, :3]
+
+
+def map_to_loops(v_map, n_values, loop_vertices, b_values):
+    """Copy per nif vertex values to the blender loops that use them.
+
+    Every loop gets the value of the last nif vertex that maps to its
+    blender vertex; loops whose vertex is not in v_map keep their value.
+
+    :param v_map: Blender vertex of each nif vertex.
+    :param n_values: Values of the nif vertices, shape (n, ...). Only the
+        first min(len(v_map), len(n_values)) vertices are used.
+    :param loop_vertices: Blender vertex of each loop.
+    :param b_values: Current values of the loops, shape (num_loops, ...).
+    :return: The new values of the loops.
+    """
+    v_map = np.asarray(v_map, dtype=np.int64)
+    n_values = np.asarray(n_values)
+    loop_vertices = np.asarray(loop_vertices, dtype=np.int64)
+    b_values = np.array(b_values, copy=True)
+    num_verts = min(len(v_map), len(n_values))
+    if not num_verts or not len(loop_vertices):
+        return b_values
+    v_map = v_map[:num_verts]
+    # inverse of v_map, keeping the last nif vertex for each blender vertex
+    inverse = np.full(max(v_map.max(), loop_vertices.max()) + 1, -1, dtype=np.int64)
+    np.maximum.at(inverse, v_map, np.arange(num_verts))
+    sources = inverse[loop_vertices]
+    mapped = sources >= 0
+    b_values[mapped] = n_values[sources[mapped]]
+    return b_values
+
+
+def unique_faces(faces):
+    """Remove duplicate faces.
+
+    Faces are compared up to rotation of their corners, so (0, 1, 2) and
+    (1, 2, 0) are duplicates, but (0, 2, 1), which has the opposite winding,
+    is not. The first face of each set of duplicates is kept.
+
+    :param faces: Vertex indices of the faces, shape (m, k).
+    :return: (faces, f_map): the faces that are kept, in their original
+        order, and for each input face the index of its kept face, which is
+        -1 for the duplicates themselves.
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    if not len(faces):
+        return faces.reshape(0, 3), np.zeros(0, dtype=np.int64)
+    faces = faces.reshape(len(faces), -1)
+    num_faces, num_corners = faces.shape
+    # rotate each face to start at its lowest vertex index
+    shift = faces.argmin(axis=1)
+    corners = (shift[:, None] + np.arange(num_corners)) % num_corners
+    canonical = faces[np.arange(num_faces)[:, None], corners]
+    _, first = np.unique(label_rows(canonical), return_index=True)
+    first.sort()
+    f_map = np.full(num_faces, -1, dtype=np.int64)
+    f_map[first] = np.arange(len(first))
+    return faces[first], f_map
+
+
+def _last_occurrences(indices):
+    """Return the positions of the last occurrence of each distinct index."""
+    _, last = np.unique(indices[::-1], return_index=True)
+    return len(indices) - 1 - last
+
+
+def bucket_weights(vertices, weights):
+    """Group vertex weights by value, so that a vertex group can be filled
+    with one call per distinct weight.
+
+    If a vertex occurs more than once, its last weight is used, as happens
+    when adding its weights one by one in 'REPLACE' mode.
+
+    :param vertices: Vertex indices.
+    :param weights: Weight of each vertex.
+    :return: List of (weight, vertex index list) pairs, by increasing weight.
+    """
+    vertices = np.asarray(vertices, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if not len(vertices):
+        return []
+    last = _last_occurrences(vertices)
+    vertices = vertices[last]
+    weights = weights[last]
+    order = np.argsort(weights, kind="mergesort")
+    vertices = vertices[order]
+    weights = weights[order]
+    splits = np.flatnonzero(weights[1:] != weights[:-1]) + 1
+    return [(float(bucket_weights[0]), bucket_vertices.tolist())
+            for bucket_weights, bucket_vertices
+            in zip(np.split(weights, splits), np.split(vertices, splits))]
+
+
+def morph_coords(base, delta, matrix=None):
+    """Return the vertex coordinates of a morph target.
+
+    :param base: Base vertex coordinates, shape (n, 3).
+    :param delta: Offset of each vertex, shape (m, 3); only the first
+        min(n, m) rows of base and delta are used.
+    :param matrix: Optional transform, see :func:`transform_points`.
+    :return: Coordinates, shape (min(n, m), 3).
+    """
+    base = np.asarray(base, dtype=np.float64).reshape(-1, 3)
+    delta = np.asarray(delta, dtype=np.float64).reshape(-1, 3)
+    num_verts = min(len(base), len(delta))
+    coords = base[:num_verts] + delta[:num_verts]
+    if matrix is not None:
+        coords = transform_points(coords, matrix)
+    return coords
+
+
+def scatter_rows(target, indices, values):
+    """Set target[indices[i]] = values[i] in place; if an index occurs more
+    than once, its last value is used.
+
+    :param target: Array to update.
+    :param indices: Row of target for each value; only the first len(values)
+        are used.
+    :param values: New rows.
+    """
+    indices = np.asarray(indices, dtype=np.int64)[:len(values)]
+    if not len(indices):
+        return
+    last = _last_occurrences(indices)
+    target[indices[last]] = np.asarray(values)[last]
+
+
+def unique_vertquads(vertex_indices, attributes, epsilon):
+    """Assign nif vertices to the loops of a mesh, so that loops of the same
+    blender vertex share a nif vertex if their attributes are equal up to
+    epsilon.
+
+    Attributes are rounded to a grid of spacing epsilon, and loops with equal
+    vertex index and grid cell share a vertex. Loops that share a vertex
+    therefore differ by less than epsilon in every attribute, but loops just
+    either side of a grid line get a vertex each.
+
+    :param vertex_indices: Blender vertex of each loop.
+    :param attributes: Attributes of each loop, such as uvs, normal and
+        color, shape (num_loops, k); k may be 0.
+    :param epsilon: Grid spacing; if 0, attributes must be equal.
+    :return: (first, v_index): the loops from which the nif vertices are
+        taken, in order of first use, and the nif vertex of each loop.
+    """
+    vertex_indices = np.asarray(vertex_indices, dtype=np.int64)
+    attributes = np.asarray(attributes, dtype=np.float64)
+    if attributes.ndim != 2:
+        attributes = attributes.reshape(len(vertex_indices), -1)
+    if not len(vertex_indices):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if epsilon > 0 and attributes.shape[1]:
+        cells = np.floor(attributes / epsilon + 0.5).astype(np.int64)
+    elif attributes.shape[1]:
+        _, cells = np.unique(attributes, axis=0, return_inverse=True)
+        cells = cells.reshape(-1, 1)
+    else:
+        cells = attributes.astype(np.int64)
+    keys = np.hstack((vertex_indices[:, None], cells))
+    _, first, inverse = np.unique(label_rows(keys), return_index=True, return_inverse=True)
+    # renumber the vertices in order of first use, as a linear scan would
+    order = np.argsort(first)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[order] = np.arange(len(first))
+    return first[order], rank[inverse.reshape(-1)]
+
+
+def fan_triangles(loop_starts, loop_totals, flip=False):
+    """Split polygons into triangle fans around their first corner.
+
+    :param loop_starts: First loop of each polygon.
+    :param loop_totals: Number of loops of each polygon; polygons with fewer
+        than three are skipped.
+    :param flip: Reverse the winding of the triangles.
+    :return: (triangles, polygons): the loops of each triangle, shape (n, 3),
+        and the polygon of each triangle, grouped by polygon.
+    """
+    loop_starts = np.asarray(loop_starts, dtype=np.int64)
+    loop_totals = np.asarray(loop_totals, dtype=np.int64)
+    num_tris = np.maximum(loop_totals - 2, 0)
+    polygons = np.repeat(np.arange(len(loop_starts)), num_tris)
+    # index of each triangle within its polygon
+    offsets = np.arange(len(polygons)) - np.repeat(np.cumsum(num_tris) - num_tris, num_tris)
+    starts = loop_starts[polygons]
+    triangles = np.column_stack((starts, starts + offsets + 1, starts + offsets + 2))
+    if flip:
+        triangles = triangles[:, [0, 2, 1]]
+    return triangles, polygons
+
+
+def polygon_loops(loop_starts, loop_totals, polygons):
+    """Return the loops of some polygons of a mesh.
+
+    :param loop_starts: First loop of each polygon of the mesh.
+    :param loop_totals: Number of loops of each polygon of the mesh.
+    :param polygons: Indices of the polygons.
+    :return: (loops, starts): the loops of the polygons, in order, and the
+        position in loops of the first loop of each polygon.
+    """
+    polygons = np.asarray(polygons, dtype=np.int64)
+    totals = np.asarray(loop_totals, dtype=np.int64)[polygons]
+    starts = np.cumsum(totals) - totals
+    loops = (np.repeat(np.asarray(loop_starts, dtype=np.int64)[polygons] - starts, totals)
+             + np.arange(totals.sum()))
+    return loops, starts
+
+
+def split_polygons(material_indices, num_materials):
+    """Group the polygons of a mesh by material, with a single stable sort.
+
+    :param material_indices: Material index of each polygon.
+    :param num_materials: Number of materials; polygons with a higher
+        material index are left out.
+    :return: List of the polygons of each material, in their original order.
+    """
+    material_indices = np.asarray(material_indices, dtype=np.int64)
+    order = np.argsort(material_indices, kind="stable")
+    bounds = np.searchsorted(material_indices[order], np.arange(num_materials + 1))
+    return [order[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def group_masks(vertices, groups, mask_groups, num_verts):
+    """Return for each vertex a bitmask of the vertex groups it belongs to.
+
+    :param vertices: Vertex of each vertex group membership.
+    :param groups: Vertex group of each membership.
+    :param mask_groups: The vertex groups in the masks; bit i stands for
+        mask_groups[i], counting on into the next word after 64 bits.
+    :param num_verts: Number of vertices of the mesh.
+    :return: Masks, shape (num_verts, k), with k words of type np.uint64.
+    """
+    vertices = np.asarray(vertices, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    mask_groups = np.asarray(mask_groups, dtype=np.int64)
+    masks = np.zeros((num_verts, max(1, (len(mask_groups) + 63) // 64)), dtype=np.uint64)
+    if not len(groups) or not len(mask_groups):
+        return masks
+    bits = np.full(max(groups.max(), mask_groups.max()) + 1, -1, dtype=np.int64)
+    bits[mask_groups[::-1]] = np.arange(len(mask_groups))[::-1]
+    bits = bits[groups]
+    member = bits >= 0
+    bits = bits[member]
+    np.bitwise_or.at(masks, (vertices[member], bits // 64),
+                     np.left_shift(np.uint64(1), (bits % 64).astype(np.uint64)))
+    return masks
+
+
+def first_common_group(masks, loop_vertices, starts):
+    """For each polygon, find the first group in the masks that contains all
+    of its vertices.
+
+    :param masks: Group masks of the vertices, see :func:`group_masks`.
+    :param loop_vertices: Vertices of the polygons, one after the other.
+    :param starts: Position in loop_vertices of the first vertex of each
+        polygon; polygons must not be empty.
+    :return: Index in the mask groups for each polygon, or -1 if no group
+        contains all of its vertices.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    result = np.full(len(starts), -1, dtype=np.int64)
+    if not len(starts):
+        return result
+    common = np.bitwise_and.reduceat(masks[np.asarray(loop_vertices, dtype=np.int64)], starts, axis=0)
+    # the lowest word that has a bit set wins
+    for word in reversed(range(common.shape[1])):
+        bits = common[:, word]
+        found = bits != 0
+        lowest = bits[found] & (~bits[found] + np.uint64(1))
+        result[found] = 64 * word + np.frexp(lowest.astype(np.float64))[1] - 1
+    return result
+
+
+def skin_weights(vertices, groups, weights, bone_groups, nif_vertices):
+    """Gather the normalised bone weights of the nif vertices of a mesh.
+
+    The weights of a vertex are divided by their sum over all bones; vertices
+    whose bone weights sum to zero are left out.
+
+    :param vertices: Vertex of each vertex group membership.
+    :param groups: Vertex group of each membership.
+    :param weights: Weight of each membership.
+    :param bone_groups: Vertex group of each bone.
+    :param nif_vertices: Blender vertex of each nif vertex.
+    :return: (bones, nif vertices, weights), sorted by bone, then by blender
+        vertex, then by nif vertex.
+    """
+    vertices = np.asarray(vertices, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    bone_groups = np.asarray(bone_groups, dtype=np.int64)
+    nif_vertices = np.asarray(nif_vertices, dtype=np.int64)
+    if not len(groups) or not len(bone_groups) or not len(nif_vertices):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    num_verts = max(vertices.max(), nif_vertices.max()) + 1
+    bones = np.full(max(groups.max(), bone_groups.max()) + 1, -1, dtype=np.int64)
+    bones[bone_groups[::-1]] = np.arange(len(bone_groups))[::-1]
+    bones = bones[groups]
+    is_bone = bones >= 0
+    vertices, bones, weights = vertices[is_bone], bones[is_bone], weights[is_bone]
+    norms = np.bincount(vertices, weights, minlength=num_verts)
+    keep = norms[vertices] != 0
+    vertices, bones, weights = vertices[keep], bones[keep], weights[keep] / norms[vertices[keep]]
+    # repeat each weight for every nif vertex of its blender vertex
+    nif_order = np.argsort(nif_vertices, kind="stable")
+    counts = np.bincount(nif_vertices, minlength=num_verts)
+    nif_starts = np.cumsum(counts) - counts
+    repeats = counts[vertices]
+    rows = np.repeat(np.arange(len(vertices)), repeats)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    nif_indices = nif_order[nif_starts[vertices[rows]] + offsets]
+    order = np.lexsort((nif_indices, vertices[rows], bones[rows]))
+    rows = rows[order]
+    return bones[rows], nif_indices[order], weights[rows]
+
+
+def get_tri_shape(mesh, polygons, uv_layers=(), use_normals=False, use_colors=False,
+                  use_alpha=False, flip=False, epsilon=0.0):
+    """Build the vertices and triangles of a trishape from some polygons of
+    a mesh.
+
+    The corners of a blender vertex share a nif vertex if their uvs, normal
+    and color are equal up to epsilon, see :func:`unique_vertquads`. Smooth
+    polygons use the vertex normals, the others their polygon normal. Colors
+    come from the first vertex color layer, with the value of the second as
+    alpha if use_alpha is set, and 1.0 otherwise.
+
+    :param mesh: Arrays of the mesh, see
+        :func:`io_scene_nif.geometrysys.mesh_builder.get_mesh_arrays`.
+    :param polygons: Indices of the polygons; those with fewer than three
+        corners are skipped, the others are split into triangle fans.
+    :param uv_layers: Names of the uv layers to export.
+    :param flip: Reverse the winding of the triangles, for mirrored objects.
+    :return: Dict of arrays: per nif vertex "vertices", its blender vertex,
+        "coords", "normals", "uvs" of shape (n, len(uv_layers), 2) and
+        "colors" of shape (n, 4), where unused attributes have no columns;
+        per triangle "triangles", its nif vertices, and "polygons", the
+        polygon it comes from.
+    """
+    polygons = np.asarray(polygons, dtype=np.int64)
+    polygons = polygons[mesh["loop_totals"][polygons] >= 3]
+    totals = mesh["loop_totals"][polygons]
+    loops, starts = polygon_loops(mesh["loop_starts"], mesh["loop_totals"], polygons)
+    loop_vertices = mesh["loop_vertices"][loops].astype(np.int64)
+    attributes = [mesh["uv_layers"][name][loops] for name in uv_layers]
+    if use_normals:
+        smooth = np.repeat(mesh["smooth"][polygons], totals)
+        attributes.append(np.where(smooth[:, None], mesh["normals"][loop_vertices],
+                                   np.repeat(mesh["poly_normals"][polygons], totals, axis=0)))
+    if use_colors:
+        attributes.append(mesh["vertex_colors"][0][loops])
+        if use_alpha:
+            # the hsv value of the alpha layer
+            attributes.append(mesh["vertex_colors"][1][loops].max(axis=1)[:, None])
+        else:
+            attributes.append(np.ones((len(loops), 1)))
+    attributes = np.hstack([np.zeros((len(loops), 0))] + attributes)
+
+    first, v_index = unique_vertquads(loop_vertices, attributes, epsilon)
+    vertices = loop_vertices[first]
+    vertquads = attributes[first]
+    num_uvs = 2 * len(uv_layers)
+    num_normals = 3 if use_normals else 0
+    triangles, tri_polygons = fan_triangles(starts, totals, flip)
+    return {
+        "vertices": vertices,
+        "coords": mesh["coords"][vertices].astype(np.float64),
+        "uvs": vertquads[:, :num_uvs].reshape(len(first), len(uv_layers), 2),
+        "normals": vertquads[:, num_uvs:num_uvs + num_normals],
+        "colors": vertquads[:, num_uvs + num_normals:],
+        "triangles": v_index[triangles],
+        "polygons": polygons[tri_polygons],
+    }
@@ -0,0 +1,340 @@
+"""This module is used to cache parsed nif, kf and egm files on disk"""
+
+# ***** BEGIN LICENSE BLOCK *****
+#
+# Copyright © 2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+#
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import gc
+import hashlib
+import io
+import os
+import pickle
+import threading
+import types
+import weakref
+import zlib
+
+import pyffi
+from pyffi.formats.egm import EgmFormat
+from pyffi.formats.nif import NifFormat
+from io_scene_nif.utility.nif_logging import NifLog
+
+
+def _new_instance(obj_class):
+    return obj_class.__new__(obj_class)
+
+
+_DICT_GETTERS = {}
+
+
+def _get_instance_dict(obj):
+    """Returns the __dict__ of obj. Some generated pyffi classes carry the
+    __dict__ descriptor of the class they replaced, which does not apply to
+    their instances, so look for one that does."""
+    obj_class = type(obj)
+    getter = _DICT_GETTERS.get(obj_class)
+    if getter is None:
+        for base in obj_class.__mro__:
+            descriptor = base.__dict__.get("__dict__")
+            if descriptor is not None and isinstance(obj, descriptor.__objclass__):
+                getter = _DICT_GETTERS[obj_class] = descriptor.__get__
+                break
+        else:
+            raise TypeError("{0} has no __dict__".format(obj_class))
+    return getter(obj)
+
+
+def _dead_weakref():
+    return None
+
+
+class _Reducers(dict):
+    """Dispatch table of :class:`_Pickler`, only consulted for types that
+    pickle cannot handle by itself. Reducers are looked up once per type."""
+
+    def __init__(self, pickler):
+        dict.__init__(self)
+        self.pickler = pickler
+
+    def get(self, obj_type, default=None):
+        try:
+            return self[obj_type]
+        except KeyError:
+            return default
+
+    def __missing__(self, obj_type):
+        if obj_type is weakref.ReferenceType:
+            reducer = self.reduce_weakref
+        elif obj_type.__module__.startswith("pyffi."):
+            if issubclass(obj_type, type):
+                reducer = self.reduce_class
+            else:
+                reducer = self.pickler.reduce_instance
+        else:
+            raise KeyError(obj_type)
+        self[obj_type] = reducer
+        return reducer
+
+    @staticmethod
+    def reduce_weakref(obj):
+        referent = obj()
+        if referent is None:
+            return _dead_weakref, ()
+        return weakref.ref, (referent,)
+
+    @staticmethod
+    def reduce_class(obj):
+        return FileCache.get_class, (FileCache.get_class_name(obj),)
+
+
+class _Pickler(pickle.Pickler):
+    """Pickler for pyffi data.
+
+    Most struct classes of pyffi are generated at runtime, so they cannot be
+    pickled by reference, and some of them cannot have their state restored
+    through the regular pickle protocol. Hence every pyffi instance is written
+    without state at first, and its state is written in a later batch, which
+    also keeps the pickle recursion shallow.
+    """
+
+    def __init__(self, stream):
+        self.dispatch_table = _Reducers(self)
+        pickle.Pickler.__init__(self, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        self._pending = []
+
+    def reduce_instance(self, obj):
+        self._pending.append(obj)
+        return _new_instance, (type(obj),)
+
+    def dump_all(self, obj):
+        """Writes obj, followed by the state of all pyffi instances."""
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._dump_all(obj)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _dump_all(self, obj):
+        self.dump(obj)
+        while self._pending:
+            batch = []
+            for pyffi_obj in self._pending:
+                items = list(list.__iter__(pyffi_obj)) if isinstance(pyffi_obj, list) else None
+                batch.append((pyffi_obj, _get_instance_dict(pyffi_obj), items))
+            self._pending = []
+            self.dump(batch)
+        self.dump(None)
+
+
+class _Unpickler(pickle.Unpickler):
+    """Unpickler for data written by :class:`_Pickler`.
+
+    Cache entries are read from a user configured directory, so only the
+    globals that :class:`_Pickler` writes are resolved: the helpers of this
+    module, weak references, and the classes of the cached formats together
+    with the pyffi object model classes and methods that they are built
+    from. Anything else raises :class:`pickle.UnpicklingError`.
+    """
+
+    #: Helpers of this module that cache entries may refer to.
+    HELPERS = ("_new_instance", "_dead_weakref", "FileCache.get_class")
+
+    def find_class(self, module, name):
+        if module == __name__:
+            if name in self.HELPERS:
+                return pickle.Unpickler.find_class(self, module, name)
+        elif module == "weakref":
+            if name == "ReferenceType":
+                return weakref.ReferenceType
+        elif ((module in set(file_format.__module__ for file_format in FileCache.FORMATS)
+               or module.startswith("pyffi.object_models."))
+              and not any(part.startswith("__") for part in name.split("."))):
+            obj = pickle.Unpickler.find_class(self, module, name)
+            if isinstance(obj, type):
+                return obj
+            # methods of pyffi classes, which arrays keep in their state
+            owner_name = name.rpartition(".")[0]
+            if (owner_name and isinstance(pickle.Unpickler.find_class(self, module, owner_name), type)
+                    and isinstance(obj, types.FunctionType)):
+                return obj
+        raise pickle.UnpicklingError("{0}.{1} is not allowed in a cache entry".format(module, name))
+
+    def load_all(self):
+        """Reads the object written by :meth:`_Pickler.dump_all`."""
+        # a full nif creates many small objects, none of which are garbage
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._load_all()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _load_all(self):
+        obj = self.load()
+        batch = self.load()
+        while batch is not None:
+            for pyffi_obj, state, items in batch:
+                _get_instance_dict(pyffi_obj).update(state)
+                if items:
+                    list.extend(pyffi_obj, items)
+            batch = self.load()
+        return obj
+
+
+class FileCache():
+    """Size bounded on disk cache of parsed files.
+
+    Entries are keyed by absolute path, size and modification time of the
+    parsed file, and by :attr:`PARSER_VERSION`, so any change to either the
+    file or the parser invalidates them. When the cache grows beyond its
+    maximum size, the least recently used entries are removed.
+    """
+
+    #: Bump this whenever the loaders change what they return.
+    CACHE_VERSION = 1
+
+    #: Part of every key, so a pyffi upgrade invalidates the cache.
+    PARSER_VERSION = "{0}-{1}".format(pyffi.__version__, CACHE_VERSION)
+
+    #: Formats whose classes can be stored in the cache.
+    FORMATS = (NifFormat, EgmFormat)
+
+    EXTENSION = ".cache"
+
+    def __init__(self, cache_dir, max_size):
+        """
+        :param cache_dir: Directory for the cache files, created if needed.
+        :param max_size: Maximum total size of the cache files in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def get_class_name(obj_class):
+        """Returns (format name, class name) for a generated pyffi class."""
+        for file_format in FileCache.FORMATS:
+            if getattr(file_format, obj_class.__name__, None) is obj_class:
+                return file_format.__name__, obj_class.__name__
+        raise pickle.PicklingError("Cannot find format of {0}".format(obj_class))
+
+    @staticmethod
+    def get_class(class_name):
+        """Inverse of :meth:`get_class_name`."""
+        format_name, name = class_name
+        for file_format in FileCache.FORMATS:
+            if file_format.__name__ == format_name:
+                obj_class = getattr(file_format, name, None)
+                if not isinstance(obj_class, type):
+                    raise pickle.UnpicklingError("Unknown class {0}.{1}".format(format_name, name))
+                return obj_class
+        raise pickle.UnpicklingError("Unknown format {0}".format(format_name))
+
+    def get_key(self, file_path, variant=""):
+        """Returns the cache key of a file.
+
+        :param variant: Distinguishes different ways of loading the same file.
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        key = "\n".join((file_path, str(stat.st_size), str(stat.st_mtime), self.PARSER_VERSION, variant))
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key + self.EXTENSION)
+
+    def load(self, file_path, loader, variant=""):
+        """Returns the cached data of a file, calling loader(file_path) and
+        storing its result if the cache has no entry for the file yet."""
+        key = self.get_key(file_path, variant)
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(entry_path, "rb") as stream:
+                data = _Unpickler(io.BytesIO(zlib.decompress(stream.read()))).load_all()
+        except FileNotFoundError:
+            NifLog.info("Cache miss for {0}".format(file_path))
+        except Exception as e:
+            NifLog.warn("Discarding corrupt cache entry for {0}: {1}".format(file_path, e))
+        else:
+            NifLog.info("Cache hit for {0}".format(file_path))
+            # mark as recently used
+            os.utime(entry_path, None)
+            return data
+
+        data = loader(file_path)
+        self.store(entry_path, data)
+        return data
+
+    def store(self, entry_path, data):
+        """Writes data to the cache, and evicts old entries if needed."""
+        buffer = io.BytesIO()
+        try:
+            _Pickler(buffer).dump_all(data)
+        except Exception as e:
+            NifLog.warn("Cannot cache {0}: {1}".format(entry_path, e))
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = "{0}.{1}.tmp".format(entry_path, threading.get_ident())
+        with open(temp_path, "wb") as stream:
+            stream.write(zlib.compress(buffer.getvalue(), 1))
+        os.replace(temp_path, entry_path)
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in
+        its maximum size."""
+        # entries may vanish while we look at them, if another import
+        # evicts from the same cache directory
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(self.EXTENSION):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            NifLog.info("Evicting cache entry {0}".format(name))
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -38,6 +38,8 @@
 # ***** END LICENSE BLOCK *****
 
 
+import struct
+
 from pyffi.formats.nif import NifFormat
 from io_scene_nif.utility.nif_logging import NifLog
 from io_scene_nif.utility.nif_utils import NifError
@@ -66,5 +68,36 @@ class KFFile():
             else:                    
                 raise NifError("Not a KF file.")
             
-        return kf_file    
-    
\ No newline at end of file
+        return kf_file
+
+    @staticmethod
+    def list_sequences(file_path):
+        """Returns the names of the controller sequences in a Kf file.
+
+        For files that store block sizes and a string table in their header
+        (version 20.2.0.7 and up) only the header and the name of each
+        sequence are read, older files are read in full."""
+        kf_file = NifFormat.Data()
+        with open(file_path, "rb") as kf_stream:
+            kf_file.inspect_version_only(kf_stream)
+            if kf_file.version < 0:
+                raise NifError("Not a KF file.")
+            if kf_file.version < 0x14020007:
+                kf_file.read(kf_stream)
+                return [block.name.decode() for block in kf_file.blocks
+                        if isinstance(block, NifFormat.NiControllerSequence)]
+            header = kf_file.header
+            header.read(kf_stream, data=kf_file)
+            byte_order = "<" if header.endian_type else ">"
+            block_types = [block_type.decode("ascii") for block_type in header.block_types]
+            strings = list(header.strings)
+            names = []
+            offset = kf_stream.tell()
+            for type_index, block_size in zip(header.block_type_index, header.block_size):
+                # the name string index is the first field of a sequence
+                if block_types[type_index & 0xfff] == "NiControllerSequence":
+                    kf_stream.seek(offset)
+                    string_index, = struct.unpack(byte_order + "i", kf_stream.read(4))
+                    names.append(strings[string_index].decode() if string_index >= 0 else "")
+                offset += block_size
+            return names
@@ -38,33 +38,249 @@
 # ***** END LICENSE BLOCK *****
 
 
+import mmap
+import os
+import struct
+from array import array
+
 from pyffi.formats.nif import NifFormat
 from io_scene_nif.utility.nif_logging import NifLog
 from io_scene_nif.utility.nif_utils import NifError
 
+
+class MappedStream():
+    """Read-only file-like wrapper around a memory mapped file.
+
+    The hot read, seek and tell calls are bound directly to the underlying
+    :class:`mmap.mmap`, so the parser reads straight from the page cache
+    without an intermediate buffered stream copy.
+    """
+
+    def __init__(self, stream):
+        self.name = stream.name
+        self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        self.read = self._map.read
+        self.seek = self._map.seek
+        self.tell = self._map.tell
+
+    def __len__(self):
+        return len(self._map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def readline(self, limit=-1):
+        """Read up to the next newline, or at most limit bytes."""
+        line = self._map.readline()
+        if 0 <= limit < len(line):
+            self._map.seek(limit - len(line), os.SEEK_CUR)
+            line = line[:limit]
+        return line
+
+    def view(self, offset, size):
+        """Return a zero-copy :class:`memoryview` of size bytes at offset."""
+        return memoryview(self._map)[offset:offset + size]
+
+    def close(self):
+        self._map.close()
+
+
+class BlockOffsetIndex():
+    """Compact index of the blocks in a nif file, built from the header only.
+
+    Holds the type of every block and, for files whose header records block
+    sizes (version 20.2.0.7 and up), the offset and size of every block as
+    well as the root block indices from the footer.
+    """
+
+    def __init__(self, block_types, type_indices, offsets=None, sizes=None, roots=None):
+        #: Unique block type names, as listed in the header.
+        self.block_types = block_types
+        #: For each block, an index into :attr:`block_types`.
+        self.type_indices = type_indices
+        #: For each block, its offset in the file, or None if unknown.
+        self.offsets = offsets
+        #: For each block, its size in bytes, or None if unknown.
+        self.sizes = sizes
+        #: Indices of the root blocks, or None if unknown.
+        self.roots = roots
+
+    def __len__(self):
+        return len(self.type_indices)
+
+    @staticmethod
+    def read(nif_data, stream):
+        """Reads the header of stream into nif_data and indexes its blocks.
+        The stream is left positioned at the first block."""
+        NifFile._check_version(nif_data, stream)
+        nif_data.header.read(stream, data=nif_data)
+        header = nif_data.header
+        if nif_data.version < 0x05000001:
+            # block types are stored inline with the blocks
+            return BlockOffsetIndex((), array('H'))
+
+        # note the 0xfff mask: required for the NiPhysX blocks
+        block_types = tuple(block_type.decode("ascii").split("\x01")[0]
+                            for block_type in header.block_types)
+        type_indices = array('H', (type_index & 0xfff for type_index in header.block_type_index))
+        if nif_data.version < 0x14020007:
+            # no block sizes, so offsets are only known after parsing
+            return BlockOffsetIndex(block_types, type_indices)
+
+        sizes = array('I', header.block_size)
+        offsets = array('Q', [0] * len(sizes))
+        offset = stream.tell()
+        for block_index, size in enumerate(sizes):
+            offsets[block_index] = offset
+            offset += size
+        # footer: number of roots followed by the root block indices
+        byte_order = getattr(nif_data, "_byte_order", "<")
+        pos = stream.tell()
+        try:
+            stream.seek(offset)
+            num_roots, = struct.unpack(byte_order + 'I', stream.read(4))
+            roots = list(struct.unpack(byte_order + '%ii' % num_roots, stream.read(4 * num_roots)))
+        finally:
+            stream.seek(pos)
+        return BlockOffsetIndex(block_types, type_indices, offsets, sizes, roots)
+
+    def get_type_name(self, block_index):
+        """Type name of the given block."""
+        return self.block_types[self.type_indices[block_index]]
+
+    def count_by_type(self):
+        """Maps each block type name to the number of blocks of that type."""
+        counts = dict.fromkeys(self.block_types, 0)
+        for type_index in self.type_indices:
+            counts[self.block_types[type_index]] += 1
+        return counts
+
+    def find(self, block_types):
+        """Indices of all blocks that are instances of any of block_types."""
+        matching = [issubclass(getattr(NifFormat, name, type(None)), block_types)
+                    for name in self.block_types]
+        return [block_index for block_index, type_index in enumerate(self.type_indices)
+                if matching[type_index]]
+
+
 class NifFile():
     """Class to load and save a NifFile"""
-    
+
+    #: Files smaller than this many bytes are always read through a regular
+    #: buffered stream, as mapping them does not pay off.
+    MMAP_THRESHOLD = 16 * 1024 * 1024
+
+    #: Blocks needed to import a skeleton, with its animation.
+    SKELETON_BLOCK_TYPES = (
+        NifFormat.NiNode, NifFormat.NiExtraData,
+        NifFormat.NiTimeController, NifFormat.NiInterpolator,
+        NifFormat.NiKeyframeData, NifFormat.NiBSplineData, NifFormat.NiBSplineBasisData,
+        NifFormat.NiSequence, NifFormat.NiStringPalette, NifFormat.NiDefaultAVObjectPalette)
+
+    #: Blocks needed to import havok collisions.
+    COLLISION_BLOCK_TYPES = (
+        NifFormat.NiNode, NifFormat.NiExtraData,
+        NifFormat.NiCollisionObject, NifFormat.bhkRefObject, NifFormat.NiTriStripsData)
+
     @staticmethod
-    def load_nif(file_path):
-        """Loads a nif from the given file path"""
+    def load_nif(file_path, use_mmap=False, block_types=None):
+        """Loads a nif from the given file path
+
+        :param file_path: The nif file to load.
+        :param use_mmap: Memory map the file if it is larger than
+            :attr:`NifFile.MMAP_THRESHOLD`.
+        :param block_types: If given, only blocks of these types that can
+            be reached from the roots through other blocks of these types
+            are read; links to any other block are set to None. Files
+            without block sizes in their header are always read in full.
+        :type block_types: :class:`tuple`
+        """
         NifLog.info("Importing {0}".format(file_path))
 
         nif_data = NifFormat.Data()
-        
+
         # open file for binary reading
         with open(file_path, "rb") as nif_stream:
-            # check if nif file is valid
-            nif_data.inspect_version_only(nif_stream)
-            if nif_data.version >= 0:
-                # it is valid, so read the file
-                NifLog.info("NIF file version: {0}".format(nif_data.version, "x"))
-                NifLog.info("Reading file")
-                nif_data.read(nif_stream)
-            elif nif_data.version == -1:
-                raise NifError("Unsupported NIF version.")
-            else:                    
-                raise NifError("Not a NIF file.")
-            
+            if use_mmap and os.fstat(nif_stream.fileno()).st_size >= NifFile.MMAP_THRESHOLD:
+                NifLog.info("Memory mapping {0}".format(file_path))
+                with MappedStream(nif_stream) as nif_map:
+                    NifFile._read(nif_data, nif_map, block_types)
+            else:
+                NifFile._read(nif_data, nif_stream, block_types)
+
         return nif_data
-        
\ No newline at end of file
+
+    @staticmethod
+    def load_index(file_path):
+        """Returns the :class:`BlockOffsetIndex` of a nif file, reading its
+        header only."""
+        with open(file_path, "rb") as nif_stream:
+            return BlockOffsetIndex.read(NifFormat.Data(), nif_stream)
+
+    @staticmethod
+    def _check_version(nif_data, nif_stream):
+        """Checks that nif_stream holds a supported nif file."""
+        nif_data.inspect_version_only(nif_stream)
+        if nif_data.version >= 0:
+            NifLog.info("NIF file version: {0}".format(nif_data.version, "x"))
+        elif nif_data.version == -1:
+            raise NifError("Unsupported NIF version.")
+        else:
+            raise NifError("Not a NIF file.")
+
+    @staticmethod
+    def _read(nif_data, nif_stream, block_types=None):
+        """Checks the version of and reads nif_stream into nif_data."""
+        if block_types:
+            pos = nif_stream.tell()
+            index = BlockOffsetIndex.read(nif_data, nif_stream)
+            if index.offsets is not None:
+                NifLog.info("Reading {0} blocks only".format(", ".join(t.__name__ for t in block_types)))
+                NifFile._read_blocks(nif_data, nif_stream, index, block_types)
+                return
+            NifLog.info("No block sizes in header, reading all blocks")
+            nif_stream.seek(pos)
+        # check if nif file is valid
+        NifFile._check_version(nif_data, nif_stream)
+        # it is valid, so read the file
+        NifLog.info("Reading file")
+        nif_data.read(nif_stream)
+
+    @staticmethod
+    def _read_blocks(nif_data, nif_stream, index, block_types):
+        """Reads the blocks of the given types that are reachable from the
+        roots, using the block offsets of the index."""
+        wanted = [issubclass(getattr(NifFormat, name, type(None)), block_types)
+                  for name in index.block_types]
+        nif_data._string_list = [s for s in nif_data.header.strings]
+        nif_data._block_dct = {}
+        block_links = {}
+        pending = list(index.roots)
+        while pending:
+            block_index = pending.pop()
+            if (block_index < 0 or block_index in nif_data._block_dct
+                or not wanted[index.type_indices[block_index]]):
+                continue
+            block = getattr(NifFormat, index.get_type_name(block_index))()
+            nif_data._link_stack = []
+            nif_stream.seek(index.offsets[block_index])
+            block.read(nif_stream, nif_data)
+            nif_data._block_dct[block_index] = block
+            block_links[block_index] = nif_data._link_stack
+            pending.extend(nif_data._link_stack)
+
+        # resolve links, dropping those to blocks that were not read
+        for block_index, block in nif_data._block_dct.items():
+            nif_data._link_stack = [link if link in nif_data._block_dct else -1
+                                    for link in block_links[block_index]]
+            block.fix_links(nif_data)
+        nif_data._link_stack = []
+        nif_data.blocks = [nif_data._block_dct[block_index]
+                           for block_index in sorted(nif_data._block_dct)]
+        nif_data.roots = [nif_data._block_dct[block_index]
+                          for block_index in index.roots
+                          if block_index in nif_data._block_dct]
+        NifLog.info("Read {0} of {1} blocks".format(len(nif_data.blocks), len(index)))
@@ -51,8 +51,11 @@ class NifCommon:
     """
     
     # dictionary of bones that belong to a certain armature
-    # maps NIF armature name to list of NIF bone name
+    # maps NIF armature block to an ordered set of NIF bone blocks, that is,
+    # an OrderedDict with bone blocks as keys
     dict_armatures = {}
+    # maps NIF bone block to the NIF armature block it belongs to
+    dict_bone_armatures = {}
     # dictionary of bones, maps Blender bone name to matrix that maps the
     # NIF bone matrix on the Blender bone matrix
     # B' = X * B, where B' is the Blender bone matrix, and B is the NIF bone matrix
@@ -82,12 +85,25 @@ class NifCommon:
     # keeps track of names of exported blocks, to make sure they are unique
     dict_block_names = []
 
+    # exported NiNode blocks by name, see ObjectHelper.find_nodes
+    dict_nodes = {}
+
+    # exported NiNode blocks that are not in dict_nodes yet, as they are
+    # only named after they are registered
+    new_nodes = []
+
     # bone animation priorities (maps NiNode name to priority number);
     # priorities are set in import_kf_root and are stored into the name
     # of a NULL constraint (for lack of something better) in
     # import_armature
     dict_bone_priorities = {}
 
+    # roots of the keyframe file that are merged into the nif tree, and the
+    # decoded sequences among them, as (name, cyclic, bone keys), which are
+    # imported into one action each in import_armature_animation
+    kf_roots = []
+    kf_sequences = []
+
     # dictionary of materials, to reuse materials
     dict_materials = {}
     
@@ -206,6 +222,28 @@ class NifCommon:
         NifLog.warn("Unsupported interpolation mode ({0}) in nif, using quadratic/bezier.".format(n_ipol))
         return Blender.IpoCurve.InterpTypes.BEZIER
 
+    def get_cyclic_from_flags(self, flags):
+        """Whether an fcurve should repeat, for the cycle mode in the flags
+        of a time controller."""
+        if flags & 6 == 0: # 0b000
+            return True
+        elif flags & 6 != 4: # 0b100
+            NifLog.warn("Unsupported cycle mode in nif, using clamped.")
+        return False
+
+    def get_b_interpolation_from_n_ipol(self, n_ipol):
+        """The fcurve keyframe interpolation for a nif key type."""
+        if n_ipol in (NifFormat.KeyType.LINEAR_KEY, NifFormat.KeyType.XYZ_ROTATION_KEY):
+            return 'LINEAR'
+        elif n_ipol in (NifFormat.KeyType.QUADRATIC_KEY, NifFormat.KeyType.TBC_KEY):
+            return 'BEZIER'
+        elif n_ipol == 0:
+            # guessing, not documented in nif.xml
+            return 'CONSTANT'
+
+        NifLog.warn("Unsupported interpolation mode ({0}) in nif, using quadratic/bezier.".format(n_ipol))
+        return 'BEZIER'
+
     def get_n_ipol_from_b_ipol(self, b_ipol):
         if b_ipol == Blender.IpoCurve.InterpTypes.LINEAR:
             return NifFormat.KeyType.LINEAR_KEY
@@ -130,9 +130,12 @@ class NifExport(NifCommon):
         self.dict_names = {}
         self.dict_blocks = {}
         self.dict_block_names = []
+        self.dict_nodes = {}
+        self.new_nodes = []
         self.dict_materials = {}
         self.dict_textures = {}
         self.dict_mesh_uvlayers = []
+        self.dict_shape_datas = {}
         
         # if an egm is exported, this will contain the data
         self.egmdata = None
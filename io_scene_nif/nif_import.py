@@ -39,12 +39,15 @@
 
 from io_scene_nif.nif_common import NifCommon
 from io_scene_nif.utility import nif_utils
+from io_scene_nif.utility.nif_block_index import BlockIndex
 from io_scene_nif.utility.nif_logging import NifLog
+from io_scene_nif.io.cache import FileCache
 from io_scene_nif.io.nif import NifFile
 from io_scene_nif.io.kf import KFFile
 from io_scene_nif.io.egm import EGMFile 
 
 from io_scene_nif.animationsys.animation_import import AnimationHelper
+from io_scene_nif.geometrysys import mesh_builder, mesh_utils
 from io_scene_nif.armaturesys.armature_import import Armature
 from io_scene_nif.collisionsys.collision_import import bhkshape_import, bound_import
 from io_scene_nif.constraintsys.constraint_import import constraint_import
@@ -54,9 +57,14 @@ from io_scene_nif.texturesys.texture_loader import TextureLoader
 from io_scene_nif.objectsys.object_import import NiObject
 from io_scene_nif.scenesys import scene_import
 from io_scene_nif.utility.nif_global import NifOp
+from io_scene_nif.utility.nif_timing import NifTiming
+from io_scene_nif.utility.nif_workers import NifWorkers
+
+import functools
 
 import bpy
 import mathutils
+import numpy as np
 
 import pyffi.spells.nif.fix
 from pyffi.formats.nif import NifFormat
@@ -92,9 +100,12 @@ class NifImport(NifCommon):
         """Main import function."""
 
         self.dict_armatures = {}
+        self.dict_bone_armatures = {}
         self.dict_bones_extra_matrix = {}
         self.dict_bones_extra_matrix_inv = {}
         self.dict_bone_priorities = {}
+        self.kf_roots = []
+        self.kf_sequences = []
         self.dict_havok_objects = {}
         self.dict_names = {}
         self.dict_blocks = {}
@@ -102,6 +113,11 @@ class NifImport(NifCommon):
         self.dict_materials = {}
         self.dict_textures = {}
         self.dict_mesh_uvlayers = []
+        self.dict_meshes = {}
+
+        NifTiming.reset()
+        # worker calls, finished on the way out even if the import fails
+        futures = []
 
         # catch nif import errors
         try:
@@ -116,35 +132,82 @@ class NifImport(NifCommon):
                         " mode.")
 
 
-            self.data = NifFile.load_nif(NifOp.props.filepath)
+            # skip the blocks that are not imported anyway
+            if NifOp.props.skeleton == "SKELETON_ONLY":
+                block_types = NifFile.SKELETON_BLOCK_TYPES
+            elif NifOp.props.skeleton == "COLLISION_ONLY":
+                block_types = NifFile.COLLISION_BLOCK_TYPES
+            else:
+                block_types = None
+            if NifOp.props.cache_dir:
+                self.cache = FileCache(bpy.path.abspath(NifOp.props.cache_dir),
+                                       NifOp.props.cache_size * 1024 * 1024)
+            else:
+                self.cache = None
+
+            # parse all files at the same time, none of this needs bpy
+            nif_future = NifWorkers.submit(
+                self.load_file,
+                functools.partial(NifFile.load_nif, use_mmap=NifOp.props.use_mmap, block_types=block_types),
+                NifOp.props.filepath, variant=NifOp.props.skeleton if block_types else "")
+            kf_path = NifOp.props.keyframe_file
+            if kf_path:
+                kf_future = NifWorkers.submit(self.load_file, KFFile.load_kf, kf_path)
+            egm_path = NifOp.props.egm_file
+            if egm_path:
+                egm_future = NifWorkers.submit(self.load_file, EGMFile.load_egm, egm_path)
+            futures.append(nif_future)
+            if kf_path:
+                futures.append(kf_future)
+            if egm_path:
+                futures.append(egm_future)
+
+            self.data = NifWorkers.result(nif_future)
             if NifOp.props.override_scene_info:
                 scene_import.import_version_info(self.data)
 
-            kf_path = NifOp.props.keyframe_file
             if kf_path:
-                self.kfdata = KFFile.load_kf(kf_path)
+                self.kfdata = NifWorkers.result(kf_future)
             else:
                 self.kfdata = None
 
-            egm_path = NifOp.props.egm_file
             if egm_path:
-                self.egmdata = EGMFile.load_egm(egm_path)
+                self.egmdata = NifWorkers.result(egm_future)
                 # scale the data
                 self.egmdata.apply_scale(NifOp.props.scale_correction_import)
             else:
                 self.egmdata = None
 
+            # index all blocks once, so nothing needs to walk the tree again
+            with NifTiming.stage("Block index"):
+                self.block_index = BlockIndex(self.data.roots)
+                self.kf_index = BlockIndex(self.kfdata.roots) if self.kfdata else None
+
             NifLog.info("Importing data")
             # calculate and set frames per second
             if NifOp.props.animation:
                 self.fps = self.animationhelper.get_frames_per_second(
-                    self.data.roots
-                    + (self.kfdata.roots if self.kfdata else []))
+                    [self.block_index] + ([self.kf_index] if self.kf_index else []))
                 bpy.context.scene.render.fps = self.fps
 
+            # decode the selected keyframe sequences in the workers, each
+            # is written into its own action when importing the armature
+            self.kf_roots = []
+            self.kf_sequences = []
+            if NifOp.props.animation and self.kfdata:
+                self.kf_roots = self.get_kf_roots(self.kfdata, NifOp.props.keyframe_sequences)
+                decode_futures = [
+                    NifWorkers.submit(self.animationhelper.armature_animation.decode_sequence,
+                                      kf_root, NifOp.props.epsilon)
+                    for kf_root in self.kf_roots
+                    if isinstance(kf_root, NifFormat.NiControllerSequence)]
+                futures.extend(decode_futures)
+
             # merge skeleton roots and transform geometry into the rest pose
             if NifOp.props.merge_skeleton_roots:
                 pyffi.spells.nif.fix.SpellMergeSkeletonRoots(data=self.data).recurse()
+                # nodes were moved, so the index is out of date
+                self.block_index = BlockIndex(self.data.roots)
             if NifOp.props.send_geoms_to_bind_pos:
                 pyffi.spells.nif.fix.SpellSendGeometriesToBindPosition(data=self.data).recurse()
             if NifOp.props.send_detached_geoms_to_node_pos:
@@ -171,14 +234,17 @@ class NifImport(NifCommon):
             toaster.scale = NifOp.props.scale_correction_import
             pyffi.spells.nif.fix.SpellScale(data=self.data, toaster=toaster).recurse()
 
+            if self.kf_roots:
+                with NifTiming.stage("Keyframe sequences"):
+                    self.kf_sequences = [NifWorkers.result(future) for future in decode_futures]
+
             # import all root blocks
             for block in self.data.roots:
                 root = block
                 # root hack for corrupt better bodies meshes
                 # and remove geometry from better bodies on skeleton import
-                for b in (b for b in block.tree()
-                          if isinstance(b, NifFormat.NiGeometry)
-                          and b.is_skin()):
+                for b in (b for b in self.block_index.get_blocks(NifFormat.NiGeometry, root=block)
+                          if b.is_skin()):
                     # check if root belongs to the children list of the
                     # skeleton root (can only happen for better bodies meshes)
                     if root in [c for c in b.skin_instance.skeleton_root.children]:
@@ -194,15 +260,19 @@ class NifImport(NifCommon):
                                                if child.name[:6] != 'Bip01 ')
                             for child in nonbip_children:
                                 root.remove_child(child)
+                            self.block_index = BlockIndex(self.data.roots)
                 # import this root block
                 NifLog.debug("Root block: {0}".format(root.get_global_display()))
                 # merge animation from kf tree into nif tree
-                if NifOp.props.animation and self.kfdata:
-                    for kf_root in self.kfdata.roots:
-                        self.animationhelper.import_kf_root(kf_root, root)
+                for kf_root in self.kf_roots:
+                    self.animationhelper.import_kf_root(kf_root, root)
                 # import the nif tree
                 self.import_root(root)
+            if NifOp.props.animation:
+                self.animationhelper.report_key_reduction()
         finally:
+            NifWorkers.finish(futures)
+            NifTiming.report()
             # clear progress bar
             NifLog.info("Finished")
             # XXX no longer needed?
@@ -210,9 +280,28 @@ class NifImport(NifCommon):
             bpy.context.scene.update()
 
         return {'FINISHED'}
-     
-    
-    
+
+    def get_kf_roots(self, kfdata, sequence_names):
+        """Return the roots of the keyframe file to import: the sequences
+        named in sequence_names, or all roots if none are named."""
+        if not sequence_names:
+            return list(kfdata.roots)
+        kf_roots = [kf_root for kf_root in kfdata.roots
+                    if isinstance(kf_root, NifFormat.NiControllerSequence)
+                    and kf_root.name.decode() in sequence_names]
+        NifLog.info("Importing {0} of {1} keyframe sequences".format(len(kf_roots), len(kfdata.roots)))
+        return kf_roots
+
+    def load_file(self, loader, file_path, variant=""):
+        """Loads a file through the cache, if enabled.
+
+        :param loader: Function taking the file path and returning its data.
+        :param variant: Distinguishes different ways of loading the same file.
+        """
+        if self.cache:
+            return self.cache.load(file_path, loader, variant)
+        return loader(file_path)
+
 
     def import_root(self, root_block):
         """Main import function."""
@@ -261,7 +350,8 @@ class NifImport(NifCommon):
         elif isinstance(root_block, NifFormat.NiTriBasedGeom):
             # trishape/tristrips root
             b_obj = self.import_branch(root_block)
-            b_obj.niftools.bsxflags = self.bsxflags
+            if b_obj:
+                b_obj.niftools.bsxflags = self.bsxflags
 
         elif isinstance(root_block, NifFormat.NiNode):
             # root node is dummy scene node
@@ -348,9 +438,14 @@ class NifImport(NifCommon):
         if not niBlock:
             return None
         elif (isinstance(niBlock, NifFormat.NiTriBasedGeom)
-              and NifOp.props.skeleton != "SKELETON_ONLY"):
+              and NifOp.props.skeleton != "SKELETON_ONLY"
+              and (NifOp.props.skeleton != "COLLISION_ONLY"
+                   or self.is_collision_geom(niBlock))):
             # it's a shape node and we're not importing skeleton only
-            # (NifOp.props.skeleton ==  "SKELETON_ONLY")
+            # (NifOp.props.skeleton ==  "SKELETON_ONLY"), nor render
+            # geometry when importing collisions only; files without block
+            # sizes are read in full, so the geometry is not filtered at
+            # load time
             NifLog.debug("Building mesh in import_branch")
             # note: transform matrix is set during import
             self.active_obj_name = niBlock.name.decode()
@@ -409,6 +504,9 @@ class NifImport(NifCommon):
             else:
                 # is it a grouping node?
                 geom_group = self.is_grouping_node(niBlock)
+                if NifOp.props.skeleton == "COLLISION_ONLY":
+                    geom_group = [child for child in geom_group
+                                  if self.is_collision_geom(child)]
                 # if importing animation, remove children that have
                 # morph controllers from geometry group
                 if NifOp.props.animation:
@@ -758,14 +856,24 @@ class NifImport(NifCommon):
 
         NifLog.info("Importing mesh data for geometry {0}".format(niBlock.name))
 
+        b_shared_mesh = None
         if group_mesh:
             b_obj = group_mesh
             b_mesh = group_mesh.data
         else:
             # Mesh name -> must be unique, so tag it if needed
             b_name = self.import_name(niBlock)
-            # create mesh data
-            b_mesh = bpy.data.meshes.new(b_name)
+            # blocks with the same shape data and properties share their mesh
+            mesh_key = self.get_mesh_key(niBlock, group_mesh, applytransform)
+            b_shared_mesh = self.dict_meshes.get(mesh_key)
+            if b_shared_mesh:
+                NifLog.debug("Sharing mesh {0} with {1}".format(b_shared_mesh.name, b_name))
+                b_mesh = b_shared_mesh
+            else:
+                # create mesh data
+                b_mesh = bpy.data.meshes.new(b_name)
+                if mesh_key:
+                    self.dict_meshes[mesh_key] = b_mesh
             # create mesh object and link to data
             b_obj = bpy.data.objects.new(b_name, b_mesh)
             # link mesh object to the scene
@@ -793,10 +901,37 @@ class NifImport(NifCommon):
             # used later on
             transform = nif_utils.import_matrix(niBlock, relative_to=relative_to)
 
+        # shared meshes already have their geometry
+        if not b_shared_mesh:
+            self.import_mesh_data(niBlock, b_obj, transform if applytransform else None)
+
+        # import priority if existing
+        if niBlock.name in self.dict_bone_priorities:
+            constr = b_obj.constraints.append(
+                bpy.types.Constraint.NULL)
+            constr.name = "priority:%i" % self.dict_bone_priorities[niBlock.name]
+
+        b_obj.select = True
+        scn = bpy.context.scene
+        scn.objects.active = b_obj
+
+        return b_obj
+
+    def import_mesh_data(self, niBlock, b_obj, transform=None):
+        """Append the geometry, materials, skin and morphs of niBlock to the
+        mesh of b_obj.
+
+        :param niBlock: The nif block whose mesh data to import.
+        :type niBlock: C{NiTriBasedGeom}
+        :param b_obj: The object whose mesh to append to.
+        :param transform: Transform to apply to the vertices, or C{None}.
+        """
+        b_mesh = b_obj.data
+
         # shortcut for mesh geometry data
         niData = niBlock.data
         if not niData:
-            raise nif_utils.NifError("no shape data in %s" % b_name)
+            raise nif_utils.NifError("no shape data in %s" % niBlock.name)
 
         # vertices
         n_verts = niData.vertices
@@ -805,14 +940,9 @@ class NifImport(NifCommon):
         poly_gens = [list(tri) for tri in niData.get_triangles()]
 
         # "sticky" UV coordinates: these are transformed in Blender UV's
-        n_uv = list()
-        for i in range(len(niData.uv_sets)):
-            for lw in range(len(niData.uv_sets[i])):
-                n_uvt = list()
-                n_uvt.append(niData.uv_sets[i][lw].u)
-                n_uvt.append(1.0 - (niData.uv_sets[i][lw].v))
-                n_uv.append(tuple(n_uvt))
-        n_uvco = tuple(n_uv)
+        n_uv_sets = [np.array([(n_uv.u, 1.0 - n_uv.v) for n_uv in n_uv_set], dtype=np.float32).reshape(-1, 2)
+                     for n_uv_set in niData.uv_sets]
+        has_uv = any(len(n_uv_set) for n_uv_set in n_uv_sets)
 
         # vertex normals
         n_norms = niData.normals
@@ -842,7 +972,7 @@ class NifImport(NifCommon):
         if n_mat_prop or n_shader_prop or n_effect_shader_prop:
             # Texture
             n_texture_prop = None
-            if n_uvco:
+            if has_uv:
                 n_texture_prop = nif_utils.find_property(niBlock,
                                                   NifFormat.NiTexturingProperty)
                 
@@ -878,25 +1008,7 @@ class NifImport(NifCommon):
             # texturing effect for environment map
             # in official files this is activated by a NiTextureEffect child
             # preceeding the niBlock
-            textureEffect = None
-            if isinstance(niBlock._parent, NifFormat.NiNode):
-                lastchild = None
-                for child in niBlock._parent.children:
-                    if child is niBlock:
-                        if isinstance(lastchild, NifFormat.NiTextureEffect):
-                            textureEffect = lastchild
-                        break
-                    lastchild = child
-                else:
-                    raise RuntimeError("texture effect scanning bug")
-                # in some mods the NiTextureEffect child follows the niBlock
-                # but it still works because it is listed in the effect list
-                # so handle this case separately
-                if not textureEffect:
-                    for effect in niBlock._parent.effects:
-                        if isinstance(effect, NifFormat.NiTextureEffect):
-                            textureEffect = effect
-                            break
+            textureEffect = self.get_texture_effect(niBlock)
             
             # Alpha
             n_alpha_prop = nif_utils.find_property(niBlock,
@@ -942,142 +1054,67 @@ class NifImport(NifCommon):
 
         # v_map will store the vertex index mapping
         # nif vertex i maps to blender vertex v_map[i]
-        v_map = [(i) for i in range(len(n_verts))]  # pre-allocate memory, for faster performance
-
         # Following code avoids introducing unwanted cracks in UV seams:
-        # Construct vertex map to get unique vertex / normal pair list.
-        # We use a Python dictionary to remove doubles and to keep track of indices.
-        # While we are at it, we also add vertices while constructing the map.
-        n_map = {}
+        # merge vertices with the same position and normal, up to the
+        # resolution of the key, but keep them apart otherwise.
+        n_vert_array = np.array([(v.x, v.y, v.z) for v in n_verts], dtype=np.float64).reshape(-1, 3)
+        if n_norms:
+            n_norm_array = np.array([(n.x, n.y, n.z) for n in n_norms], dtype=np.float64)
+        else:
+            n_norm_array = None
         b_v_index = len(b_mesh.vertices)
-        for i, v in enumerate(n_verts):
-            # The key k identifies unique vertex /normal pairs.
-            # We use a tuple of ints for key, this works MUCH faster than a
-            # tuple of floats.
-            if n_norms:
-                n = n_norms[i]
-                k = (int(v.x * self.VERTEX_RESOLUTION),
-                     int(v.y * self.VERTEX_RESOLUTION),
-                     int(v.z * self.VERTEX_RESOLUTION),
-                     int(n.x * self.NORMAL_RESOLUTION),
-                     int(n.y * self.NORMAL_RESOLUTION),
-                     int(n.z * self.NORMAL_RESOLUTION))
-            else:
-                k = (int(v.x * self.VERTEX_RESOLUTION),
-                     int(v.y * self.VERTEX_RESOLUTION),
-                     int(v.z * self.VERTEX_RESOLUTION))
-            # check if vertex was already added, and if so, what index
-            try:
-                # this is the bottle neck...
-                # can we speed this up?
-                if not NifOp.props.combine_vertices:
-                    n_map_k = None
-                else:
-                    n_map_k = n_map[k]
-            except KeyError:
-                n_map_k = None
-            if not n_map_k:
-                # not added: new vertex / normal pair
-                n_map[k] = i  # unique vertex / normal pair with key k was added, with NIF index i
-                v_map[i] = b_v_index  # NIF vertex i maps to blender vertex b_v_index
-                # add the vertex
-                if applytransform:
-                    v = mathutils.Vector([v.x, v.y, v.z])
-                    v = v * transform
-                    b_mesh.vertices.add(1)
-                    b_mesh.vertices[-1].co = [v.x, v.y, v.z]
-                else:
-                    b_mesh.vertices.add(1)
-                    b_mesh.vertices[-1].co = [v.x, v.y, v.z]
-                # adds normal info if present (Blender recalculates these when
-                # switching between edit mode and object mode, handled further)
-                # if n_norms:
-                #    mv = b_mesh.vertices[b_v_index]
-                #    n = n_norms[i]
-                #    mv.normal = mathutils.Vector(n.x, n.y, n.z)
-                b_v_index += 1
-            else:
-                # already added
-                # NIF vertex i maps to Blender vertex v_map[n_map_k]
-                v_map[i] = v_map[n_map_k]
+        v_map, n_new_verts = mesh_utils.weld_vertices(
+            n_vert_array, n_norm_array, self.VERTEX_RESOLUTION, self.NORMAL_RESOLUTION,
+            combine=NifOp.props.combine_vertices, start_index=b_v_index)
+        b_coords = n_vert_array[n_new_verts]
+        if transform is not None:
+            b_coords = mesh_utils.transform_points(b_coords, transform)
+        mesh_builder.add_vertices(b_mesh, b_coords)
+        v_map = v_map.tolist()
         # report
-        NifLog.debug("{0} unique vertex-normal pairs".format(str(len(n_map))))
-        # release memory
-        del n_map
+        NifLog.debug("{0} unique vertex-normal pairs".format(len(n_new_verts)))
 
-        # Adds the polygons to the mesh
-        f_map = [None] * len(poly_gens)
-        b_f_index = len(b_mesh.polygons)
+        # Adds the polygons to the mesh, skipping duplicates
         bf2_index = len(b_mesh.polygons)
         bl_index = len(b_mesh.loops)
-        poly_count = len(poly_gens)
-        b_mesh.polygons.add(poly_count)
-        b_mesh.loops.add(poly_count * 3)
-        num_new_faces = 0  # counter for debugging
-        unique_faces = list()  # to avoid duplicate polygons
-        tri_point_list = list()
-        for i, f in enumerate(poly_gens):
-            # get face index
-            f_verts = [v_map[vert_index] for vert_index in f]
-            if tuple(f_verts) in unique_faces:
-                continue
-            unique_faces.append(tuple(f_verts))
-            f_map[i] = b_f_index
-            tri_point_list.append(len(poly_gens[i]))
-            ls_list = list()
-            b_f_index += 1
-            num_new_faces += 1
-        for ls1 in range(0, num_new_faces * (tri_point_list[len(ls_list)]), (tri_point_list[len(ls_list)])):
-            ls_list.append((ls1 + bl_index))
-        for i in range(len(unique_faces)):
-            if f_map[i] is None:
-                continue
-            b_mesh.polygons[f_map[i]].loop_start = ls_list[(f_map[i] - bf2_index)]
-            b_mesh.polygons[f_map[i]].loop_total = len(unique_faces[(f_map[i] - bf2_index)])
-            l = 0
-            lp_points = [v_map[loop_point] for loop_point in poly_gens[(f_map[i] - bf2_index)]]
-            while l < (len(poly_gens[(f_map[i] - bf2_index)])):
-                b_mesh.loops[(l + (bl_index))].vertex_index = lp_points[l]
-                l += 1
-            bl_index += (len(poly_gens[(f_map[i] - bf2_index)]))
-            
+        n_triangles = np.array(poly_gens, dtype=np.int64).reshape(-1, 3)
+        b_faces, n_f_map = mesh_utils.unique_faces(np.array(v_map, dtype=np.int64)[n_triangles])
+        num_new_faces = len(b_faces)
+        if num_new_faces:
+            mesh_builder.add_polygons(b_mesh, b_faces)
+        f_map = [None if b_f_index < 0 else bf2_index + b_f_index for b_f_index in n_f_map.tolist()]
         # at this point, deleted polygons (degenerate or duplicate)
         # satisfy f_map[i] = None
 
         NifLog.debug("{0} unique polygons".format(num_new_faces))
 
         # set face smoothing and material
-        for b_polysmooth_index in f_map:
-            if b_polysmooth_index is None:
-                continue
-            polysmooth = b_mesh.polygons[b_polysmooth_index]
-            polysmooth.use_smooth = True if (n_norms or niBlock.skin_instance) else False
-            polysmooth.material_index = materialIndex
+        use_smooth = True if (n_norms or niBlock.skin_instance) else False
+        mesh_builder.set_array(b_mesh.polygons, "use_smooth", [use_smooth] * num_new_faces, bf2_index)
+        mesh_builder.set_array(b_mesh.polygons, "material_index", [materialIndex] * num_new_faces, bf2_index)
         # vertex colors
         
 
         if b_mesh.polygons and niData.vertex_colors:
-            n_vcol_map = list()
-            for n_vcol, n_vmap in zip(niData.vertex_colors, v_map):
-                n_vcol_map.append((n_vcol, n_vmap))
-            
+            n_vcol_array = np.array([(n_vcol.r, n_vcol.g, n_vcol.b, n_vcol.a)
+                                     for n_vcol in niData.vertex_colors], dtype=np.float32)
+
             # create vertex_layers
             if not "VertexColor" in b_mesh.vertex_colors:
                 b_mesh.vertex_colors.new(name="VertexColor")  # color layer
                 b_mesh.vertex_colors.new(name="VertexAlpha")  # greyscale
-            
+
             # Mesh Vertex Color / Mesh Face
-            for b_polygon_loop in b_mesh.loops:
-                b_loop_index = b_polygon_loop.index
-                vcol = b_mesh.vertex_colors["VertexColor"].data[b_loop_index]
-                vcola = b_mesh.vertex_colors["VertexAlpha"].data[b_loop_index]
-                for n_col_index, n_map_index in n_vcol_map:
-                    if n_map_index == b_polygon_loop.vertex_index:
-                        col_list = n_col_index
-                        vcol.color.r = col_list.r
-                        vcol.color.g = col_list.g
-                        vcol.color.b = col_list.b
-                        vcola.color.v = col_list.a
+            b_vcol_data = b_mesh.vertex_colors["VertexColor"].data
+            b_vcola_data = b_mesh.vertex_colors["VertexAlpha"].data
+            b_loop_verts = mesh_builder.get_array(b_mesh.loops, "vertex_index")
+            b_vcols = mesh_utils.map_to_loops(
+                v_map, n_vcol_array[:, :3], b_loop_verts, mesh_builder.get_array(b_vcol_data, "color", 3))
+            # alpha goes in as a grey value
+            b_vcolas = mesh_utils.map_to_loops(
+                v_map, n_vcol_array[:, (3, 3, 3)], b_loop_verts, mesh_builder.get_array(b_vcola_data, "color", 3))
+            mesh_builder.set_array(b_vcol_data, "color", b_vcols)
+            mesh_builder.set_array(b_vcola_data, "color", b_vcolas)
             # vertex colors influence lighting...
             # we have to set the use_vertex_color_light flag on the material
             # see below
@@ -1094,33 +1131,20 @@ class NifImport(NifCommon):
         # and b_mesh.faceUV = 1 on such mesh raises a runtime error)
         if b_mesh.polygons:
            
-            # b_mesh.faceUV = 1
-            # b_mesh.vertexUV = 0
-            for i in range(len(niData.uv_sets)):
+            # nif faces that were kept, in order of their blender polygon
+            n_kept_faces = n_triangles[n_f_map >= 0]
+            for i, n_uv_set in enumerate(n_uv_sets):
                 # Set the face UV's for the mesh. The NIF format only supports
                 # vertex UV's, but Blender only allows explicit editing of face
                 # UV's, so load vertex UV's as face UV's
                 uvlayer = self.texturehelper.get_uv_layer_name(i)
-                if not uvlayer in b_mesh.uv_textures:
-                    b_mesh.uv_textures.new(uvlayer)
-                    uv_faces = b_mesh.uv_textures.active.data[:]
-                elif uvlayer in b_mesh.uv_textures:
-                    uv_faces = b_mesh.uv_textures[uvlayer].data[:]
-                else:
-                    uv_faces = None
-                if uv_faces:
-                    uvl = b_mesh.uv_layers.active.data[:]
-                    for b_f_index, f in enumerate(poly_gens):
-                        if b_f_index is None:
-                            continue
-                        uvlist = f
-                        v1, v2, v3 = uvlist
-                        # if v3 == 0:
-                        #   v1,v2,v3 = v3,v1,v2
-                        b_poly_index = b_mesh.polygons[b_f_index + bf2_index]
-                        uvl[b_poly_index.loop_start].uv = n_uvco[v1]
-                        uvl[b_poly_index.loop_start + 1].uv = n_uvco[v2]
-                        uvl[b_poly_index.loop_start + 2].uv = n_uvco[v3]
+                with NifTiming.stage("UV layer {0}".format(uvlayer)):
+                    if not uvlayer in b_mesh.uv_textures:
+                        b_mesh.uv_textures.new(uvlayer)
+                    # the loops of each polygon follow the corners of its face
+                    if len(n_uv_set):
+                        mesh_builder.set_array(b_mesh.uv_layers[uvlayer].data, "uv",
+                                               n_uv_set[n_kept_faces], bl_index)
             b_mesh.uv_textures.active_index = 0
 
         if material:
@@ -1139,7 +1163,7 @@ class NifImport(NifCommon):
             # if there's a base texture assigned to this material sets it
             # to be displayed in Blender's 3D view
             # but only if there are UV coordinates
-            if mbasetex and mbasetex.texture and n_uvco:
+            if mbasetex and mbasetex.texture and has_uv:
                 imgobj = mbasetex.texture.image
                 if imgobj:
                     for b_polyimage_index in f_map:
@@ -1153,22 +1177,26 @@ class NifImport(NifCommon):
 
         # import skinning info, for meshes affected by bones
         skininst = niBlock.skin_instance
+        b_v_groups = {v_group.name: v_group for v_group in b_obj.vertex_groups}
         if skininst:
             skindata = skininst.data
             bones = skininst.bones
             boneWeights = skindata.bone_list
+            b_v_map = np.array(v_map, dtype=np.int64)
             for idx, bone in enumerate(bones):
                 # skip empty bones (see pyffi issue #3114079)
                 if not bone:
                     continue
                 vertex_weights = boneWeights[idx].vertex_weights
                 groupname = self.dict_names[bone]
-                if not groupname in b_obj.vertex_groups.items():
-                    v_group = b_obj.vertex_groups.new(groupname)
-                for skinWeight in vertex_weights:
-                    vert = skinWeight.index
-                    weight = skinWeight.weight
-                    v_group.add([v_map[vert]], weight, 'REPLACE')
+                v_group = b_v_groups.get(groupname)
+                if not v_group:
+                    v_group = b_v_groups[groupname] = b_obj.vertex_groups.new(groupname)
+                verts = b_v_map[[skinWeight.index for skinWeight in vertex_weights]]
+                weights = [skinWeight.weight for skinWeight in vertex_weights]
+                # one call for all vertices that share a weight
+                for weight, b_verts in mesh_utils.bucket_weights(verts, weights):
+                    v_group.add(b_verts, weight, 'REPLACE')
 
         # import body parts as vertex groups
         if isinstance(skininst, NifFormat.BSDismemberSkinInstance):
@@ -1181,8 +1209,9 @@ class NifImport(NifCommon):
                 bodypart_wrap.set_value(bodypart.body_part)
                 groupname = bodypart_wrap.get_detail_display()
                 # create vertex group if it did not exist yet
-                if not(groupname in b_obj.vertex_groups.items()):
-                    v_group = b_obj.vertex_groups.new(groupname)
+                v_group = b_v_groups.get(groupname)
+                if not v_group:
+                    v_group = b_v_groups[groupname] = b_obj.vertex_groups.new(groupname)
                     skinpart_index = len(skinpart_list)
                     skinpart_list.append((skinpart_index, groupname))
                     bodypart_flag.append(bodypart.part_flag)
@@ -1205,16 +1234,15 @@ class NifImport(NifCommon):
             if morphCtrl:
                 morphData = morphCtrl.data
                 if morphData.num_morphs:
-                    # insert base key at frame 1, using relative keys
-                    b_mesh.insertKey(1, 'relative')
                     # get name for base key
                     keyname = morphData.morphs[0].frame_name
                     if not keyname:
                         keyname = 'Base'
-                    # set name for base key
-                    b_mesh.key.blocks[0].name = keyname
+                    # insert base key, using relative keys
+                    if not b_mesh.shape_keys:
+                        b_obj.shape_key_add(name=keyname, from_mix=False)
                     # get base vectors and import all morphs
-                    baseverts = morphData.morphs[0].vectors
+                    baseverts = [(bv.x, bv.y, bv.z) for bv in morphData.morphs[0].vectors]
                     b_ipo = Blender.Ipo.New('Key' , 'KeyIpo')
                     b_mesh.key.ipo = b_ipo
                     for idxMorph in range(1, morphData.num_morphs):
@@ -1224,23 +1252,13 @@ class NifImport(NifCommon):
                             keyname = 'Key %i' % idxMorph
                         NifLog.info("Inserting key '{0}'".format(keyname))
                         # get vectors
-                        morphverts = morphData.morphs[idxMorph].vectors
+                        morphverts = [(mv.x, mv.y, mv.z) for mv in morphData.morphs[idxMorph].vectors]
                         # for each vertex calculate the key position from base
                         # pos + delta offset
                         assert(len(baseverts) == len(morphverts) == len(v_map))
-                        for bv, mv, b_v_index in zip(baseverts, morphverts, v_map):
-                            base = mathutils.Vector(bv.x, bv.y, bv.z)
-                            delta = mathutils.Vector(mv.x, mv.y, mv.z)
-                            v = base + delta
-                            if applytransform:
-                                v *= transform
-                            b_mesh.vertices[b_v_index].co[0] = v.x
-                            b_mesh.vertices[b_v_index].co[1] = v.y
-                            b_mesh.vertices[b_v_index].co[2] = v.z
-                        # update the mesh and insert key
-                        b_mesh.insertKey(idxMorph, 'relative')
-                        # set name for key
-                        b_mesh.key.blocks[idxMorph].name = keyname
+                        b_coords = mesh_utils.morph_coords(
+                            baseverts, morphverts, transform)
+                        mesh_builder.add_shape_key(b_obj, keyname, v_map, b_coords)
                         # set up the ipo key curve
                         try:
                             b_curve = b_ipo.addCurve(keyname)
@@ -1265,14 +1283,6 @@ class NifImport(NifCommon):
                             x = key.value
                             frame = 1 + int(key.time * self.fps + 0.5)
                             b_curve.addBezier((frame, x))
-                        # finally: return to base position
-                        for bv, b_v_index in zip(baseverts, v_map):
-                            base = mathutils.Vector(bv.x, bv.y, bv.z)
-                            if applytransform:
-                                base *= transform
-                            b_mesh.vertices[b_v_index].co[0] = base.x
-                            b_mesh.vertices[b_v_index].co[1] = base.y
-                            b_mesh.vertices[b_v_index].co[2] = base.z
 
         # import facegen morphs
         if self.egmdata:
@@ -1283,8 +1293,9 @@ class NifImport(NifCommon):
             asym_morphs = [list(morph.get_relative_vertices())
                           for morph in self.egmdata.asym_morphs]
 
-            # insert base key at frame 1, using relative keys
-            b_mesh.insertKey(1, 'relative')
+            # insert base key, using relative keys
+            if not b_mesh.shape_keys:
+                b_obj.shape_key_add(name='Basis', from_mix=False)
 
             if self.IMPORT_EGMANIM:
                 # if morphs are animated: create key ipo for mesh
@@ -1305,19 +1316,9 @@ class NifImport(NifCommon):
 
                 # for each vertex calculate the key position from base
                 # pos + delta offset
-                for bv, mv, b_v_index in zip(n_verts, morphverts, v_map):
-                    base = mathutils.Vector(bv.x, bv.y, bv.z)
-                    delta = mathutils.Vector(mv[0], mv[1], mv[2])
-                    v = base + delta
-                    if applytransform:
-                        v *= transform
-                    b_mesh.vertices[b_v_index].co[0] = v.x
-                    b_mesh.vertices[b_v_index].co[1] = v.y
-                    b_mesh.vertices[b_v_index].co[2] = v.z
-                # update the mesh and insert key
-                b_mesh.insertKey(1, 'relative')
-                # set name for key
-                b_mesh.key.blocks[-1].name = keyname
+                b_coords = mesh_utils.morph_coords(
+                    n_vert_array, morphverts, transform)
+                mesh_builder.add_shape_key(b_obj, keyname, v_map, b_coords)
 
                 if self.IMPORT_EGMANIM:
                     # set up the ipo key curve
@@ -1327,7 +1328,7 @@ class NifImport(NifCommon):
                     # constant extrapolation
                     b_curve.extend = Blender.IpoCurve.ExtendTypes.CONST
                     # set up the curve's control points
-                    framestart = 1 + len(b_mesh.key.blocks) * 10
+                    framestart = 1 + len(b_mesh.shape_keys.key_blocks) * 10
                     for frame, value in ((framestart, 0),
                                          (framestart + 5, self.IMPORT_EGMANIMSCALE),
                                          (framestart + 10, 0)):
@@ -1337,44 +1338,72 @@ class NifImport(NifCommon):
                 # set begin and end frame
                 bpy.context.scene.getRenderingContext().startFrame(1)
                 bpy.context.scene.getRenderingContext().endFrame(
-                    11 + len(b_mesh.key.blocks) * 10)
-
-            # finally: return to base position
-            for bv, b_v_index in zip(n_verts, v_map):
-                base = mathutils.Vector(bv.x, bv.y, bv.z)
-                if applytransform:
-                    base *= transform
-                b_mesh.vertices[b_v_index].co[0] = base.x
-                b_mesh.vertices[b_v_index].co[1] = base.y
-                b_mesh.vertices[b_v_index].co[2] = base.z
-
-
-        # import priority if existing
-        if niBlock.name in self.dict_bone_priorities:
-            constr = b_obj.constraints.append(
-                bpy.types.Constraint.NULL)
-            constr.name = "priority:%i" % self.dict_bone_priorities[niBlock.name]
+                    11 + len(b_mesh.shape_keys.key_blocks) * 10)
 
         # recalculate mesh to render correctly
         # implementation note: update() without validate() can cause crash
         
         b_mesh.validate()
         b_mesh.update()
-        b_obj.select = True
-        scn = bpy.context.scene
-        scn.objects.active = b_obj
-
-        return b_obj
     
+    def get_mesh_key(self, niBlock, group_mesh=None, applytransform=False):
+        """Return the key under which the blender mesh of niBlock can be
+        shared with other blocks, or None if it cannot be shared.
+
+        Blocks share a mesh if they have the same shape data, properties,
+        extra data and texture effect, and so the same material. Only
+        standalone blocks whose transform is not applied to the mesh are
+        shared. Skinned and morphed blocks are never shared, as their
+        weights and shape keys live on the mesh.
+        """
+        if group_mesh or applytransform:
+            return None
+        if not niBlock.data or niBlock.skin_instance or self.egmdata:
+            return None
+        if (NifOp.props.animation
+            and nif_utils.find_controller(niBlock, NifFormat.NiGeomMorpherController)):
+            return None
+        return (id(niBlock.data),
+                tuple(id(n_prop) for n_prop in niBlock.properties),
+                tuple(id(n_prop) for n_prop in niBlock.bs_properties),
+                tuple(id(extra) for extra in niBlock.get_extra_datas()),
+                id(self.get_texture_effect(niBlock)))
+
+    def get_texture_effect(self, niBlock):
+        """Return the NiTextureEffect that applies to niBlock, or None."""
+        textureEffect = None
+        if isinstance(niBlock._parent, NifFormat.NiNode):
+            lastchild = None
+            for child in niBlock._parent.children:
+                if child is niBlock:
+                    if isinstance(lastchild, NifFormat.NiTextureEffect):
+                        textureEffect = lastchild
+                    break
+                lastchild = child
+            else:
+                raise RuntimeError("texture effect scanning bug")
+            # in some mods the NiTextureEffect child follows the niBlock
+            # but it still works because it is listed in the effect list
+            # so handle this case separately
+            if not textureEffect:
+                for effect in niBlock._parent.effects:
+                    if isinstance(effect, NifFormat.NiTextureEffect):
+                        textureEffect = effect
+                        break
+        return textureEffect
+
     def set_parents(self, niBlock):
-        """Set the parent block recursively through the tree, to allow
-        crawling back as needed."""
-        if isinstance(niBlock, NifFormat.NiNode):
-            # list of non-null children
-            children = [ child for child in niBlock.children if child ]
-            for child in children:
-                child._parent = niBlock
-                self.set_parents(child)
+        """Set the parent block of all nodes below niBlock, from the block
+        index, to allow crawling back as needed."""
+        for block in self.block_index.get_blocks(NifFormat.NiAVObject, root=niBlock):
+            if block is not niBlock:
+                block._parent = self.block_index.get_parent(block)
+
+    def is_collision_geom(self, niBlock):
+        """Determine whether niBlock is geometry of a root collision node,
+        as opposed to render geometry."""
+        return (isinstance(niBlock, NifFormat.NiTriBasedGeom)
+                and isinstance(getattr(niBlock, "_parent", None), NifFormat.RootCollisionNode))
 
     def is_grouping_node(self, niBlock):
         """Determine whether node is grouping node.
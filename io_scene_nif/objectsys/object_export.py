@@ -39,9 +39,11 @@
 
 import bpy
 import mathutils
+import numpy as np
 
 from pyffi.formats.nif import NifFormat
 
+from io_scene_nif.geometrysys import mesh_builder, mesh_utils
 from io_scene_nif.utility import nif_utils
 from io_scene_nif.utility.nif_logging import NifLog
 from io_scene_nif.utility.nif_global import NifOp
@@ -98,8 +100,26 @@ class ObjectHelper():
         else:
             NifLog.info("Exporting {0} as {1} block".format(b_obj, block.__class__.__name__))
         self.nif_export.dict_blocks[block] = b_obj
+        if isinstance(block, NifFormat.NiNode):
+            self.nif_export.new_nodes.append(block)
         return block
 
+    def find_nodes(self, n_name):
+        """Return the exported NiNode blocks with the given name, in the
+        order in which they were registered.
+
+        Blocks are named after they are registered, so this first adds the
+        nodes registered since the last call to the name map.
+
+        @param n_name: The name of the nif block.
+        @return: List of blocks."""
+        for block in self.nif_export.new_nodes:
+            self.nif_export.dict_nodes.setdefault(block.name.decode(), []).append(block)
+        self.nif_export.new_nodes = []
+        # skip blocks that were renamed or removed since
+        return [block for block in self.nif_export.dict_nodes.get(n_name, [])
+                if block.name.decode() == n_name and block in self.nif_export.dict_blocks]
+
     def export_node(self, b_obj, space, parent_block, node_name):
         """Export a mesh/armature/empty object b_obj as child of parent_block.
         Export also all children of b_obj.
@@ -572,6 +592,10 @@ class MeshHelper():
         # is mesh double sided?
         mesh_doublesided = b_mesh.show_double_sided
 
+        # read all geometry of the mesh at once, the rest of the export
+        # works on these arrays
+        mesh_arrays = mesh_builder.get_mesh_arrays(b_mesh)
+
         #vertex color check
         mesh_hasvcol = False
         mesh_hasvcola = False
@@ -584,12 +608,31 @@ class MeshHelper():
                 NifLog.warn("Mesh only has one Vertex Color layer. Default alpha values will be written."
                                "For Custom alpha values add a second vertex layer, greyscale only" )
             else:
-                for b_loop in b_mesh.vertex_colors[1].data:
-                    if(b_loop.color.v > NifOp.props.epsilon):
-                        mesh_hasvcola = True    
-                        break
+                # the hsv value of the alpha layer
+                b_alphas = mesh_arrays["vertex_colors"][1].max(axis=1, initial=0.0)
+                mesh_hasvcola = bool(np.any(b_alphas > NifOp.props.epsilon))
                        
 
+        # polygons of each material, so every trishape only visits its own
+        material_polygons = mesh_utils.split_polygons(mesh_arrays["material_indices"], len(mesh_materials))
+
+        # vertex group memberships of all vertices, read in a single pass
+        vertex_weights = mesh_builder.get_vertex_weights(b_mesh)
+
+        # list of body part (name, index) in this mesh, and for each vertex
+        # a bitmask of the body parts it belongs to
+        bodypartgroups = []
+        bodypart_vertex_groups = []
+        for bodypartgroupname in NifFormat.BSDismemberBodyPartType().get_editor_keys():
+            vertex_group = b_obj.vertex_groups.get(bodypartgroupname)
+            if vertex_group:
+                NifLog.debug("Found body part {0}".format(bodypartgroupname))
+                bodypartgroups.append([bodypartgroupname,
+                                       getattr(NifFormat.BSDismemberBodyPartType, bodypartgroupname)])
+                bodypart_vertex_groups.append(vertex_group.index)
+        bodypart_masks = mesh_utils.group_masks(
+            vertex_weights[0], vertex_weights[1], bodypart_vertex_groups, len(b_mesh.vertices))
+
         # Non-textured materials, vertex colors are used to color the mesh
         # Textured materials, they represent lighting details
 
@@ -668,22 +711,6 @@ class MeshHelper():
                 mesh_haswire = (b_mat.type == 'WIRE')
             
                     
-            # list of body part (name, index, vertices) in this mesh
-            bodypartgroups = []
-            for bodypartgroupname in NifFormat.BSDismemberBodyPartType().get_editor_keys():
-                vertex_group = b_obj.vertex_groups.get(bodypartgroupname)
-                vertices_list = set()
-                if vertex_group:
-                    for b_vert in b_mesh.vertices:
-                        for b_groupname in b_vert.groups:
-                            if b_groupname.group == vertex_group.index:
-                                vertices_list.add(b_vert.index)
-                    NifLog.debug("Found body part {0}".format(bodypartgroupname))
-                    bodypartgroups.append([bodypartgroupname,
-                                           getattr(NifFormat.BSDismemberBodyPartType, bodypartgroupname),
-                                           vertices_list])
-
-
             # note: we can be in any of the following five situations
             # material + base texture        -> normal object
             # material + base tex + glow tex -> normal glow mapped object
@@ -899,142 +926,74 @@ class MeshHelper():
             # produce lists of vertices, uv-vertices, normals, vertex colors, and face indices.
             
             mesh_uvlayers = self.nif_export.texturehelper.get_uv_layers(b_mat)
-            vertquad_list = [] # (vertex, uv coordinate, normal, vertex color) list
-            vertmap = [None for i in range(len(b_mesh.vertices))] # blender vertex -> nif vertices
-            vertlist = []
-            normlist = []
-            vcollist = []
-            uvlist = []
-            trilist = []
+
+            # objects that share a blender mesh share the shape data
+            data_key = self.get_shape_data_key(b_obj, trishape, materialIndex, mesh_hasnormals)
+            if data_key in self.nif_export.dict_shape_datas:
+                tridata = self.nif_export.dict_shape_datas[data_key]
+                NifLog.info("Sharing {0} of mesh {1}".format(tridata.__class__.__name__, b_mesh.name))
+                trishape.data = tridata
+                self.export_tangent_space(trishape, mesh_uvlayers, mesh_hasnormals)
+                continue
+
+            uv_layer_names = [uvlayer for uvlayer in mesh_uvlayers if uvlayer != ""]
+            if len(uv_layer_names) < len(mesh_uvlayers):
+                NifLog.warn("Texture is set to use UV but no UV Map is Selected "
+                            "for Mapping > Map")
+            if mesh_uvlayers and not b_mesh.uv_layer_stencil:
+                # if we have uv coordinates
+                # double check that we have uv data
+                NifLog.warn("No UV map for texture associated with selected mesh '{0}'.".format(b_mesh.name))
+
+            # does the face belong to this trishape?
+            if (b_mat != None): # we have a material
+                polygons = material_polygons[materialIndex]
+            else:
+                polygons = np.arange(len(mesh_arrays["loop_totals"]))
+            assert(np.all(mesh_arrays["loop_totals"][polygons] <= 4)) # debug
+
+            # extract all unique (vert, uv-vert, normal, vcol) quads, and
+            # the (hopefully, convex) faces, in triangles
+            tri_shape = mesh_utils.get_tri_shape(
+                mesh_arrays, polygons, uv_layer_names,
+                use_normals=mesh_hasnormals, use_colors=mesh_hasvcol, use_alpha=mesh_hasvcola,
+                flip=(b_obj.scale.x + b_obj.scale.y + b_obj.scale.z) <= 0,
+                epsilon=NifOp.props.epsilon)
+            if len(tri_shape["vertices"]) > 65536:
+                raise nif_utils.NifError(
+                    "ERROR%t|Too many vertices. Decimate your mesh"
+                    " and try again.")
+            vertlist = tri_shape["coords"]
+            normlist = tri_shape["normals"]
+            vcollist = tri_shape["colors"]
+            uvlist = tri_shape["uvs"]
+            trilist = [tuple(tri) for tri in tri_shape["triangles"].tolist()]
+            # blender vertex -> nif vertices
+            vertmap = [None for i in range(len(b_mesh.vertices))]
+            for n_index, b_v_index in enumerate(tri_shape["vertices"].tolist()):
+                if not vertmap[b_v_index]:
+                    vertmap[b_v_index] = []
+                vertmap[b_v_index].append(n_index)
+
             # for each face in trilist, a body part index
             bodypartfacemap = []
             polygons_without_bodypart = []
-            for poly in b_mesh.polygons:
-                
-                # does the face belong to this trishape?
-                if (b_mat != None): # we have a material
-                    if (poly.material_index != materialIndex): # but this face has another material
-                        continue # so skip this face
-                    
-                f_numverts = len(poly.vertices)
-                if (f_numverts < 3): continue # ignore degenerate polygons
-                assert((f_numverts == 3) or (f_numverts == 4)) # debug
-                if mesh_uvlayers:
-                    # if we have uv coordinates
-                    # double check that we have uv data
-                    if not b_mesh.uv_layer_stencil:
-                        NifLog.warn("No UV map for texture associated with poly {0} of selected "
-                                    "mesh '{1}'.".format(str(poly.index), b_mesh.name))
-                # find (vert, uv-vert, normal, vcol) quad, and if not found, create it
-                f_index = [ -1 ] * f_numverts
-                for i, loop_index in enumerate(
-                                    range(poly.loop_start, poly.loop_start + poly.loop_total)):
-                    
-                    fv_index = b_mesh.loops[loop_index].vertex_index
-                    vertex = b_mesh.vertices[fv_index]
-                    vertex_index = vertex.index
-                    fv = vertex.co
-                    #smooth = vertex normal, non-smooth = face normal)
-                    if mesh_hasnormals:
-                        if poly.use_smooth:
-                            fn = vertex.normal
-                        else:
-                            fn = poly.normal
-                    else:
-                        fn = None
-                        
-                    fuv = []
-                    for uvlayer in mesh_uvlayers:
-                        if uvlayer != "":
-                            #TODO: map uv layer to index
-                            #currently we have uv_layer names, but we need their index value
-                            #b_mesh.uv_layers[0].data[poly.index].uv
-                            fuv.append(b_mesh.uv_layers[uvlayer].data[loop_index].uv)
-                        else:
-                            NifLog.warn("Texture is set to use UV but no UV Map is Selected "
-                                        "for Mapping > Map")
-                    fcol = None
-
-                    '''TODO: Need to map b_verts -> n_verts'''
-                    if mesh_hasvcol:
-                        #check for an alpha layer
-                        b_color = b_mesh.vertex_colors[0].data[loop_index].color
-                        if(mesh_hasvcola):
-                            b_alpha = b_mesh.vertex_colors[1].data[loop_index].color
-                            fcol = [b_color.r, b_color.g, b_color.b, b_alpha.v]
-                        else:
-                            fcol = [b_color.r, b_color.g, b_color.b, 1.0]
-                    else:
-                        fcol = None
-
-                    vertquad = ( fv, fuv, fn, fcol )
-
-                    # check for duplicate vertquad?
-                    f_index[i] = len(vertquad_list)
-                    if vertmap[vertex_index]:
-                        # iterate only over vertices with the same vertex index
-                        # and check if they have the same uvs, normals and colors
-                        for j in vertmap[vertex_index]:
-                            if mesh_uvlayers:
-                                if max(abs(vertquad[1][uvlayer][0] - vertquad_list[j][1][uvlayer][0])
-                                       for uvlayer in range(len(mesh_uvlayers))) \
-                                       > NifOp.props.epsilon:
-                                    continue
-                                if max(abs(vertquad[1][uvlayer][1] - vertquad_list[j][1][uvlayer][1])
-                                       for uvlayer in range(len(mesh_uvlayers))) \
-                                       > NifOp.props.epsilon:
-                                    continue
-                            if mesh_hasnormals:
-                                if abs(vertquad[2][0] - vertquad_list[j][2][0]) > NifOp.props.epsilon: continue
-                                if abs(vertquad[2][1] - vertquad_list[j][2][1]) > NifOp.props.epsilon: continue
-                                if abs(vertquad[2][2] - vertquad_list[j][2][2]) > NifOp.props.epsilon: continue
-                            if mesh_hasvcol:
-                                if abs(vertquad[3][0] - vertquad_list[j][3][0]) > NifOp.props.epsilon: continue
-                                if abs(vertquad[3][1] - vertquad_list[j][3][1]) > NifOp.props.epsilon: continue
-                                if abs(vertquad[3][2] - vertquad_list[j][3][2]) > NifOp.props.epsilon: continue
-                                if abs(vertquad[3][3] - vertquad_list[j][3][3]) > NifOp.props.epsilon: continue
-                            # all tests passed: so yes, we already have it!
-                            f_index[i] = j
-                            break
-
-                    if f_index[i] > 65535:
-                        raise nif_utils.NifError(
-                            "ERROR%t|Too many vertices. Decimate your mesh"
-                            " and try again.")
-                    if (f_index[i] == len(vertquad_list)):
-                        # first: add it to the vertex map
-                        if not vertmap[vertex_index]:
-                            vertmap[vertex_index] = []
-                        vertmap[vertex_index].append(len(vertquad_list))
-                        # new (vert, uv-vert, normal, vcol) quad: add it
-                        vertquad_list.append(vertquad)
-                        # add the vertex
-                        vertlist.append(vertquad[0])
-                        if mesh_hasnormals: normlist.append(vertquad[2])
-                        if mesh_hasvcol:    vcollist.append(vertquad[3])
-                        if mesh_uvlayers:   uvlist.append(vertquad[1])
-
-                # now add the (hopefully, convex) face, in triangles
-                for i in range(f_numverts - 2):
-                    if ((b_obj.scale.x + b_obj.scale.y + b_obj.scale.z) > 0):
-                        f_indexed = (f_index[0], f_index[1+i], f_index[2+i])
-                    else:
-                        f_indexed = (f_index[0], f_index[2+i], f_index[1+i])
-                    trilist.append(f_indexed)
-                    # add body part number
-                    if (NifOp.props.game not in ('FALLOUT_3','SKYRIM')
-                        or not bodypartgroups):
-                        # TODO: or not self.EXPORT_FO3_BODYPARTS):
-                        bodypartfacemap.append(0)
-                    else:
-                        for bodypartname, bodypartindex, bodypartverts in bodypartgroups:
-                            if (set(b_vert_index for b_vert_index in poly.vertices)
-                                <= bodypartverts):
-                                bodypartfacemap.append(bodypartindex)
-                                break
-                        else:
-                            # this signals an error
-                            polygons_without_bodypart.append(poly)
+            if (NifOp.props.game not in ('FALLOUT_3','SKYRIM')
+                or not bodypartgroups):
+                # TODO: or not self.EXPORT_FO3_BODYPARTS):
+                bodypartfacemap = [0] * len(trilist)
+            else:
+                # a face belongs to the first body part that has all its vertices
+                poly_indices, tri_polys = np.unique(tri_shape["polygons"], return_inverse=True)
+                loops, starts = mesh_utils.polygon_loops(
+                    mesh_arrays["loop_starts"], mesh_arrays["loop_totals"], poly_indices)
+                poly_bodyparts = mesh_utils.first_common_group(
+                    bodypart_masks, mesh_arrays["loop_vertices"][loops], starts)
+                for poly_index in poly_indices[poly_bodyparts < 0].tolist():
+                    # this signals an error
+                    polygons_without_bodypart.append(b_mesh.polygons[poly_index])
+                bodypartindices = np.array([bodypartindex for bodypartname, bodypartindex in bodypartgroups])
+                bodypartfacemap = bodypartindices[poly_bodyparts[tri_polys.reshape(-1)]].tolist()
 
             # check that there are no missing body part polygons
             if polygons_without_bodypart:
@@ -1072,6 +1031,8 @@ class MeshHelper():
             else:
                 tridata = self.nif_export.objecthelper.create_block("NiTriStripsData", b_obj)
             trishape.data = tridata
+            if data_key:
+                self.nif_export.dict_shape_datas[data_key] = tridata
 
             # flags
             if b_obj.niftools.consistency_flags in NifFormat.ConsistencyType._enumkeys:
@@ -1085,30 +1046,21 @@ class MeshHelper():
             tridata.num_vertices = len(vertlist)
             tridata.has_vertices = True
             tridata.vertices.update_size()
-            for i, v in enumerate(tridata.vertices):
-                v.x = vertlist[i][0]
-                v.y = vertlist[i][1]
-                v.z = vertlist[i][2]
+            for v, co in zip(tridata.vertices, vertlist.tolist()):
+                v.x, v.y, v.z = co
             tridata.update_center_radius()
 
             if mesh_hasnormals:
                 tridata.has_normals = True
                 tridata.normals.update_size()
-                for i, v in enumerate(tridata.normals):
-                    v.x = normlist[i][0]
-                    v.y = normlist[i][1]
-                    v.z = normlist[i][2]
+                for v, n in zip(tridata.normals, normlist.tolist()):
+                    v.x, v.y, v.z = n
 
             if mesh_hasvcol:
                 tridata.has_vertex_colors = True
                 tridata.vertex_colors.update_size()
-                for i, v in enumerate(tridata.vertex_colors):
-
-
-                    v.r = vcollist[i][0]
-                    v.g = vcollist[i][1]
-                    v.b = vcollist[i][2]
-                    v.a = vcollist[i][3]
+                for v, c in zip(tridata.vertex_colors, vcollist.tolist()):
+                    v.r, v.g, v.b, v.a = c
 
             if mesh_uvlayers:
                 tridata.num_uv_sets = len(mesh_uvlayers)
@@ -1120,25 +1072,18 @@ class MeshHelper():
                 tridata.has_uv = True
                 tridata.uv_sets.update_size()
                 for j, uvlayer in enumerate(mesh_uvlayers):
-                    for i, uv in enumerate(tridata.uv_sets[j]):
-                        if len(uvlist[i]) == 0: continue  # skip non-uv textures
-                        uv.u = uvlist[i][j][0]
-                        uv.v = 1.0 - uvlist[i][j][1] # opengl standard
+                    if uvlayer not in uv_layer_names: continue  # skip non-uv textures
+                    layer_uvs = uvlist[:, uv_layer_names.index(uvlayer)].tolist()
+                    for uv, (u, v) in zip(tridata.uv_sets[j], layer_uvs):
+                        uv.u = u
+                        uv.v = 1.0 - v # opengl standard
 
             # set triangles
             # stitch strips for civ4
             tridata.set_triangles(trilist,
                                  stitchstrips=NifOp.props.stitch_strips)
 
-            # update tangent space (as binary extra data only for Oblivion)
-            # for extra shader texture games, only export it if those
-            # textures are actually exported (civ4 seems to be consistent with
-            # not using tangent space on non shadered nifs)
-            if mesh_uvlayers and mesh_hasnormals:
-                if (NifOp.props.game in ('OBLIVION', 'FALLOUT_3', 'SKYRIM')
-                    or (NifOp.props.game in self.nif_export.texturehelper.USED_EXTRA_SHADER_TEXTURES)):
-                    trishape.update_tangent_space(
-                        as_extra=(NifOp.props.game == 'OBLIVION'))
+            self.export_tangent_space(trishape, mesh_uvlayers, mesh_hasnormals)
 
             # now export the vertex weights, if there are any
             vertgroups = {vertex_group.name
@@ -1163,15 +1108,13 @@ class MeshHelper():
                         else:
                             skininst = self.nif_export.objecthelper.create_block("NiSkinInstance", b_obj)
                         trishape.skin_instance = skininst
-                        for block in self.nif_export.dict_blocks:
-                            if isinstance(block, NifFormat.NiNode):
-                                if block.name.decode() == self.nif_export.objecthelper.get_full_name(armaturename):
-                                    skininst.skeleton_root = block
-                                    break
-                        else:
+                        skeleton_roots = self.nif_export.objecthelper.find_nodes(
+                            self.nif_export.objecthelper.get_full_name(armaturename))
+                        if not skeleton_roots:
                             raise nif_utils.NifError(
                                 "Skeleton root '%s' not found."
                                 % armaturename)
+                        skininst.skeleton_root = skeleton_roots[0]
 
                         # create skinning data and link it
                         skindata = self.nif_export.objecthelper.create_block("NiSkinData", b_obj)
@@ -1183,38 +1126,9 @@ class MeshHelper():
                         skindata.set_transform(
                             self.nif_export.objecthelper.get_object_matrix(b_obj, 'localspace').get_inverse())
                        
-                        # Vertex weights,  find weights and normalization factors
-                        vert_list = {}
-                        vert_norm = {}
-                        unassigned_verts = []
-                                                
-                        for bone_group in boneinfluences:
-                            b_list_weight = []
-                            b_vert_group = b_obj.vertex_groups[bone_group]
-                            
-                            for b_vert in b_obj.data.vertices:
-                                if len(b_vert.groups) == 0: #check vert has weight_groups
-                                    unassigned_verts.append(b_vert)
-                                    continue
-                                
-                                for g in b_vert.groups:
-                                    if b_vert_group.name in boneinfluences:
-                                        if g.group == b_vert_group.index:
-                                            b_list_weight.append((b_vert.index, g.weight))
-                                            break
-                                                
-                            vert_list[bone_group] = b_list_weight             
-                            
-                            #create normalisation groupings
-                            for v in vert_list[bone_group]:
-                                if v[0] in vert_norm:
-                                    vert_norm[v[0]] += v[1]
-                                else:
-                                    vert_norm[v[0]] = v[1]
-                        
                         # vertices must be assigned at least one vertex group
                         # lets be nice and display them for the user 
-                        if len(unassigned_verts) > 0:
+                        if not np.all(np.bincount(vertex_weights[0], minlength=len(b_mesh.vertices))):
                             for b_scene_obj in bpy.context.scene.objects:
                                 b_scene_obj.select = False
                                 
@@ -1234,55 +1148,43 @@ class MeshHelper():
                                 " in the mesh so they can easily be"
                                 " identified.")
                         
-                        
+                        # Vertex weights, normalised over all bones, for
+                        # each nif vertex of the blender vertices
+                        skin_bones, skin_verts, skin_weights = mesh_utils.skin_weights(
+                            vertex_weights[0], vertex_weights[1], vertex_weights[2],
+                            [b_obj.vertex_groups[bone].index for bone in boneinfluences],
+                            tri_shape["vertices"])
+                        bone_starts = np.searchsorted(skin_bones, np.arange(len(boneinfluences) + 1))
+
                         # for each bone, first we get the bone block
                         # then we get the vertex weights
                         # and then we add it to the NiSkinData
-                        # note: allocate memory for faster performance
-                        vert_added = [False for i in range(len(vertlist))]
                         for bone_index, bone in enumerate(boneinfluences):
                             # find bone in exported blocks
-                            bone_block = None
-                            for block in self.nif_export.dict_blocks:
-                                if isinstance(block, NifFormat.NiNode):
-                                    if block.name.decode() == self.nif_export.objecthelper.get_full_name(bone):
-                                        if not bone_block:
-                                            bone_block = block
-                                        else:
-                                            raise nif_utils.NifError(
-                                                "multiple bones"
-                                                " with name '%s': probably"
-                                                " you have multiple armatures,"
-                                                " please parent all meshes"
-                                                " to a single armature"
-                                                " and try again"
-                                                % bone)
+                            bone_blocks = self.nif_export.objecthelper.find_nodes(
+                                self.nif_export.objecthelper.get_full_name(bone))
+                            if len(bone_blocks) > 1:
+                                raise nif_utils.NifError(
+                                    "multiple bones"
+                                    " with name '%s': probably"
+                                    " you have multiple armatures,"
+                                    " please parent all meshes"
+                                    " to a single armature"
+                                    " and try again"
+                                    % bone)
                             
-                            if not bone_block:
+                            if not bone_blocks:
                                 raise nif_utils.NifError(
                                     "Bone '%s' not found." % bone)
                             
                             # find vertex weights
-                            vert_weights = {}
-                            for v in vert_list[bone]:
-                                # v[0] is the original vertex index
-                                # v[1] is the weight
-
-                                # vertmap[v[0]] is the set of vertices (indices)
-                                # to which v[0] was mapped
-                                # so we simply export the same weight as the
-                                # original vertex for each new vertex
-
-                                # write the weights
-                                # extra check for multi material meshes
-                                if vertmap[v[0]] and vert_norm[v[0]]:
-                                    for vert_index in vertmap[v[0]]:
-                                        vert_weights[vert_index] = v[1] / vert_norm[v[0]]
-                                        vert_added[vert_index] = True
+                            bone_slice = slice(bone_starts[bone_index], bone_starts[bone_index + 1])
+                            vert_weights = dict(zip(skin_verts[bone_slice].tolist(),
+                                                    skin_weights[bone_slice].tolist()))
                             # add bone as influence, but only if there were
                             # actually any vertices influenced by the bone
                             if vert_weights:
-                                trishape.add_bone(bone_block, vert_weights)
+                                trishape.add_bone(bone_blocks[0], vert_weights)
 
                         # update bind position skinning data
                         trishape.update_bind_position()
@@ -1332,10 +1234,6 @@ class MeshHelper():
                                         s_part.part_flag.pf_start_net_boneset = b_part.pf_startflag
                                         s_part.part_flag.pf_editor_visible = b_part.pf_editorflag
 
-                        # clean up
-                        del vert_weights
-                        del vert_added
-
 
             # shape key morphing
             key = b_mesh.shape_keys
@@ -1467,6 +1365,33 @@ class MeshHelper():
                         tridata.consistency_flags = b_obj.niftools.consistency_flags
 
 
+    def get_shape_data_key(self, b_obj, trishape, materialIndex, mesh_hasnormals):
+        """Key under which the shape data exported for a material of b_obj
+        can be shared with other objects, or None if it cannot be shared.
+
+        Skinned and morphed meshes are never shared, as their data depends
+        on the object's vertex groups and controllers."""
+        b_mesh = b_obj.data
+        if b_mesh.shape_keys:
+            return None
+        if b_obj.parent and b_obj.parent.type == 'ARMATURE':
+            return None
+        # mirrored objects have their triangles flipped
+        mirrored = (b_obj.scale.x + b_obj.scale.y + b_obj.scale.z) <= 0
+        return (b_mesh.name, materialIndex, trishape.__class__, mesh_hasnormals,
+                mirrored, b_obj.niftools.consistency_flags)
+
+    def export_tangent_space(self, trishape, mesh_uvlayers, mesh_hasnormals):
+        # update tangent space (as binary extra data only for Oblivion)
+        # for extra shader texture games, only export it if those
+        # textures are actually exported (civ4 seems to be consistent with
+        # not using tangent space on non shadered nifs)
+        if mesh_uvlayers and mesh_hasnormals:
+            if (NifOp.props.game in ('OBLIVION', 'FALLOUT_3', 'SKYRIM')
+                or (NifOp.props.game in self.nif_export.texturehelper.USED_EXTRA_SHADER_TEXTURES)):
+                trishape.update_tangent_space(
+                    as_extra=(NifOp.props.game == 'OBLIVION'))
+
     def smooth_mesh_seams(self, b_objs):
         # get shared vertices
         NifLog.info("Smoothing seams between objects...")
@@ -37,12 +37,41 @@
 #
 # ***** END LICENSE BLOCK *****
 
+import os
+
 import bpy
 from bpy_extras.io_utils import ImportHelper
 
 from .nif_common_op import NifOperatorCommon
 
 from io_scene_nif import nif_import
+from io_scene_nif.io.kf import KFFile
+
+#: Enum items of the sequences of the last listed keyframe file, keyed by
+#: path and modification time; blender needs the items to stay referenced.
+_keyframe_sequence_items = {}
+
+
+def get_keyframe_sequence_items(operator, context):
+    """Enum items for the sequences in the keyframe file of the operator."""
+    file_path = bpy.path.abspath(operator.keyframe_file)
+    try:
+        key = (file_path, os.path.getmtime(file_path))
+    except OSError:
+        return []
+    if key not in _keyframe_sequence_items:
+        try:
+            names = KFFile.list_sequences(file_path)
+        except Exception:
+            names = []
+        # identifiers must be unique
+        names = [name for index, name in enumerate(names) if name not in names[:index]]
+        # flag enums hold at most 32 items
+        _keyframe_sequence_items.clear()
+        _keyframe_sequence_items[key] = [
+            (name, name, "Import sequence {0}.".format(name), 1 << index)
+            for index, name in enumerate(names[:32])]
+    return _keyframe_sequence_items[key]
 
 class NifImportOperator(bpy.types.Operator, ImportHelper, NifOperatorCommon):
     """Operator for loading a nif file."""
@@ -74,6 +103,13 @@ class NifImportOperator(bpy.types.Operator, ImportHelper, NifOperatorCommon):
         default="",
         subtype="FILE_PATH")
 
+    #: Sequences of the keyframe file to import, none for all.
+    keyframe_sequences = bpy.props.EnumProperty(
+        items=get_keyframe_sequence_items,
+        name="Keyframe Sequences",
+        description="Sequences of the keyframe file to import, each into its own action; none selected imports all.",
+        options={'ENUM_FLAG'})
+
     #: FaceGen EGM file for morphs.
     egm_file = bpy.props.StringProperty(
         name="FaceGen EGM File",
@@ -88,6 +124,35 @@ class NifImportOperator(bpy.types.Operator, ImportHelper, NifOperatorCommon):
         description="Import animation.",
         default=False)
 
+    #: Remove redundant animation keys.
+    animation_key_reduction = bpy.props.EnumProperty(
+        items=(
+            ("NONE", "None",
+             "Keep all keys."),
+            ("LOSSLESS", "Lossless",
+             "Remove keys that are on a straight line between their neighbours, such as constant keys, or equal to the key before them for stepped keys. Bezier keys are kept."),
+            ("LOSSY", "Lossy",
+             "Remove keys that are within the tolerance of the remaining keys."),
+            ),
+        name="Key Reduction",
+        description="Remove redundant animation keys.",
+        default="NONE")
+
+    #: Largest change in location and scale of lossy key reduction.
+    animation_key_tolerance = bpy.props.FloatProperty(
+        name="Key Tolerance",
+        description="Largest change in location and scale of lossy key reduction.",
+        default=0.001,
+        min=0.0, max=1.0, precision=4)
+
+    #: Largest change in rotation of lossy key reduction.
+    animation_key_angle_tolerance = bpy.props.FloatProperty(
+        name="Key Angle Tolerance",
+        description="Largest change in rotation of lossy key reduction.",
+        default=0.001,
+        min=0.0, max=0.1, precision=4,
+        subtype="ANGLE")
+
     #: Merge skeleton roots.
     merge_skeleton_roots = bpy.props.BoolProperty(
         name="Merge Skeleton Roots",
@@ -139,6 +204,8 @@ class NifImportOperator(bpy.types.Operator, ImportHelper, NifOperatorCommon):
              "Import skeleton only and make it parent of selected geometry."),
             ("GEOMETRY_ONLY", "Geometry Only",
              "Import geometry only and parent them to selected skeleton."),
+            ("COLLISION_ONLY", "Collision Only",
+             "Import nodes and havok collisions only."),
             ),
         name="Process",
         description="Parts of nif to be imported.",
@@ -155,7 +222,28 @@ class NifImportOperator(bpy.types.Operator, ImportHelper, NifOperatorCommon):
         name="Combine Vertices",
         description="Merge vertices that have identical location and normal values.",
         default=False)
-    
+
+    #: Memory map large nif files instead of reading them through a buffered stream.
+    use_mmap = bpy.props.BoolProperty(
+        name="Memory Map Large Files",
+        description="Memory map large nif files instead of reading them through a buffered stream.",
+        default=True)
+
+    #: Directory for caching parsed files, empty to disable the cache.
+    cache_dir = bpy.props.StringProperty(
+        name="Cache Directory",
+        description="Directory for caching parsed nif, kf and egm files, leave empty to disable the cache.",
+        maxlen=1024,
+        default="",
+        subtype="DIR_PATH")
+
+    #: Maximum size of the cache in megabytes.
+    cache_size = bpy.props.IntProperty(
+        name="Cache Size",
+        description="Maximum size of the cache directory in megabytes, least recently used files are removed first.",
+        default=1024,
+        min=1, max=1024 * 1024)
+
 
     def execute(self, context):
         """Execute the import operators: first constructs a
@@ -0,0 +1,249 @@
+''' Nif Utilities, index of the blocks of a nif tree'''
+
+
+# ***** BEGIN LICENSE BLOCK *****
+# 
+# Copyright © 2005-2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+# 
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+# 
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+from pyffi.formats.nif import NifFormat
+
+
+class BlockIndex():
+    """Index of all blocks reachable from a list of roots, built in a single
+    pass over the tree, so that importers can look blocks up by type, by
+    name, or by scene graph parent without walking the tree again.
+
+    Blocks are listed once, in the order that :meth:`NifFormat.NiObject.tree`
+    first yields them, so each subtree is a contiguous range of the list. A
+    block that is referenced from several places is listed in the range of
+    the first one only, and its scene graph parent is the first node that
+    lists it as a child; the subtree queries also visit it, and everything
+    below it, through the other references.
+    """
+
+    def __init__(self, roots=()):
+        # all blocks, in tree order
+        self.blocks = []
+        # position of each block in self.blocks
+        self.positions = {}
+        # end of the subtree of each block in self.blocks
+        self.ends = {}
+        # exact block type -> blocks
+        self.blocks_by_type = {}
+        # block name -> blocks
+        self.blocks_by_name = {}
+        # scene graph parent and depth of each node, as set by set_parents
+        self.parents = {}
+        self.depths = {}
+        # queried block type -> blocks, including subclasses
+        self._blocks_by_query = {}
+        # root -> block name -> first block of that name below root
+        self._names_by_root = {}
+        # block -> blocks it references that are listed under another block
+        self.shared_refs = {}
+        # block -> controller type -> first controller of that type
+        self._controllers = {}
+        # root -> blocks below root that are listed under another block
+        self._shared_by_root = {}
+        self.roots = []
+        for root in roots:
+            self.add_root(root)
+
+    def add_root(self, root):
+        """Index all blocks below root that are not indexed yet."""
+        self.roots.append(root)
+        self._blocks_by_query = {}
+        self._names_by_root = {}
+        self._shared_by_root = {}
+        if root in self.positions:
+            return
+        self.parents[root] = None
+        self.depths[root] = 0
+        # entries are (block, referrer), or (block, None) once the subtree
+        # of block is done
+        stack = [(root, root)]
+        while stack:
+            block, referrer = stack.pop()
+            if referrer is None:
+                self.ends[block] = len(self.blocks)
+                continue
+            if (block not in self.parents and isinstance(referrer, NifFormat.NiNode)
+                    and block in referrer.children):
+                self.parents[block] = referrer
+                self.depths[block] = self.depths[referrer] + 1
+            if block in self.positions:
+                # already listed, through an earlier reference
+                self.shared_refs.setdefault(referrer, []).append(block)
+                continue
+            self.positions[block] = len(self.blocks)
+            self.blocks.append(block)
+            self.blocks_by_type.setdefault(block.__class__, []).append(block)
+            name = getattr(block, "name", None)
+            if name:
+                self.blocks_by_name.setdefault(name, []).append(block)
+            stack.append((block, None))
+            # push in reverse, so children are visited in order
+            for child in reversed(block.get_refs()):
+                stack.append((child, block))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get_blocks(self, block_type=None, root=None):
+        """Return the blocks of block_type, including subclasses, in tree
+        order; if root is given, only those in its subtree."""
+        if block_type is None:
+            blocks = self.blocks
+        else:
+            blocks = self._blocks_by_query.get(block_type)
+            if blocks is None:
+                blocks = [block for cls, cls_blocks in self.blocks_by_type.items()
+                          if issubclass(cls, block_type)
+                          for block in cls_blocks]
+                blocks.sort(key=self.positions.__getitem__)
+                self._blocks_by_query[block_type] = blocks
+        if root is None:
+            return blocks
+        return [block for block in blocks if self.is_in_subtree(block, root)]
+
+    def find(self, block_name=None, block_type=None, root=None):
+        """Return the first block with block_name and of block_type,
+        optionally in the subtree of root, or None, like
+        :meth:`NifFormat.NiObject.find`. Names can be bytes or str."""
+        if isinstance(block_name, str):
+            block_name = block_name.encode()
+        if block_name and root is not None and not block_type:
+            return self.get_names(root).get(block_name)
+        if block_name:
+            blocks = self.blocks_by_name.get(block_name, ())
+        else:
+            blocks = self.get_blocks(block_type)
+        for block in blocks:
+            if block_type and not isinstance(block, block_type):
+                continue
+            if root is not None and not self.is_in_subtree(block, root):
+                continue
+            return block
+        return None
+
+    def get_names(self, root):
+        """Return a dictionary from block name to the first block of that
+        name in the subtree of root, built once per root, so that merging
+        several kf files onto the same root does a single pass."""
+        names = self._names_by_root.get(root)
+        if names is None:
+            names = {}
+            if root not in self.positions:
+                self.add_root(root)
+            for block in self.get_subtree(root):
+                name = getattr(block, "name", None)
+                if name and name not in names:
+                    names[name] = block
+            self._names_by_root[root] = names
+        return names
+
+    def find_controller(self, block, controller_type):
+        """Return the first controller of controller_type on block, or None,
+        like :func:`nif_utils.find_controller`, remembering the result."""
+        controllers = self._controllers.setdefault(block, {})
+        if controller_type not in controllers:
+            ctrl = block.controller
+            while ctrl and not isinstance(ctrl, controller_type):
+                ctrl = ctrl.next_controller
+            controllers[controller_type] = ctrl
+        return controllers[controller_type]
+
+    def add_controller(self, block, controller):
+        """Add controller to block, keeping the controller lookups up to
+        date."""
+        block.add_controller(controller)
+        self._controllers.pop(block, None)
+
+    def get_subtree(self, root):
+        """Return root and all blocks below it, in index order."""
+        if root not in self.positions:
+            self.add_root(root)
+        blocks = self.blocks[self.positions[root]:self.ends[root]]
+        shared = self.get_shared(root)
+        if shared:
+            blocks = sorted(blocks + list(shared), key=self.positions.__getitem__)
+        return blocks
+
+    def get_shared(self, root):
+        """Return the set of blocks below root that are listed under
+        another block, because root reaches them through a later
+        reference."""
+        shared = self._shared_by_root.get(root)
+        if shared is None:
+            shared = set()
+            start, end = self.positions[root], self.ends[root]
+            pending = [block for block in self.shared_refs
+                       if start <= self.positions[block] < end]
+            while pending:
+                for ref in self.shared_refs.get(pending.pop(), ()):
+                    if start <= self.positions[ref] < end or ref in shared:
+                        continue
+                    for block in self.blocks[self.positions[ref]:self.ends[ref]]:
+                        if block not in shared:
+                            shared.add(block)
+                            if block in self.shared_refs:
+                                pending.append(block)
+            self._shared_by_root[root] = shared
+        return shared
+
+    def is_in_subtree(self, block, root):
+        """Whether block is root itself or below root, False if block is
+        not indexed."""
+        if root not in self.positions:
+            # not reachable from the roots, such as a skeleton root that
+            # is only linked by pointer
+            self.add_root(root)
+        position = self.positions.get(block)
+        if position is None:
+            return False
+        if self.positions[root] <= position < self.ends[root]:
+            return True
+        return block in self.get_shared(root)
+
+    def get_parent(self, block):
+        """Return the scene graph parent of a node, None for a root or a
+        block that is not indexed."""
+        return self.parents.get(block)
+
+    def get_depth(self, block):
+        """Return the number of scene graph ancestors of a node, None for a
+        block that is not indexed."""
+        return self.depths.get(block)
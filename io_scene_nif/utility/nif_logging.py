@@ -38,6 +38,7 @@
 # ***** END LICENSE BLOCK *****
 
 import logging
+import threading
 
 class _MockOperator():
     def report(self, level, message):
@@ -49,20 +50,45 @@ class NifLog():
     # Injectable operator reference used to perform reporting, default to simple logging
     op = _MockOperator()
 
+    # Reports made by worker threads, see flush
+    _pending = []
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _report(level, message):
+        """Report through the operator, which is only safe to use from the
+        main thread; reports from other threads are queued until
+        :meth:`flush` is called."""
+        if threading.current_thread() is threading.main_thread():
+            NifLog.op.report(level, message)
+        else:
+            with NifLog._lock:
+                NifLog._pending.append((level, message))
+
+    @staticmethod
+    def flush():
+        """Report all messages queued by worker threads. To be called from
+        the main thread."""
+        with NifLog._lock:
+            pending = NifLog._pending
+            NifLog._pending = []
+        for level, message in pending:
+            NifLog.op.report(level, message)
+
     @staticmethod
     def debug(message):
         """Report a debug message."""
-        NifLog.op.report({'DEBUG'}, message)
+        NifLog._report({'DEBUG'}, message)
 
     @staticmethod
     def info(message):
         """Report an informative message."""
-        NifLog.op.report({'INFO'}, message)
+        NifLog._report({'INFO'}, message)
 
     @staticmethod
     def warn(message):
         """Report a warning message."""
-        NifLog.op.report({'WARNING'}, message)
+        NifLog._report({'WARNING'}, message)
 
     @staticmethod
     def error(message):
@@ -77,7 +103,7 @@ class NifLog():
 
             The :ref:`error reporting <dev-design-error-reporting>` design.
         """
-        NifLog.op.report({'ERROR'}, message)
+        NifLog._report({'ERROR'}, message)
         return {'FINISHED'}
     
     @staticmethod
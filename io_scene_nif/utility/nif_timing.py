@@ -0,0 +1,77 @@
+''' Nif Utilities, stores timings of the import and export stages'''
+
+# ***** BEGIN LICENSE BLOCK *****
+# 
+# Copyright © 2005-2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+# 
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+# 
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from io_scene_nif.utility.nif_logging import NifLog
+
+class NifTiming():
+    """Collects the time spent in each stage of an import or export, so it
+    can be reported once at the end."""
+
+    # Total seconds and number of calls per stage, in order of first use
+    stages = OrderedDict()
+
+    @staticmethod
+    def reset():
+        NifTiming.stages = OrderedDict()
+
+    @staticmethod
+    @contextmanager
+    def stage(name):
+        """Time the enclosed block, adding it to the stage name::
+
+            with NifTiming.stage("UV layer {0}".format(uvlayer)):
+                ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            total, count = NifTiming.stages.get(name, (0.0, 0))
+            NifTiming.stages[name] = (total + elapsed, count + 1)
+
+    @staticmethod
+    def report():
+        """Report the time of all stages."""
+        for name, (total, count) in NifTiming.stages.items():
+            NifLog.info("Timing: {0}: {1:.3f}s ({2} calls)".format(name, total, count))
@@ -0,0 +1,93 @@
+''' Nif Utilities, stores the worker pool for work that does not need bpy'''
+
+# ***** BEGIN LICENSE BLOCK *****
+# 
+# Copyright © 2005-2016, NIF File Format Library and Tools contributors.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+# 
+#    * Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials provided
+#      with the distribution.
+# 
+#    * Neither the name of the NIF File Format Library and Tools
+#      project nor the names of its contributors may be used to endorse
+#      or promote products derived from this software without specific
+#      prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# ***** END LICENSE BLOCK *****
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from io_scene_nif.utility.nif_logging import NifLog
+
+class NifWorkers():
+    """Holds a pool of worker threads shared by the code base, for work that
+    does not touch bpy, such as parsing files.
+
+    Note that pure python work still runs under the global interpreter lock,
+    so the gain comes from overlapping file reads, decompression and other
+    work that releases it. Messages logged by workers through
+    :class:`NifLog` are reported once their result is fetched.
+    """
+
+    #: Number of worker threads.
+    max_workers = 4
+
+    _executor = None
+
+    @staticmethod
+    def submit(func, *args, **kwargs):
+        """Schedule func(*args, **kwargs) and return its
+        :class:`~concurrent.futures.Future`."""
+        if NifWorkers._executor is None:
+            NifWorkers._executor = ThreadPoolExecutor(max_workers=NifWorkers.max_workers)
+        return NifWorkers._executor.submit(func, *args, **kwargs)
+
+    @staticmethod
+    def result(future):
+        """Wait for future and return its result, raising any exception of
+        the call, after reporting the messages logged by the workers. To be
+        called from the main thread."""
+        try:
+            return future.result()
+        finally:
+            NifLog.flush()
+
+    @staticmethod
+    def finish(futures):
+        """Cancel the futures that have not started yet and wait for the
+        others, discarding their results, then report the messages logged
+        by the workers, so none of them is left over for a later call. To
+        be called from the main thread."""
+        try:
+            wait([future for future in futures if not future.cancel()])
+        finally:
+            NifLog.flush()
+
+    @staticmethod
+    def shutdown():
+        """Stop the worker threads, they are restarted on the next submit."""
+        if NifWorkers._executor is not None:
+            NifWorkers._executor.shutdown()
+            NifWorkers._executor = None
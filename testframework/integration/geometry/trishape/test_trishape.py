@@ -37,9 +37,13 @@
 #
 # ***** END LICENSE BLOCK *****
 
+import os
+
 import bpy
 import nose.tools
 
+from pyffi.formats.nif import NifFormat
+
 from integration import Base
 from integration import SingleNif
 from integration.data import gen_data 
@@ -77,6 +81,108 @@ class TestTriShape(SingleNif):
         n_trishape = self.n_data.roots[0].children[0]
         n_gen_geometry.n_check_trishape(n_trishape)
 
+class TestSharedTriShape(SingleNif):
+    """Test geometry shared by two blender objects."""
+
+    n_name = 'geometry/trishape/test_shared_trishape' # (documented in base class)
+    b_name = 'Cube'
+    b_name_shared = 'CubeShared'
+
+    def b_create_header(self):
+        self.n_game = 'OBLIVION'
+
+    def b_create_data(self):
+        # (documented in base class)
+        b_obj = b_gen_geometry.b_create_cube(self.b_name)
+        b_obj_shared = bpy.data.objects.new(self.b_name_shared, b_obj.data)
+        b_obj_shared.location = (0, 10, 0)
+        bpy.context.scene.objects.link(b_obj_shared)
+
+    def b_check_data(self):
+        b_obj = bpy.data.objects[self.b_name]
+        b_obj_shared = bpy.data.objects[self.b_name_shared]
+        nose.tools.assert_equal(b_obj.data, b_obj_shared.data)
+
+    def n_create_header(self):
+        gen_data.n_create_header_oblivion(self.n_data)
+
+    def n_create_data(self):
+        n_gen_geometry.n_create_blocks(self.n_data)
+        n_ninode = self.n_data.roots[0]
+        n_trishape = n_ninode.children[0]
+        n_trishape_shared = NifFormat.NiTriShape()
+        n_trishape_shared.name = self.b_name_shared.encode()
+        n_trishape_shared.flags = n_trishape.flags
+        n_trishape_shared.rotation.set_identity()
+        n_trishape_shared.translation.y = 10
+        n_trishape_shared.scale = 1
+        n_trishape_shared.data = n_trishape.data
+        n_ninode.num_children = 2
+        n_ninode.children.update_size()
+        n_ninode.children[0] = n_trishape
+        n_ninode.children[1] = n_trishape_shared
+        return self.n_data
+
+    def n_check_data(self):
+        n_trishapes = [n_block for n_block in self.n_data.roots[0].tree()
+                       if isinstance(n_block, NifFormat.NiTriShape)]
+        nose.tools.assert_equal(len(n_trishapes), 2)
+        nose.tools.assert_is(n_trishapes[0].data, n_trishapes[1].data)
+
+class TestSharedTriShapeInGroup(Base):
+    """Test a shape that shares its data with a child of a grouping node:
+    the grouped mesh has the child's transform applied and also holds the
+    other children, so it must not be shared."""
+
+    n_filepath = "integration/gen/nif/geometry/trishape/test_shared_trishape_in_group.nif"
+
+    def setup(self):
+        n_data = NifFormat.Data()
+        gen_data.n_create_header_oblivion(n_data)
+        n_gen_geometry.n_create_blocks(n_data)
+        n_root = n_data.roots[0]
+        n_trishape = n_root.children[0]
+        n_trishape.name = b'Standalone'
+        # the grouping node joins the children whose name contains its own
+        n_group = NifFormat.NiNode()
+        n_group.name = b'Group'
+        n_group.flags = n_root.flags
+        n_group.rotation.set_identity()
+        n_group.scale = 1
+        n_group.num_children = 2
+        n_group.children.update_size()
+        for i in range(2):
+            n_child = NifFormat.NiTriShape()
+            n_child.name = ("Group:%i" % i).encode()
+            n_child.flags = n_trishape.flags
+            n_child.rotation.set_identity()
+            n_child.translation.x = 10 * i
+            n_child.scale = 1
+            n_child.data = n_trishape.data
+            n_group.children[i] = n_child
+        n_root.num_children = 2
+        n_root.children.update_size()
+        n_root.children[0] = n_group
+        n_root.children[1] = n_trishape
+        directory = os.path.dirname(self.n_filepath)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.n_filepath, "wb") as stream:
+            n_data.write(stream)
+
+    def test_import(self):
+        bpy.ops.import_scene.nif(
+            filepath=self.n_filepath,
+            log_level='DEBUG',
+            combine_shapes=True,
+            )
+        b_group = bpy.data.objects["Group"]
+        b_standalone = bpy.data.objects["Standalone"]
+        nose.tools.assert_not_equal(b_group.data, b_standalone.data)
+        # both children are in the group mesh, and only the cube in the other
+        nose.tools.assert_equal(len(b_group.data.vertices), 16)
+        nose.tools.assert_equal(len(b_standalone.data.vertices), 8)
+
 class TestNonUniformlyScaled(Base):
     def setup(self):
         # create a non-uniformly scaled cube
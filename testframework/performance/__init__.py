@@ -0,0 +1,50 @@
+"""Package for performance benchmarks of the blender nif scripts.
+
+Benchmarks are plain scripts rather than nose tests, so they are not picked
+up by a normal test run. Run them one at a time, for instance::
+
+    python -m performance.perf_nif_load
+
+from within the ``blender_nif_plugin/testframework/`` folder. Benchmarks that
+touch ``bpy`` must be run through blender, just like the tests.
+"""
+
+import gc
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+def peak_rss():
+    """Peak resident set size of this process in kilobytes, or None if it
+    cannot be determined on this platform."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def time_call(func, *args, repeat=3, **kwargs):
+    """Call func repeat times and return (best wall time, last result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def report(title, rows):
+    """Print a simple table of (label, value, ...) rows."""
+    print(title)
+    print("-" * len(title))
+    for row in rows:
+        print("  ".join("{0:>14}".format(str(col)) for col in row))
+    print()
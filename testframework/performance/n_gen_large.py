@@ -0,0 +1,122 @@
+"""Generates synthetic large nif files for the performance benchmarks."""
+
+import math
+
+from pyffi.formats.nif import NifFormat
+
+OB_VER = 335544325
+FO3_VER = 335675399
+BETH_UV = 11
+BETH_UV2_FO3 = 34
+
+
+def n_create_large_mesh(num_shapes=4, verts_per_shape=100000, version=FO3_VER):
+    """Create nif data holding num_shapes NiTriShapes under a NiNode root,
+    each shape being a grid of roughly verts_per_shape vertices."""
+    n_data = NifFormat.Data(version=version, user_version=BETH_UV,
+                            user_version_2=BETH_UV2_FO3 if version == FO3_VER else BETH_UV)
+    n_data.header.endian_type = NifFormat.EndianType.ENDIAN_LITTLE
+    n_root = NifFormat.NiNode()
+    n_root.name = b'Scene Root'
+    n_root.scale = 1.0
+    n_root.rotation.set_identity()
+    n_root.num_children = num_shapes
+    n_root.children.update_size()
+    side = max(2, int(math.sqrt(verts_per_shape)))
+    for shape_index in range(num_shapes):
+        n_shape = NifFormat.NiTriShape()
+        n_shape.name = ('Shape%i' % shape_index).encode()
+        n_shape.scale = 1.0
+        n_shape.rotation.set_identity()
+        n_shape.data = n_create_grid_data(side, float(shape_index))
+        n_root.children[shape_index] = n_shape
+    n_data.roots = [n_root]
+    return n_data
+
+
+def n_create_grid_data(side, height):
+    """Create NiTriShapeData for a side x side vertex grid."""
+    n_shapedata = NifFormat.NiTriShapeData()
+    n_shapedata.has_vertices = True
+    n_shapedata.has_normals = True
+    n_shapedata.num_vertices = side * side
+    n_shapedata.vertices.update_size()
+    n_shapedata.normals.update_size()
+    for index, (n_vert, n_norm) in enumerate(zip(n_shapedata.vertices, n_shapedata.normals)):
+        n_vert.x = float(index % side)
+        n_vert.y = float(index // side)
+        n_vert.z = height
+        n_norm.z = 1.0
+    triangles = []
+    for row in range(side - 1):
+        for col in range(side - 1):
+            v0 = row * side + col
+            triangles.append((v0, v0 + 1, v0 + side))
+            triangles.append((v0 + 1, v0 + side + 1, v0 + side))
+    n_shapedata.set_triangles(triangles)
+    n_shapedata.update_center_radius()
+    return n_shapedata
+
+
+def n_write(n_data, n_filepath):
+    """Write a nif file from data."""
+    with open(n_filepath, "wb") as stream:
+        n_data.write(stream)
+
+
+def n_create_skeleton(num_bones=240, num_skins=8, bones_per_skin=40, version=FO3_VER):
+    """Create nif data holding a skeleton of num_bones NiNodes, as a chain
+    of limbs under a Bip01 root, with num_skins skinned NiTriShapes each
+    using bones_per_skin of the bones."""
+    n_data = NifFormat.Data(version=version, user_version=BETH_UV,
+                            user_version_2=BETH_UV2_FO3 if version == FO3_VER else BETH_UV)
+    n_data.header.endian_type = NifFormat.EndianType.ENDIAN_LITTLE
+    n_root = NifFormat.NiNode()
+    n_root.name = b'Scene Root'
+    n_skelroot = n_create_node(b'Bip01')
+    n_add_children(n_root, [n_skelroot])
+    n_bones = []
+    # limbs of 10 bones each
+    for limb_index in range(num_bones // 10):
+        n_parent = n_skelroot
+        for bone_index in range(10):
+            n_bone = n_create_node(('Bip01 Limb%i Bone%i' % (limb_index, bone_index)).encode())
+            n_add_children(n_parent, [n_bone])
+            n_bones.append(n_bone)
+            n_parent = n_bone
+    n_shapes = []
+    for shape_index in range(num_skins):
+        n_shape = NifFormat.NiTriShape()
+        n_shape.name = ('Skin%i' % shape_index).encode()
+        n_shape.rotation.set_identity()
+        n_shape.scale = 1.0
+        n_shape.data = n_create_grid_data(4, float(shape_index))
+        n_skininst = NifFormat.NiSkinInstance()
+        n_skininst.skeleton_root = n_skelroot
+        n_skininst.data = NifFormat.NiSkinData()
+        n_shape_bones = n_bones[shape_index * bones_per_skin % len(n_bones):][:bones_per_skin]
+        n_skininst.num_bones = len(n_shape_bones)
+        n_skininst.bones.update_size()
+        for i, n_bone in enumerate(n_shape_bones):
+            n_skininst.bones[i] = n_bone
+        n_shape.skin_instance = n_skininst
+        n_shapes.append(n_shape)
+    n_add_children(n_root, n_shapes)
+    n_data.roots = [n_root]
+    return n_data
+
+
+def n_create_node(name):
+    n_node = NifFormat.NiNode()
+    n_node.name = name
+    n_node.scale = 1.0
+    n_node.rotation.set_identity()
+    return n_node
+
+
+def n_add_children(n_node, n_children):
+    num_children = n_node.num_children
+    n_node.num_children = num_children + len(n_children)
+    n_node.children.update_size()
+    for i, n_child in enumerate(n_children):
+        n_node.children[num_children + i] = n_child
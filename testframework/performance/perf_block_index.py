@@ -0,0 +1,142 @@
+"""Counts the tree traversals of the import helpers on a skeleton nif, with
+and without the block index.
+
+Does not need blender::
+
+    python -m performance.perf_block_index [num_bones]
+
+The helpers themselves need blender, so their tree access patterns are
+replayed here: three typed walks per root for the frame rate, one walk per
+skinned shape when marking bones, one find per controlled block of a kf
+covering every bone, and the recursive parent and bone marking passes.
+"""
+
+import sys
+
+from pyffi.formats.nif import NifFormat
+
+from performance import report, time_call
+from performance import n_gen_large
+
+
+class RefCounter:
+    """Counts get_refs calls, that is, blocks visited by tree walks."""
+
+    def __init__(self):
+        self.count = 0
+        self.originals = {}
+
+    def __enter__(self):
+        for cls in NifFormat.__dict__.values():
+            if (isinstance(cls, type) and "get_refs" in cls.__dict__
+                    and cls not in self.originals):
+                self.originals[cls] = original = cls.__dict__["get_refs"]
+                setattr(cls, "get_refs", self.wrap(original))
+        return self
+
+    def wrap(self, original):
+        def get_refs(block, *args, **kwargs):
+            self.count += 1
+            return original(block, *args, **kwargs)
+        return get_refs
+
+    def __exit__(self, *exc_info):
+        for cls, original in self.originals.items():
+            setattr(cls, "get_refs", original)
+
+
+def walk_before(root, bone_names):
+    """The tree access of the import before the block index; returns the
+    number of walks."""
+    walks = 0
+    # get_frames_per_second
+    for block_type in (NifFormat.NiKeyframeData, NifFormat.NiBSplineInterpolator, NifFormat.NiUVData):
+        list(root.tree(block_type=block_type))
+        walks += 1
+    # set_parents
+    def set_parents(block):
+        if isinstance(block, NifFormat.NiNode):
+            for child in block.children:
+                if child:
+                    child._parent = block
+                    set_parents(child)
+    set_parents(root)
+    walks += 1
+    # mark_armatures_bones
+    def mark(block):
+        nonlocal walks
+        if isinstance(block, NifFormat.NiTriBasedGeom) and block.is_skin():
+            list(block.skin_instance.skeleton_root.tree())
+            walks += 1
+        for child in block.get_refs():
+            if isinstance(child, NifFormat.NiAVObject):
+                mark(child)
+    mark(root)
+    walks += 1
+    # import_kf_root
+    for bone_name in bone_names:
+        root.find(block_name=bone_name)
+        walks += 1
+    return walks
+
+
+def walk_after(root, bone_names):
+    """The same lookups through the block index; returns the number of
+    walks."""
+    from io_scene_nif.utility.nif_block_index import BlockIndex
+    block_index = BlockIndex([root])
+    for block_type in (NifFormat.NiKeyframeData, NifFormat.NiBSplineInterpolator, NifFormat.NiUVData):
+        block_index.get_blocks(block_type)
+    for block in block_index.get_blocks(NifFormat.NiAVObject, root=root):
+        block._parent = block_index.get_parent(block)
+    for n_geom in block_index.get_blocks(NifFormat.NiTriBasedGeom, root=root):
+        if n_geom.is_skin():
+            block_index.get_blocks(NifFormat.NiNode, root=n_geom.skin_instance.skeleton_root)
+    for bone_name in bone_names:
+        block_index.find(block_name=bone_name, root=root)
+    return 1
+
+
+def merge_kfs_before(root, bone_names, num_kfs):
+    """The node and controller lookups of import_kf_root for num_kfs kf
+    files covering every bone, with a tree search per controlled block."""
+    for _ in range(num_kfs):
+        for bone_name in bone_names:
+            node = root.find(block_name=bone_name)
+            ctrl = node.controller
+            while ctrl and not isinstance(ctrl, NifFormat.NiTransformController):
+                ctrl = ctrl.next_controller
+
+
+def merge_kfs_after(root, bone_names, num_kfs):
+    """The same lookups through the name map and controller cache of the
+    block index."""
+    from io_scene_nif.utility.nif_block_index import BlockIndex
+    block_index = BlockIndex([root])
+    for _ in range(num_kfs):
+        for bone_name in bone_names:
+            node = block_index.find(block_name=bone_name, root=root)
+            block_index.find_controller(node, NifFormat.NiTransformController)
+
+
+def main(num_bones=240):
+    n_data = n_gen_large.n_create_skeleton(num_bones=num_bones)
+    root = n_data.roots[0]
+    bone_names = [block.name for block in root.tree() if isinstance(block, NifFormat.NiNode)]
+    rows = [("", "walks", "block visits", "time (s)")]
+    for label, func in (("before", walk_before), ("after", walk_after)):
+        with RefCounter() as counter:
+            walks = func(root, bone_names)
+        seconds, _ = time_call(func, root, bone_names)
+        rows.append((label, walks, counter.count, "%.4f" % seconds))
+    report("Tree traversals on a skeleton of %i nodes" % len(bone_names), rows)
+    rows = [("kf files", "before (s)", "after (s)")]
+    for num_kfs in (1, 10, 40):
+        before, _ = time_call(merge_kfs_before, root, bone_names, num_kfs, repeat=1)
+        after, _ = time_call(merge_kfs_after, root, bone_names, num_kfs)
+        rows.append((num_kfs, "%.4f" % before, "%.4f" % after))
+    report("Merging kf files onto a skeleton of %i nodes" % len(bone_names), rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,83 @@
+"""Measures the throughput of B-spline track decoding, in keys per second,
+for the generator based decoding of pyffi and the array based evaluator.
+
+Does not need blender::
+
+    python -m performance.perf_bspline [num_tracks]
+
+Each track is a compressed transform interpolator sampled at 30 frames
+per second. The generators only yield the control points, the evaluator
+also evaluates the curves at every frame.
+"""
+
+import sys
+
+import numpy as np
+from pyffi.formats.nif import NifFormat
+
+from performance import report, time_call
+from io_scene_nif.animationsys import bspline
+
+FPS = 30
+
+
+def n_create_bspline_tracks(num_tracks, num_frames, seed=0):
+    """Compressed transform interpolators sharing one spline data block."""
+    rng = np.random.RandomState(seed)
+    n_spline_data = NifFormat.NiBSplineData()
+    n_basis_data = NifFormat.NiBSplineBasisData()
+    n_basis_data.num_control_points = num_frames + bspline.DEGREE - 1
+    kfis = []
+    for _ in range(num_tracks):
+        kfi = NifFormat.NiBSplineCompTransformInterpolator()
+        kfi.start_time = 0.0
+        kfi.stop_time = (num_frames - 1) / float(FPS)
+        kfi.spline_data = n_spline_data
+        kfi.basis_data = n_basis_data
+        for track, size in (("translation", 3), ("rotation", 4), ("scale", 1)):
+            points = rng.uniform(-1, 1, (n_basis_data.num_control_points, size)).tolist()
+            offset, bias, multiplier = n_spline_data.append_comp_data(points)
+            setattr(kfi, track + "_offset", offset)
+            setattr(kfi, track + "_bias", bias)
+            setattr(kfi, track + "_multiplier", multiplier)
+        kfis.append(kfi)
+    return kfis
+
+
+def decode_generators(kfis):
+    keys = 0
+    for kfi in kfis:
+        times = list(kfi.get_times())
+        translations = list(kfi.get_translations())
+        rotations = list(kfi.get_rotations())
+        scales = list(kfi.get_scales())
+        keys += len(times) * 3
+    return keys
+
+
+def decode_arrays(kfis):
+    keys = 0
+    short_points = np.fromiter(kfis[0].spline_data.short_control_points, dtype=np.float64)
+    for kfi in kfis:
+        times = bspline.get_sample_times(kfi.start_time, kfi.stop_time, FPS)
+        num_control_points = kfi.basis_data.num_control_points
+        for track, size in (("translation", 3), ("rotation", 4), ("scale", 1)):
+            control_points = bspline.get_comp_control_points(
+                short_points, getattr(kfi, track + "_offset"), num_control_points, size,
+                getattr(kfi, track + "_bias"), getattr(kfi, track + "_multiplier"))
+            keys += len(bspline.evaluate(control_points, kfi.start_time, kfi.stop_time, times))
+    return keys
+
+
+def main(num_tracks=80):
+    rows = [("frames", "generators (keys/s)", "evaluator (keys/s)")]
+    for num_frames in (100, 500, 2000):
+        kfis = n_create_bspline_tracks(num_tracks, num_frames)
+        slow, slow_keys = time_call(decode_generators, kfis, repeat=1)
+        fast, fast_keys = time_call(decode_arrays, kfis)
+        rows.append((num_frames, "%.0f" % (slow_keys / slow), "%.0f" % (fast_keys / fast)))
+    report("B-spline decoding of %i tracks" % num_tracks, rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
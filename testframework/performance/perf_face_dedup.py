@@ -0,0 +1,36 @@
+"""Compares the list based and the numpy duplicate face removal.
+
+Does not need blender::
+
+    python -m performance.perf_face_dedup [num_faces ...]
+"""
+
+import sys
+
+import numpy as np
+
+from performance import report, time_call
+from unit.geometry.test_mesh_utils import unique_faces_reference
+
+
+def main(*sizes):
+    from io_scene_nif.geometrysys import mesh_utils
+    rows = [("faces", "list (s)", "numpy (s)")]
+    rng = np.random.RandomState(0)
+    for num_faces in sizes or (5000, 30000, 100000):
+        # one in ten faces is a duplicate
+        faces = rng.randint(0, num_faces, (num_faces, 3))
+        faces[::10] = faces[1::10][:len(faces[::10])]
+        face_list = faces.tolist()
+        if num_faces <= 30000:
+            list_time, _ = time_call(unique_faces_reference, face_list, repeat=1)
+            list_time = "%.3f" % list_time
+        else:
+            list_time = "skipped"
+        numpy_time, _ = time_call(mesh_utils.unique_faces, faces)
+        rows.append((num_faces, list_time, "%.4f" % numpy_time))
+    report("Duplicate face removal", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,54 @@
+"""Compares inserting armature keys one at a time with the bulk fcurve
+writer.
+
+Needs blender::
+
+    blender --background --python-expr "import performance.perf_keyframe_writer as p; p.main()"
+"""
+
+import bpy
+import numpy as np
+
+from performance import report, time_call
+from io_scene_nif.animationsys import keyframe_writer
+
+
+def bone_keys(num_frames, seed):
+    """Frames, quaternion and location keys of a single bone."""
+    rng = np.random.RandomState(seed)
+    frames = np.arange(1, num_frames + 1, dtype=float)
+    quats = rng.uniform(-1, 1, (num_frames, 4))
+    quats /= np.linalg.norm(quats, axis=1)[:, None]
+    locs = rng.uniform(-10, 10, (num_frames, 3))
+    return frames, quats, locs
+
+
+def insert_per_key(keys):
+    action = bpy.data.actions.new("per_key")
+    for bone_index, (frames, quats, locs) in enumerate(keys):
+        data_path = 'pose.bones["Bone{0}"].'.format(bone_index)
+        for channel, values in (("rotation_quaternion", quats), ("location", locs)):
+            for index in range(values.shape[1]):
+                b_fcurve = action.fcurves.new(data_path + channel, index=index)
+                for frame, value in zip(frames.tolist(), values[:, index].tolist()):
+                    b_fcurve.keyframe_points.insert(frame, value)
+    return action
+
+
+def insert_bulk(keys):
+    action = bpy.data.actions.new("bulk")
+    for bone_index, (frames, quats, locs) in enumerate(keys):
+        data_path = 'pose.bones["Bone{0}"].'.format(bone_index)
+        keyframe_writer.add_fcurves(action, data_path + "rotation_quaternion", frames, quats)
+        keyframe_writer.add_fcurves(action, data_path + "location", frames, locs)
+    return action
+
+
+def main(num_bones=80, frame_counts=(250, 1000, 2000)):
+    rows = [("bones x frames", "per key (s)", "bulk (s)")]
+    for num_frames in frame_counts:
+        keys = [bone_keys(num_frames, seed) for seed in range(num_bones)]
+        slow, _ = time_call(insert_per_key, keys, repeat=1)
+        fast, _ = time_call(insert_bulk, keys)
+        rows.append(("%i x %i" % (num_bones, num_frames), "%.3f" % slow, "%.3f" % fast))
+    report("Armature keyframe insertion", rows)
@@ -0,0 +1,54 @@
+"""Compares building a mesh one element at a time with the bulk builder.
+
+Needs blender::
+
+    blender --background --python-expr "import performance.perf_mesh_build as p; p.main()"
+"""
+
+import bpy
+import numpy as np
+
+from performance import report, time_call
+from io_scene_nif.geometrysys import mesh_builder
+
+
+def grid(side):
+    """Vertices and triangles of a side x side grid."""
+    x, y = np.meshgrid(np.arange(side), np.arange(side))
+    coords = np.column_stack((x.ravel(), y.ravel(), np.zeros(side * side)))
+    v0 = (np.arange(side - 1)[:, None] * side + np.arange(side - 1)).ravel()
+    faces = np.vstack((np.column_stack((v0, v0 + 1, v0 + side)),
+                       np.column_stack((v0 + 1, v0 + side + 1, v0 + side))))
+    return coords, faces
+
+
+def build_per_element(coords, faces):
+    b_mesh = bpy.data.meshes.new("per_element")
+    for co in coords.tolist():
+        b_mesh.vertices.add(1)
+        b_mesh.vertices[-1].co = co
+    b_mesh.polygons.add(len(faces))
+    b_mesh.loops.add(faces.size)
+    for index, face in enumerate(faces.tolist()):
+        b_mesh.polygons[index].loop_start = 3 * index
+        b_mesh.polygons[index].loop_total = 3
+        for corner, vertex in enumerate(face):
+            b_mesh.loops[3 * index + corner].vertex_index = vertex
+    return b_mesh
+
+
+def build_bulk(coords, faces):
+    b_mesh = bpy.data.meshes.new("bulk")
+    mesh_builder.add_vertices(b_mesh, coords)
+    mesh_builder.add_polygons(b_mesh, faces)
+    return b_mesh
+
+
+def main(sides=(100, 200, 320)):
+    rows = [("vertices", "per element (s)", "bulk (s)")]
+    for side in sides:
+        coords, faces = grid(side)
+        slow, _ = time_call(build_per_element, coords, faces, repeat=1)
+        fast, _ = time_call(build_bulk, coords, faces)
+        rows.append((len(coords), "%.3f" % slow, "%.3f" % fast))
+    report("Mesh construction", rows)
@@ -0,0 +1,41 @@
+"""Compares parsing a nif with loading it from the parsed file cache.
+
+Run with a python that can import pyffi::
+
+    python -m performance.perf_nif_cache [num_shapes] [verts_per_shape]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from performance import report, time_call
+from performance import n_gen_large
+
+
+def main(num_shapes=2, verts_per_shape=20000):
+    from io_scene_nif.io.cache import FileCache
+    from io_scene_nif.io.nif import NifFile
+    file_path = os.path.join(tempfile.gettempdir(), "perf_nif_cache_%i_%i.nif" % (num_shapes, verts_per_shape))
+    if not os.path.exists(file_path):
+        print("Generating {0}".format(file_path))
+        n_gen_large.n_write(n_gen_large.n_create_large_mesh(num_shapes, verts_per_shape), file_path)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache = FileCache(cache_dir, 1024 * 1024 * 1024)
+        parse_time, _ = time_call(NifFile.load_nif, file_path)
+        miss_time, _ = time_call(cache.load, file_path, NifFile.load_nif, repeat=1)
+        hit_time, _ = time_call(cache.load, file_path, NifFile.load_nif)
+        entry_size = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+    finally:
+        shutil.rmtree(cache_dir)
+    rows = [("load", "time (s)"),
+            ("parse", "%.3f" % parse_time),
+            ("cache miss", "%.3f" % miss_time),
+            ("cache hit", "%.3f" % hit_time)]
+    report("%s, cache entry %.1f MB" % (os.path.basename(file_path), entry_size / (1024.0 * 1024.0)), rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
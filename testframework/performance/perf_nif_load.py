@@ -0,0 +1,52 @@
+"""Compares the buffered and the memory mapped nif loaders.
+
+Each loader runs in a fresh interpreter so that peak resident memory is
+measured independently for both. Run with a python that can import pyffi::
+
+    python -m performance.perf_nif_load [num_shapes] [verts_per_shape]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from performance import peak_rss, report, time_call
+from performance import n_gen_large
+
+
+def measure(file_path, use_mmap):
+    """Load file_path once and return wall time and peak rss."""
+    from io_scene_nif.io.nif import NifFile
+    NifFile.MMAP_THRESHOLD = 0
+    elapsed, n_data = time_call(NifFile.load_nif, file_path, use_mmap=use_mmap, repeat=1)
+    return {"time": elapsed, "rss": peak_rss(), "blocks": len(n_data.blocks)}
+
+
+def run_isolated(file_path, use_mmap):
+    """Run :func:`measure` in a child interpreter and return its result."""
+    output = subprocess.check_output(
+        [sys.executable, "-m", "performance.perf_nif_load", "--measure", file_path, str(int(use_mmap))],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def main(num_shapes=4, verts_per_shape=250000):
+    file_path = os.path.join(tempfile.gettempdir(), "perf_nif_load_%i_%i.nif" % (num_shapes, verts_per_shape))
+    if not os.path.exists(file_path):
+        print("Generating {0}".format(file_path))
+        n_gen_large.n_write(n_gen_large.n_create_large_mesh(num_shapes, verts_per_shape), file_path)
+    size_mb = os.path.getsize(file_path) / (1024.0 * 1024.0)
+    rows = [("loader", "time (s)", "peak rss (kB)")]
+    for label, use_mmap in (("buffered", False), ("mmap", True)):
+        result = run_isolated(file_path, use_mmap)
+        rows.append((label, "%.3f" % result["time"], result["rss"]))
+    report("NifFile.load_nif on %.1f MB" % size_mb, rows)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        print(json.dumps(measure(sys.argv[2], bool(int(sys.argv[3])))))
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,51 @@
+"""Compares the exporter's per bone scan for skin weights with the single
+pass numpy gathering.
+
+Does not need blender::
+
+    python -m performance.perf_skin_weights [num_verts ...]
+"""
+
+import sys
+
+import numpy as np
+
+from performance import report, time_call
+from unit.geometry.test_mesh_utils import skin_weights_reference
+
+
+def body_mesh(num_verts, num_bones, seed):
+    """Vertex groups of a skinned mesh, up to four bones per vertex, and its
+    nif vertices, about one and a half per blender vertex."""
+    rng = np.random.RandomState(seed)
+    vertex_groups = [list(zip(rng.permutation(num_bones)[:rng.randint(1, 5)].tolist(),
+                              rng.uniform(0, 1, 4).tolist()))
+                     for _ in range(num_verts)]
+    nif_vertices = np.concatenate((np.arange(num_verts), rng.randint(0, num_verts, num_verts // 2)))
+    return vertex_groups, nif_vertices
+
+
+def main(*sizes, num_bones=100):
+    from io_scene_nif.geometrysys import mesh_utils
+    rows = [("verts x bones", "scan (s)", "numpy (s)")]
+    bone_groups = list(range(num_bones))
+    for num_verts in sizes or (5000, 20000, 80000):
+        vertex_groups, nif_vertices = body_mesh(num_verts, num_bones, 0)
+        vertices, groups, weights = (np.array(column) for column in zip(*[
+            (b_v_index, group, weight)
+            for b_v_index, b_groups in enumerate(vertex_groups) for group, weight in b_groups]))
+        if num_verts <= 20000:
+            vertmap = [[] for _ in range(num_verts)]
+            for n_index, b_v_index in enumerate(nif_vertices.tolist()):
+                vertmap[b_v_index].append(n_index)
+            scan_time, _ = time_call(skin_weights_reference, vertex_groups, bone_groups, vertmap, repeat=1)
+            scan_time = "%.3f" % scan_time
+        else:
+            scan_time = "skipped"
+        numpy_time, _ = time_call(mesh_utils.skin_weights, vertices, groups, weights, bone_groups, nif_vertices)
+        rows.append(("%i x %i" % (num_verts, num_bones), scan_time, "%.4f" % numpy_time))
+    report("Skin weight gathering", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
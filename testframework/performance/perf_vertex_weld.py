@@ -0,0 +1,29 @@
+"""Compares the dict based and the numpy vertex welding of the importer.
+
+Does not need blender::
+
+    python -m performance.perf_vertex_weld [num_verts ...]
+"""
+
+import sys
+
+from performance import report, time_call
+from unit.geometry.test_mesh_utils import random_mesh, weld_vertices_reference
+
+
+def main(*sizes):
+    from io_scene_nif.geometrysys import mesh_utils
+    rows = [("vertices", "dict (s)", "numpy (s)", "speedup")]
+    for num_verts in sizes or (100000, 250000, 1000000):
+        verts, normals = random_mesh(num_verts, num_verts // 3, 0)
+        # the importer passes lists of floats to the dict loop
+        vert_list, normal_list = verts.tolist(), normals.tolist()
+        dict_time, expected = time_call(weld_vertices_reference, vert_list, normal_list, 1000, 100, True, 0, repeat=1)
+        numpy_time, result = time_call(mesh_utils.weld_vertices, verts, normals, 1000, 100)
+        assert list(result[0]) == expected[0]
+        rows.append((num_verts, "%.3f" % dict_time, "%.3f" % numpy_time, "%.1fx" % (dict_time / numpy_time)))
+    report("Vertex welding", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,35 @@
+"""Compares the exporter's linear scan for duplicate (vertex, uv, normal,
+color) quads with the numpy grid based deduplication.
+
+The corners have two uv layers, a normal and a vertex color. Does not need
+blender::
+
+    python -m performance.perf_vertquad_dedup [num_loops ...]
+"""
+
+import sys
+
+from performance import report, time_call
+from unit.geometry.test_mesh_utils import random_vertquads, unique_vertquads_reference
+
+
+def main(*sizes):
+    from io_scene_nif.geometrysys import mesh_utils
+    rows = [("loops", "nif verts", "scan (s)", "numpy (s)")]
+    for num_loops in sizes or (15000, 60000, 240000):
+        # about four corners per blender vertex, as in a quad mesh
+        vertex_indices, attributes = random_vertquads(num_loops, num_loops // 4, 0)
+        if num_loops <= 60000:
+            scan_time, _ = time_call(unique_vertquads_reference,
+                                     vertex_indices.tolist(), attributes.tolist(), 0.0005, repeat=1)
+            scan_time = "%.3f" % scan_time
+        else:
+            scan_time = "skipped"
+        numpy_time, (first, v_index) = time_call(
+            mesh_utils.unique_vertquads, vertex_indices, attributes, 0.0005)
+        rows.append((num_loops, len(first), scan_time, "%.4f" % numpy_time))
+    report("Vertex quad deduplication", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
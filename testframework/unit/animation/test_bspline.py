@@ -0,0 +1,77 @@
+"""Tests for the array based B-spline evaluation, against the Cox - de Boor
+recursion; these do not need blender."""
+
+import nose
+import numpy as np
+
+from io_scene_nif.animationsys import bspline
+
+
+def basis_reference(knots, index, degree, param):
+    """Cox - de Boor recursion for a single basis function."""
+    if degree == 0:
+        # the last knot closes the last non empty span
+        if knots[index] <= param < knots[index + 1]:
+            return 1.0
+        return float(param == knots[-1] and knots[index] < knots[index + 1] == knots[-1])
+    value = 0.0
+    if knots[index + degree] > knots[index]:
+        value += ((param - knots[index]) / (knots[index + degree] - knots[index])
+                  * basis_reference(knots, index, degree - 1, param))
+    if knots[index + degree + 1] > knots[index + 1]:
+        value += ((knots[index + degree + 1] - param) / (knots[index + degree + 1] - knots[index + 1])
+                  * basis_reference(knots, index + 1, degree - 1, param))
+    return value
+
+
+def evaluate_reference(control_points, start_time, stop_time, time):
+    num_control_points = len(control_points)
+    degree = min(bspline.DEGREE, num_control_points - 1)
+    knots = bspline.get_knots(num_control_points, degree)
+    param = (time - start_time) / (stop_time - start_time) * (num_control_points - degree)
+    return sum(basis_reference(knots, index, degree, param) * np.asarray(point)
+               for index, point in enumerate(control_points))
+
+
+class Test_BSpline:
+
+    def test_evaluate_random(self):
+        rng = np.random.RandomState(0)
+        for num_control_points in (2, 3, 4, 5, 12):
+            control_points = rng.uniform(-5, 5, (num_control_points, 4))
+            times = np.concatenate((rng.uniform(0.5, 2.5, 50), [0.5, 2.5, 1.5]))
+            values = bspline.evaluate(control_points, 0.5, 2.5, times)
+            expected = [evaluate_reference(control_points, 0.5, 2.5, time) for time in times]
+            np.testing.assert_allclose(values, expected, atol=1e-12)
+
+    def test_evaluate_ends_and_lines(self):
+        # the curve passes through the end points, and control points on a
+        # line at the greville abscissae give back that line
+        num_control_points = 10
+        knots = bspline.get_knots(num_control_points)
+        greville = np.array([knots[i + 1:i + 4].mean() for i in range(num_control_points)])
+        control_points = np.column_stack((greville, 2 * greville + 1))
+        times = np.linspace(0, 1, 40)
+        values = bspline.evaluate(control_points, 0, 1, times)
+        params = times * (num_control_points - bspline.DEGREE)
+        np.testing.assert_allclose(values, np.column_stack((params, 2 * params + 1)), atol=1e-12)
+        np.testing.assert_allclose(values[[0, -1]], control_points[[0, -1]], atol=1e-12)
+
+    def test_evaluate_constant(self):
+        values = bspline.evaluate([(3.0,)], 0, 1, [0, 0.5, 1])
+        nose.tools.assert_equal(values.tolist(), [[3.0], [3.0], [3.0]])
+
+    def test_control_points(self):
+        points = np.arange(20)
+        nose.tools.assert_equal(bspline.get_control_points(points, 2, 3, 2).tolist(), [[2, 3], [4, 5], [6, 7]])
+        nose.tools.assert_is_none(bspline.get_control_points(points, bspline.NO_TRACK, 3, 2))
+        # as NiBSplineData.get_comp_data
+        comp = bspline.get_comp_control_points([-32767, 0, 32767, 16000], 0, 4, 1, 2.5, 1.5)
+        np.testing.assert_allclose(comp.ravel(), [2.5 + x * 1.5 / 32767.0 for x in (-32767, 0, 32767, 16000)])
+
+    def test_sample_times(self):
+        times = bspline.get_sample_times(0.0, 1.0, 30)
+        nose.tools.assert_equal(len(times), 31)
+        nose.tools.assert_equal((times[0], times[-1]), (0.0, 1.0))
+        times = bspline.get_sample_times(0.05, 0.2, 30)
+        np.testing.assert_allclose(times, [2 / 30.0, 3 / 30.0, 4 / 30.0, 5 / 30.0, 6 / 30.0])
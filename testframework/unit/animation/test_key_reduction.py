@@ -0,0 +1,110 @@
+"""Tests for the removal of redundant animation keys; these do not need
+blender."""
+
+import nose
+import numpy as np
+
+from io_scene_nif.animationsys import key_reduction
+
+
+def max_error(frames, values, reduced_frames, reduced_values):
+    """Largest distance between the keys and the interpolation of the
+    reduced keys."""
+    values = values.reshape(len(frames), -1)
+    reduced_values = reduced_values.reshape(len(reduced_frames), -1)
+    interpolated = np.column_stack([np.interp(frames, reduced_frames, column) for column in reduced_values.T])
+    return np.linalg.norm(interpolated - values, axis=1).max()
+
+
+def step(frames, key_frames, key_values):
+    """Stepped interpolation of the keys at the given frames."""
+    return np.asarray(key_values)[np.searchsorted(key_frames, frames, side='right') - 1]
+
+
+class Test_KeyReduction:
+
+    @classmethod
+    def setup_class(cls):
+        cls.frames = np.arange(1, 11, dtype=float)
+        # constant, then a ramp, then a corner
+        cls.values = np.array([2, 2, 2, 2, 3, 4, 5, 6, 5, 4], dtype=float)
+
+    def test_lossless(self):
+        reduced_frames, reduced_values = key_reduction.reduce_keys(self.frames, self.values)
+        nose.tools.assert_equal(reduced_frames.tolist(), [1, 4, 8, 10])
+        nose.tools.assert_equal(reduced_values.tolist(), [2, 2, 6, 4])
+        nose.tools.assert_equal(max_error(self.frames, self.values, reduced_frames, reduced_values), 0)
+
+    def test_lossless_vectors(self):
+        frames = np.array([1, 2, 4, 5], dtype=float)
+        # on a line in the first column, but not in the second
+        values = np.array([(0, 0), (1, 0), (3, 1), (4, 1)], dtype=float)
+        reduced_frames, reduced_values = key_reduction.reduce_keys(frames, values)
+        nose.tools.assert_equal(reduced_frames.tolist(), frames.tolist())
+        values[:, 1] = 0
+        reduced_frames, reduced_values = key_reduction.reduce_keys(frames, values)
+        nose.tools.assert_equal(reduced_frames.tolist(), [1, 5])
+        nose.tools.assert_equal(reduced_values.tolist(), [[0, 0], [4, 0]])
+
+    def test_lossy(self):
+        rng = np.random.RandomState(0)
+        frames = np.arange(1, 301, dtype=float)
+        values = np.column_stack((np.sin(frames / 20), np.cos(frames / 30), rng.uniform(0, 1e-4, 300)))
+        for tolerance, max_keys in ((1e-3, 250), (1e-2, 100), (1e-1, 30)):
+            reduced_frames, reduced_values = key_reduction.reduce_keys(frames, values, tolerance)
+            nose.tools.assert_less(len(reduced_frames), max_keys)
+            nose.tools.assert_less_equal(max_error(frames, values, reduced_frames, reduced_values), tolerance)
+            nose.tools.assert_equal((reduced_frames[0], reduced_frames[-1]), (1, 300))
+
+    def test_lossy_angular(self):
+        # rotation about the z axis, slowing down half way
+        angles = np.concatenate((np.linspace(0, 1, 50), np.linspace(1.02, 1.5, 50)))
+        frames = np.arange(len(angles), dtype=float)
+        quats = np.column_stack((np.cos(angles / 2), np.zeros(100), np.zeros(100), np.sin(angles / 2)))
+        tolerance = 1e-3
+        reduced_frames, reduced_quats = key_reduction.reduce_keys(frames, quats, tolerance, angular=True)
+        nose.tools.assert_less(len(reduced_frames), 10)
+        interpolated = np.column_stack([np.interp(frames, reduced_frames, column) for column in reduced_quats.T])
+        interpolated /= np.linalg.norm(interpolated, axis=1)[:, None]
+        errors = 2 * np.arccos(np.clip(np.abs((interpolated * quats).sum(axis=1)), 0, 1))
+        nose.tools.assert_less_equal(errors.max(), tolerance)
+
+    def test_constant(self):
+        # keys on a line are steps, so only repeated keys go
+        reduced_frames, reduced_values = key_reduction.reduce_keys([1, 2, 3], [0, 1, 2], interpolation='CONSTANT')
+        nose.tools.assert_equal(reduced_frames.tolist(), [1, 2, 3])
+        reduced_frames, reduced_values = key_reduction.reduce_keys(
+            self.frames, self.values, interpolation='CONSTANT')
+        nose.tools.assert_equal(reduced_frames.tolist(), [1, 5, 6, 7, 8, 9, 10])
+        nose.tools.assert_equal(step(self.frames, reduced_frames, reduced_values).tolist(), self.values.tolist())
+        # lossy: within tolerance of the last kept key
+        values = np.array([0, 0.05, 0.08, 0.5, 0.52, 1], dtype=float)
+        reduced_frames, reduced_values = key_reduction.reduce_keys(
+            np.arange(6, dtype=float), values, 0.1, interpolation='CONSTANT')
+        nose.tools.assert_equal(reduced_frames.tolist(), [0, 3, 5])
+        nose.tools.assert_less_equal(
+            np.abs(step(np.arange(6), reduced_frames, reduced_values) - values).max(), 0.1)
+
+    def test_constant_angular(self):
+        angles = np.array([0, 0, 0.5, 0.5, 0.5, 1])
+        quats = np.column_stack((np.cos(angles / 2), np.zeros(6), np.zeros(6), np.sin(angles / 2)))
+        # the sign of a quaternion does not change its rotation
+        quats[3] *= -1
+        reduced_frames, reduced_quats = key_reduction.reduce_keys(
+            np.arange(6, dtype=float), quats, angular=True, interpolation='CONSTANT')
+        nose.tools.assert_equal(reduced_frames.tolist(), [0, 2, 5])
+
+    def test_bezier(self):
+        # automatic handles through the kept keys would not pass through
+        # the removed ones, so bezier keys are kept
+        for tolerance in (0.0, 0.1):
+            reduced_frames, reduced_values = key_reduction.reduce_keys(
+                self.frames, self.values, tolerance, interpolation='BEZIER')
+            nose.tools.assert_equal(reduced_frames.tolist(), self.frames.tolist())
+            nose.tools.assert_equal(reduced_values.tolist(), self.values.tolist())
+
+    def test_few_keys(self):
+        frames, values = key_reduction.reduce_keys([1, 2], [5, 5])
+        nose.tools.assert_equal(frames.tolist(), [1, 2])
+        frames, values = key_reduction.reduce_keys([], [], 0.1)
+        nose.tools.assert_equal(len(frames), 0)
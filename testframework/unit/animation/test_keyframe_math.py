@@ -0,0 +1,158 @@
+"""Tests for the array based bind pose conversion, against the per key
+maths of the importer; these do not need blender."""
+
+import nose
+import numpy as np
+
+from io_scene_nif.animationsys import keyframe_math
+
+
+def random_quats(rng, count):
+    quats = rng.uniform(-1, 1, (count, 4))
+    return quats / np.linalg.norm(quats, axis=1)[:, None]
+
+
+def random_rotation(rng):
+    return keyframe_math.quat_to_matrix(random_quats(rng, 1))[0]
+
+
+def quat_multiply_reference(q1, q2):
+    """Hamilton product of two single quaternions."""
+    w1, x1, y1, z1 = q1
+    w2, x2, y2, z2 = q2
+    return np.array([w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                     w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                     w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2])
+
+
+def axis_rotation(axis, angle):
+    """Rotation matrix about a coordinate axis, acting on column vectors."""
+    cos, sin = np.cos(angle), np.sin(angle)
+    i, j = (axis + 1) % 3, (axis + 2) % 3
+    matrix = np.identity(3)
+    matrix[i, i], matrix[i, j], matrix[j, i], matrix[j, j] = cos, -sin, sin, cos
+    return matrix
+
+
+def quat_to_matrix_reference(quat):
+    """Rotation matrix of a single unit quaternion, acting on column vectors,
+    with column i the image q * e_i * inverse(q) of the i-th axis."""
+    quat_inv = quat * (1, -1, -1, -1)
+    return np.column_stack([quat_multiply_reference(quat_multiply_reference(quat, (0,) + tuple(axis)), quat_inv)[1:]
+                            for axis in np.identity(3)])
+
+
+def bone_rotation_reference(quat, bind_quat_inv, extra_quat, extra_quat_inv):
+    """The per key rotation conversion of the importer,
+    CrossQuats(CrossQuats(extra_quat_inv, CrossQuats(bind_quat_inv, quat)), extra_quat),
+    with CrossQuats(q1, q2) the product q1 * q2."""
+    quat_val = quat_multiply_reference(bind_quat_inv, quat)
+    return quat_multiply_reference(quat_multiply_reference(extra_quat_inv, quat_val), extra_quat)
+
+
+def bone_translations_reference(frames, translations, rot_keys_dict, sizes_dict,
+                                bind_trans, bind_rot_inv, bind_scale,
+                                extra_trans, extra_rot_inv, extra_scale):
+    """The per key translation conversion of the importer,
+    (extra_trans * size * rot + locVal - extra_trans) * extra_rot_inv * extra_scale
+    with locVal = (trans - bind_trans) * bind_rot_inv * bind_scale and row
+    vectors, the rotation and scale looked up per frame."""
+    locs = []
+    for frame, trans in zip(frames, translations):
+        loc_val = (trans - bind_trans).dot(bind_rot_inv) * bind_scale
+        rot = quat_to_matrix_reference(rot_keys_dict[frame])
+        size = np.identity(3) * sizes_dict[frame]
+        locs.append((extra_trans.dot(size).dot(rot) + loc_val - extra_trans).dot(extra_rot_inv) * extra_scale)
+    return np.array(locs)
+
+
+class Test_KeyframeMath:
+
+    def test_quat_multiply(self):
+        rng = np.random.RandomState(0)
+        q1, q2 = random_quats(rng, 20), random_quats(rng, 20)
+        expected = [quat_multiply_reference(a, b) for a, b in zip(q1, q2)]
+        np.testing.assert_allclose(keyframe_math.quat_multiply(q1, q2), expected)
+        # a single quaternion broadcasts over the keys
+        expected = [quat_multiply_reference(a, q2[0]) for a in q1]
+        np.testing.assert_allclose(keyframe_math.quat_multiply(q1, q2[0]), expected)
+
+    def test_quat_to_matrix(self):
+        rng = np.random.RandomState(1)
+        q1, q2 = random_quats(rng, 20), random_quats(rng, 20)
+        matrices = keyframe_math.quat_to_matrix(q1)
+        # orthonormal, and q1 * q2 composes as the matrix product
+        np.testing.assert_allclose(np.einsum('nij,nkj->nik', matrices, matrices), np.tile(np.identity(3), (20, 1, 1)),
+                                   atol=1e-12)
+        np.testing.assert_allclose(keyframe_math.quat_to_matrix(keyframe_math.quat_multiply(q1, q2)),
+                                   np.einsum('nij,njk->nik', matrices, keyframe_math.quat_to_matrix(q2)), atol=1e-12)
+        np.testing.assert_allclose(keyframe_math.quat_to_matrix([(1, 0, 0, 0)])[0], np.identity(3))
+        np.testing.assert_allclose(matrices, [quat_to_matrix_reference(quat) for quat in q1], atol=1e-12)
+
+    def test_euler_to_quat(self):
+        rng = np.random.RandomState(2)
+        eulers = rng.uniform(-np.pi, np.pi, (20, 3))
+        matrices = keyframe_math.quat_to_matrix(keyframe_math.euler_to_quat(eulers))
+        for matrix, (x, y, z) in zip(matrices, eulers):
+            expected = axis_rotation(2, z).dot(axis_rotation(1, y)).dot(axis_rotation(0, x))
+            np.testing.assert_allclose(matrix, expected, atol=1e-12)
+
+    def test_bone_rotations(self):
+        rng = np.random.RandomState(3)
+        quats = random_quats(rng, 50)
+        bind_quat_inv, extra_quat = random_quats(rng, 2)
+        extra_quat_inv = extra_quat * (1, -1, -1, -1)
+        expected = [bone_rotation_reference(quat, bind_quat_inv, extra_quat, extra_quat_inv) for quat in quats]
+        np.testing.assert_allclose(
+            keyframe_math.bone_rotations(quats, bind_quat_inv, extra_quat, extra_quat_inv), expected, atol=1e-12)
+
+    def test_bone_translations(self):
+        rng = np.random.RandomState(4)
+        frames = np.arange(1, 31, dtype=float)
+        translations = rng.uniform(-10, 10, (30, 3))
+        # rotation and scale keys on every other frame
+        rot_frames, rots = frames[::2], random_quats(rng, 15)
+        scale_frames, sizes = frames[::2], rng.uniform(0.5, 2, 15)
+        frame_rots = keyframe_math.interpolate_rotations(frames, rot_frames, rots)
+        frame_sizes = keyframe_math.interpolate_keys(frames, scale_frames, sizes)
+        # exact at the keys
+        np.testing.assert_allclose(frame_rots[::2], rots, atol=1e-12)
+        np.testing.assert_allclose(frame_sizes[::2], sizes)
+        bind = (rng.uniform(-1, 1, 3), random_rotation(rng), 1.5)
+        extra = (rng.uniform(-1, 1, 3), random_rotation(rng), 0.8)
+        expected = bone_translations_reference(
+            frames, translations, dict(zip(frames, frame_rots)), dict(zip(frames, frame_sizes)), *(bind + extra))
+        locs = keyframe_math.bone_translations(translations, frame_rots, frame_sizes, *(bind + extra))
+        np.testing.assert_allclose(locs, expected, atol=1e-10)
+
+    def test_bone_channels(self):
+        # the whole per key conversion of the importer on the raw nif keys,
+        # against the array conversion as the importer chains it
+        rng = np.random.RandomState(5)
+        frames = np.arange(1, 21, dtype=float)
+        translations = rng.uniform(-10, 10, (20, 3))
+        nif_quats, sizes = random_quats(rng, 20), rng.uniform(0.5, 2, 20)
+        bind_trans, bind_quat, bind_scale = rng.uniform(-1, 1, 3), random_quats(rng, 1)[0], 1.5
+        extra_trans, extra_quat, extra_scale = rng.uniform(-1, 1, 3), random_quats(rng, 1)[0], 0.8
+        bind_quat_inv, extra_quat_inv = bind_quat * (1, -1, -1, -1), extra_quat * (1, -1, -1, -1)
+        bind_rot_inv, extra_rot_inv = quat_to_matrix_reference(bind_quat_inv), quat_to_matrix_reference(extra_quat_inv)
+        rot_keys_dict = dict((frame, bone_rotation_reference(quat, bind_quat_inv, extra_quat, extra_quat_inv))
+                             for frame, quat in zip(frames, nif_quats))
+        expected = bone_translations_reference(
+            frames, translations, rot_keys_dict, dict(zip(frames, sizes)),
+            bind_trans, bind_rot_inv, bind_scale, extra_trans, extra_rot_inv, extra_scale)
+        rots = keyframe_math.bone_rotations(nif_quats, bind_quat_inv, extra_quat, extra_quat_inv)
+        locs = keyframe_math.bone_translations(
+            translations, keyframe_math.interpolate_rotations(frames, frames, rots),
+            keyframe_math.interpolate_keys(frames, frames, sizes),
+            bind_trans, bind_rot_inv, bind_scale, extra_trans, extra_rot_inv, extra_scale)
+        np.testing.assert_allclose(rots, [rot_keys_dict[frame] for frame in frames], atol=1e-12)
+        np.testing.assert_allclose(locs, expected, atol=1e-10)
+
+    def test_interpolate_keys(self):
+        values = keyframe_math.interpolate_keys([0, 1, 2, 2.5, 4, 9], [1, 3, 4, 3], [(10, 0), (30, 2), (40, 4), (20, 1)])
+        # the last key of frame 3 wins, and the ends are held
+        nose.tools.assert_equal(values.tolist(), [[10, 0], [10, 0], [15, 0.5], [17.5, 0.75], [40, 4], [40, 4]])
+        rots = keyframe_math.interpolate_rotations([1.5], [1, 2], [(1, 0, 0, 0), (0, 1, 0, 0)])
+        np.testing.assert_allclose(rots, [(0.5 ** 0.5, 0.5 ** 0.5, 0, 0)])
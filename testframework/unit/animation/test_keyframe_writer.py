@@ -0,0 +1,104 @@
+"""Tests for the bulk fcurve writer, against a minimal stand in for the
+bpy action api; these do not need blender."""
+
+import nose
+import numpy as np
+
+from io_scene_nif.animationsys import keyframe_writer
+
+
+class FakeKeyframePoints:
+    """Supports the part of the bpy keyframe points api used by the writer."""
+
+    def __init__(self):
+        self.points = []
+        self.co = []
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def add(self, count):
+        self.points += [FakeKeyframe() for _ in range(count)]
+        self.co += [0, 0] * count
+
+    def foreach_set(self, attr, values):
+        nose.tools.assert_equal(attr, "co")
+        nose.tools.assert_equal(len(values), len(self.co))
+        self.co = list(values)
+
+
+class FakeKeyframe:
+
+    def __init__(self):
+        self.interpolation = 'BEZIER'
+
+
+class FakeModifiers(list):
+
+    def new(self, mod_type):
+        self.append(mod_type)
+
+
+class FakeFCurve:
+
+    def __init__(self, data_path, index, action_group):
+        self.data_path = data_path
+        self.array_index = index
+        self.group = action_group
+        self.keyframe_points = FakeKeyframePoints()
+        self.modifiers = FakeModifiers()
+        self.extrapolation = None
+        self.updated = False
+
+    def update(self):
+        self.updated = True
+
+
+class FakeFCurves(list):
+
+    def new(self, data_path, index=0, action_group=""):
+        b_fcurve = FakeFCurve(data_path, index, action_group)
+        self.append(b_fcurve)
+        return b_fcurve
+
+
+class FakeAction:
+
+    def __init__(self):
+        self.fcurves = FakeFCurves()
+
+
+class Test_KeyframeWriter:
+
+    def test_get_frames(self):
+        # time 0.0 is frame 1, rounding half up as int(x + 0.5) did
+        frames = keyframe_writer.get_frames([0.0, 0.5, 1 / 60.0, 0.99 / 30], 30)
+        nose.tools.assert_equal(frames.tolist(), [1, 16, 2, 2])
+
+    def test_last_key_per_frame(self):
+        frames, values = keyframe_writer.last_key_per_frame([3, 1, 3, 2, 1], [10, 20, 30, 40, 50])
+        nose.tools.assert_equal(frames.tolist(), [1, 2, 3])
+        nose.tools.assert_equal(values.tolist(), [50, 40, 30])
+
+    def test_add_fcurve(self):
+        action = FakeAction()
+        b_fcurve = keyframe_writer.add_fcurve(action, "location", [1, 5, 3], [0.5, 2, 1], index=2,
+                                              group="Bone", interpolation='LINEAR')
+        nose.tools.assert_equal(action.fcurves, [b_fcurve])
+        nose.tools.assert_equal((b_fcurve.data_path, b_fcurve.array_index, b_fcurve.group), ("location", 2, "Bone"))
+        nose.tools.assert_equal(b_fcurve.keyframe_points.co, [1, 0.5, 3, 1, 5, 2])
+        nose.tools.assert_equal([b_key.interpolation for b_key in b_fcurve.keyframe_points], ['LINEAR'] * 3)
+        nose.tools.assert_equal(b_fcurve.extrapolation, 'CONSTANT')
+        nose.tools.assert_equal(b_fcurve.modifiers, [])
+        nose.tools.assert_true(b_fcurve.updated)
+
+    def test_add_fcurves_cyclic(self):
+        action = FakeAction()
+        quats = [(1, 0, 0, 0), (0, 1, 0, 0)]
+        b_fcurves = keyframe_writer.add_fcurves(action, 'pose.bones["Bip01"].rotation_quaternion', [1, 2], quats,
+                                                group="Bip01", interpolation='BEZIER', cyclic=True)
+        nose.tools.assert_equal([b_fcurve.array_index for b_fcurve in b_fcurves], [0, 1, 2, 3])
+        nose.tools.assert_equal(b_fcurves[1].keyframe_points.co, [1, 0, 2, 1])
+        for b_fcurve in b_fcurves:
+            nose.tools.assert_equal(b_fcurve.modifiers, ['CYCLES'])
+            nose.tools.assert_equal(b_fcurve.extrapolation, None)
@@ -0,0 +1,146 @@
+"""Tests for the bulk mesh builder, against a minimal stand in for the
+bpy mesh collections; these do not need blender."""
+
+import nose
+import numpy as np
+
+from io_scene_nif.geometrysys import mesh_builder
+
+
+class FakeCollection:
+    """Supports the part of the bpy collection api used by the builder."""
+
+    def __init__(self, **attrs):
+        self.attrs = attrs
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, count):
+        self.size += count
+        for name, (width, values) in self.attrs.items():
+            self.attrs[name] = (width, values + [0] * (count * width))
+
+    def foreach_get(self, attr, values):
+        width, stored = self.attrs[attr]
+        values[:] = stored
+
+    def foreach_set(self, attr, values):
+        width, stored = self.attrs[attr]
+        nose.tools.assert_equal(len(values), len(stored))
+        self.attrs[attr] = (width, list(values))
+
+
+class FakeMesh:
+
+    def __init__(self):
+        self.vertices = FakeCollection(co=(3, []))
+        self.polygons = FakeCollection(loop_start=(1, []), loop_total=(1, []))
+        self.loops = FakeCollection(vertex_index=(1, []))
+
+
+class FakeShapeKey:
+
+    def __init__(self, name, b_mesh):
+        self.name = name
+        self.data = FakeCollection(co=(3, list(b_mesh.vertices.attrs["co"][1])))
+        self.data.size = len(b_mesh.vertices)
+
+
+class FakeObject:
+
+    def __init__(self, b_mesh):
+        self.data = b_mesh
+        self.key_blocks = []
+
+    def shape_key_add(self, name, from_mix):
+        b_key = FakeShapeKey(name, self.data)
+        self.key_blocks.append(b_key)
+        return b_key
+
+
+class FakeLayer:
+
+    def __init__(self, name, attr, width, values):
+        self.name = name
+        self.data = FakeCollection(**{attr: (width, values)})
+        self.data.size = len(values) // width
+
+
+class FakeGroupElement:
+
+    def __init__(self, group, weight):
+        self.group = group
+        self.weight = weight
+
+
+class FakeVertex:
+
+    def __init__(self, index, groups):
+        self.index = index
+        self.groups = [FakeGroupElement(group, weight) for group, weight in groups]
+
+
+class Test_MeshBuilder:
+
+    def test_add_vertices_and_polygons(self):
+        b_mesh = FakeMesh()
+        nose.tools.assert_equal(mesh_builder.add_vertices(b_mesh, [(0, 0, 0), (1, 0, 0), (0, 1, 0)]), 0)
+        nose.tools.assert_equal(mesh_builder.add_polygons(b_mesh, [(0, 1, 2)]), 0)
+        # appending keeps the existing data
+        nose.tools.assert_equal(mesh_builder.add_vertices(b_mesh, [(1, 1, 0)]), 3)
+        nose.tools.assert_equal(mesh_builder.add_polygons(b_mesh, [(1, 3, 2), (0, 3, 1)]), 1)
+        nose.tools.assert_equal(b_mesh.vertices.attrs["co"][1], [0, 0, 0, 1, 0, 0, 0, 1, 0, 1, 1, 0])
+        nose.tools.assert_equal(b_mesh.loops.attrs["vertex_index"][1], [0, 1, 2, 1, 3, 2, 0, 3, 1])
+        nose.tools.assert_equal(b_mesh.polygons.attrs["loop_start"][1], [0, 3, 6])
+        nose.tools.assert_equal(b_mesh.polygons.attrs["loop_total"][1], [3, 3, 3])
+
+    def test_get_array(self):
+        b_mesh = FakeMesh()
+        mesh_builder.add_vertices(b_mesh, [(0, 1, 2), (3, 4, 5)])
+        coords = mesh_builder.get_array(b_mesh.vertices, "co", 3)
+        nose.tools.assert_equal(coords.shape, (2, 3))
+        nose.tools.assert_equal(coords.dtype, np.float32)
+        nose.tools.assert_equal(coords.tolist(), [[0, 1, 2], [3, 4, 5]])
+
+    def test_add_shape_key(self):
+        b_mesh = FakeMesh()
+        mesh_builder.add_vertices(b_mesh, [(0, 0, 0), (1, 0, 0), (0, 1, 0)])
+        b_obj = FakeObject(b_mesh)
+        # nif vertices 0 and 2 were welded into blender vertex 1
+        b_key = mesh_builder.add_shape_key(b_obj, "Key 1", [1, 2, 1], [(5, 5, 5), (6, 6, 6), (7, 7, 7)])
+        nose.tools.assert_equal(b_key.name, "Key 1")
+        nose.tools.assert_equal(b_key.data.attrs["co"][1], [0, 0, 0, 7, 7, 7, 6, 6, 6])
+        # the base pose is untouched
+        nose.tools.assert_equal(b_mesh.vertices.attrs["co"][1], [0, 0, 0, 1, 0, 0, 0, 1, 0])
+
+    def test_get_mesh_arrays(self):
+        b_mesh = FakeMesh()
+        b_mesh.vertices.attrs["normal"] = (3, [])
+        b_mesh.polygons.attrs.update(material_index=(1, []), use_smooth=(1, []), normal=(3, []))
+        mesh_builder.add_vertices(b_mesh, [(0, 0, 0), (1, 0, 0), (0, 1, 0), (1, 1, 0)])
+        mesh_builder.add_polygons(b_mesh, [(0, 1, 2), (1, 3, 2)])
+        b_mesh.uv_layers = [FakeLayer("UVMap", "uv", 2, list(range(12)))]
+        b_mesh.vertex_colors = [FakeLayer("Col", "color", 3, [0.5] * 18)]
+        mesh = mesh_builder.get_mesh_arrays(b_mesh)
+        nose.tools.assert_equal(mesh["coords"].shape, (4, 3))
+        nose.tools.assert_equal(mesh["normals"].shape, (4, 3))
+        nose.tools.assert_equal(mesh["loop_starts"].tolist(), [0, 3])
+        nose.tools.assert_equal(mesh["loop_totals"].tolist(), [3, 3])
+        nose.tools.assert_equal(mesh["material_indices"].tolist(), [0, 0])
+        nose.tools.assert_equal(mesh["smooth"].dtype, np.bool_)
+        nose.tools.assert_equal(mesh["poly_normals"].shape, (2, 3))
+        nose.tools.assert_equal(mesh["loop_vertices"].tolist(), [0, 1, 2, 1, 3, 2])
+        nose.tools.assert_equal(list(mesh["uv_layers"]), ["UVMap"])
+        nose.tools.assert_equal(mesh["uv_layers"]["UVMap"][1].tolist(), [2, 3])
+        nose.tools.assert_equal(len(mesh["vertex_colors"]), 1)
+        nose.tools.assert_equal(mesh["vertex_colors"][0].shape, (6, 3))
+
+    def test_get_vertex_weights(self):
+        b_mesh = FakeMesh()
+        b_mesh.vertices = [FakeVertex(0, [(1, 0.5), (0, 0.25)]), FakeVertex(1, []), FakeVertex(2, [(1, 1.0)])]
+        vertices, groups, weights = mesh_builder.get_vertex_weights(b_mesh)
+        nose.tools.assert_equal(vertices.tolist(), [0, 0, 2])
+        nose.tools.assert_equal(groups.tolist(), [1, 0, 1])
+        nose.tools.assert_equal(weights.tolist(), [0.5, 0.25, 1.0])
@@ -0,0 +1,519 @@
+"""Tests for the array based mesh helpers; these do not need blender."""
+
+import nose
+import numpy as np
+
+from io_scene_nif.geometrysys import mesh_utils
+
+
+def weld_vertices_reference(verts, normals, vertex_resolution, normal_resolution, combine, start_index):
+    """The original dict based vertex welding of the importer."""
+    v_map = [i for i in range(len(verts))]
+    n_map = {}
+    new_verts = []
+    b_v_index = start_index
+    for i, v in enumerate(verts):
+        if normals is not None:
+            n = normals[i]
+            k = (int(v[0] * vertex_resolution), int(v[1] * vertex_resolution), int(v[2] * vertex_resolution),
+                 int(n[0] * normal_resolution), int(n[1] * normal_resolution), int(n[2] * normal_resolution))
+        else:
+            k = (int(v[0] * vertex_resolution), int(v[1] * vertex_resolution), int(v[2] * vertex_resolution))
+        try:
+            if not combine:
+                n_map_k = None
+            else:
+                n_map_k = n_map[k]
+        except KeyError:
+            n_map_k = None
+        if not n_map_k:
+            n_map[k] = i
+            v_map[i] = b_v_index
+            new_verts.append(i)
+            b_v_index += 1
+        else:
+            v_map[i] = v_map[n_map_k]
+    return v_map, new_verts
+
+
+def random_mesh(num_verts, num_unique, seed):
+    """Vertices and normals drawn from a small pool, as float32 like in nifs,
+    so that many of them are duplicates, some only after truncation."""
+    rng = np.random.RandomState(seed)
+    pool_verts = rng.uniform(-10, 10, (num_unique, 3)).astype(np.float32)
+    pool_norms = rng.uniform(-1, 1, (num_unique, 3)).astype(np.float32)
+    choice = rng.randint(0, num_unique, num_verts)
+    jitter = rng.uniform(0, 1e-5, (num_verts, 3)).astype(np.float32)
+    return (pool_verts[choice] + jitter).astype(np.float64), pool_norms[choice].astype(np.float64)
+
+
+class Test_WeldVertices:
+
+    def check_weld(self, verts, normals, combine=True, start_index=0):
+        expected = weld_vertices_reference(verts, normals, 1000, 100, combine, start_index)
+        v_map, new_verts = mesh_utils.weld_vertices(verts, normals, 1000, 100, combine, start_index)
+        nose.tools.assert_equal(list(v_map), expected[0])
+        nose.tools.assert_equal(list(new_verts), expected[1])
+
+    def test_weld_random(self):
+        for seed in range(10):
+            verts, normals = random_mesh(500, 50, seed)
+            self.check_weld(verts, normals)
+            self.check_weld(verts, None)
+            self.check_weld(verts, normals, start_index=17)
+
+    def test_weld_first_vertex_quirk(self):
+        # vertex 0 is duplicated three times: first two are kept
+        verts = [(0, 0, 0), (1, 0, 0), (0, 0, 0), (0, 0, 0), (1, 0, 0)]
+        v_map, new_verts = mesh_utils.weld_vertices(verts, None)
+        nose.tools.assert_equal(list(v_map), [0, 1, 2, 2, 1])
+        nose.tools.assert_equal(list(new_verts), [0, 1, 2])
+        self.check_weld(np.array(verts, dtype=float), None)
+
+    def test_weld_truncation(self):
+        # int() truncates towards zero, so these all share a key
+        verts = np.array([(0.0005, -0.0005, 0), (0.0009, -0.0009, 0), (1, 1, 1), (0.0001, 0, 0)])
+        self.check_weld(verts, None)
+
+    def test_weld_no_combine(self):
+        verts, normals = random_mesh(100, 5, 0)
+        self.check_weld(verts, normals, combine=False, start_index=3)
+
+    def test_weld_empty(self):
+        v_map, new_verts = mesh_utils.weld_vertices(np.zeros((0, 3)), None)
+        nose.tools.assert_equal(len(v_map), 0)
+        nose.tools.assert_equal(len(new_verts), 0)
+
+
+class Test_LabelRows:
+
+    def check_labels(self, keys):
+        labels = mesh_utils.label_rows(keys)
+        rows = [tuple(row) for row in keys]
+        for i in range(len(rows)):
+            for j in range(len(rows)):
+                nose.tools.assert_equal(labels[i] == labels[j], rows[i] == rows[j])
+
+    def test_label_rows_packed(self):
+        rng = np.random.RandomState(0)
+        self.check_labels(rng.randint(-3, 3, (200, 6)))
+
+    def test_label_rows_wide(self):
+        # columns too wide to fit in a single 64 bit word
+        rng = np.random.RandomState(1)
+        keys = rng.randint(-2 ** 40, 2 ** 40, (100, 3))
+        self.check_labels(np.vstack((keys, keys[::3])))
+
+
+class Test_TransformPoints:
+
+    def test_transform_points(self):
+        # row vector convention, as vector * matrix in blender 2.7x
+        matrix = np.array([[0, 1, 0, 0],
+                           [-1, 0, 0, 0],
+                           [0, 0, 2, 0],
+                           [5, 6, 7, 1]], dtype=float)
+        points = np.array([(1, 2, 3), (0, 0, 0)], dtype=float)
+        expected = [np.append(point, 1).dot(matrix)[:3].tolist() for point in points]
+        nose.tools.assert_equal(mesh_utils.transform_points(points, matrix).tolist(), expected)
+
+
+def map_vertex_colors_reference(v_map, n_colors, loop_vertices, b_colors):
+    """The original loops x vertices scan of the importer."""
+    b_colors = [list(color) for color in b_colors]
+    n_vcol_map = list(zip(n_colors, v_map))
+    for b_loop_index, b_vertex_index in enumerate(loop_vertices):
+        for n_color, n_map_index in n_vcol_map:
+            if n_map_index == b_vertex_index:
+                b_colors[b_loop_index] = list(n_color)
+    return b_colors
+
+
+class Test_MapToLoops:
+
+    def test_map_to_loops(self):
+        rng = np.random.RandomState(0)
+        # 12 nif vertices welded onto 8 blender vertices, starting at 4 as if
+        # appended to a grouped mesh; loops of the earlier part are untouched
+        v_map = [4, 5, 6, 4, 7, 8, 9, 10, 11, 9, 5, 6]
+        n_colors = rng.uniform(0, 1, (len(v_map), 3)).astype(np.float32)
+        loop_vertices = [0, 1, 2, 1, 2, 3] + rng.randint(4, 12, 30).tolist()
+        b_colors = np.ones((len(loop_vertices), 3), dtype=np.float32)
+        expected = map_vertex_colors_reference(v_map, n_colors, loop_vertices, b_colors)
+        result = mesh_utils.map_to_loops(v_map, n_colors, loop_vertices, b_colors)
+        nose.tools.assert_equal(result.tolist(), expected)
+        # fewer colors than vertices, as zip truncates
+        expected = map_vertex_colors_reference(v_map, n_colors[:5], loop_vertices, b_colors)
+        result = mesh_utils.map_to_loops(v_map, n_colors[:5], loop_vertices, b_colors)
+        nose.tools.assert_equal(result.tolist(), expected)
+
+
+def unique_faces_reference(faces):
+    """The original list based duplicate face check of the importer."""
+    f_map = [-1] * len(faces)
+    unique = []
+    for i, f in enumerate(faces):
+        if tuple(f) in unique:
+            continue
+        f_map[i] = len(unique)
+        unique.append(tuple(f))
+    return unique, f_map
+
+
+class Test_UniqueFaces:
+
+    def test_unique_faces_random(self):
+        rng = np.random.RandomState(0)
+        faces = rng.randint(0, 8, (500, 3))
+        # no rotated copies, so the result is that of the exact check
+        canonical = set()
+        faces = [f for f in faces.tolist()
+                 if not any(tuple(f[i:] + f[:i]) in canonical for i in (1, 2))
+                 and not canonical.add(tuple(f))]
+        unique, f_map = mesh_utils.unique_faces(faces)
+        expected_unique, expected_f_map = unique_faces_reference(faces)
+        nose.tools.assert_equal([tuple(f) for f in unique.tolist()], expected_unique)
+        nose.tools.assert_equal(f_map.tolist(), expected_f_map)
+
+    def test_unique_faces_rotation(self):
+        faces = [(0, 1, 2), (1, 2, 0), (0, 2, 1), (2, 0, 1), (3, 4, 5)]
+        unique, f_map = mesh_utils.unique_faces(faces)
+        nose.tools.assert_equal(unique.tolist(), [[0, 1, 2], [0, 2, 1], [3, 4, 5]])
+        nose.tools.assert_equal(f_map.tolist(), [0, -1, 1, -1, 2])
+
+    def test_unique_faces_quads(self):
+        faces = [[0, 1, 3, 2], [6, 7, 5, 4], [3, 2, 0, 1]]
+        unique, f_map = mesh_utils.unique_faces(faces)
+        nose.tools.assert_equal(unique.tolist(), faces[:2])
+        nose.tools.assert_equal(f_map.tolist(), [0, 1, -1])
+
+    def test_unique_faces_empty(self):
+        unique, f_map = mesh_utils.unique_faces([])
+        nose.tools.assert_equal(len(unique), 0)
+        nose.tools.assert_equal(len(f_map), 0)
+
+
+def bucket_weights_reference(vertices, weights):
+    """Replay one 'REPLACE' add per vertex, as the importer used to."""
+    group = {}
+    for vert, weight in zip(vertices, weights):
+        group[vert] = weight
+    return group
+
+
+class Test_BucketWeights:
+
+    def test_bucket_weights_random(self):
+        rng = np.random.RandomState(0)
+        vertices = rng.randint(0, 300, 1000)
+        weights = rng.choice([0.1, 0.25, 0.5, 1.0], 1000)
+        buckets = mesh_utils.bucket_weights(vertices, weights)
+        group = {}
+        for weight, b_verts in buckets:
+            for vert in b_verts:
+                group[vert] = weight
+        nose.tools.assert_equal(group, bucket_weights_reference(vertices.tolist(), weights.tolist()))
+        nose.tools.assert_equal(len(buckets), 4)
+        nose.tools.assert_equal(sum(len(b_verts) for weight, b_verts in buckets), len(group))
+
+    def test_bucket_weights_empty(self):
+        nose.tools.assert_equal(mesh_utils.bucket_weights([], []), [])
+
+
+class Test_MorphCoords:
+
+    def test_morph_coords(self):
+        base = [(0, 0, 0), (1, 0, 0), (0, 1, 0)]
+        delta = [(0, 0, 1), (0, 0, 2), (0, 0, 3), (9, 9, 9)]
+        # the extra delta row is ignored, as egm morphs sometimes have more
+        coords = mesh_utils.morph_coords(base, delta)
+        nose.tools.assert_equal(coords.tolist(), [[0, 0, 1], [1, 0, 2], [0, 1, 3]])
+        matrix = np.identity(4)
+        matrix[3, :3] = (10, 20, 30)
+        coords = mesh_utils.morph_coords(base, delta, matrix)
+        nose.tools.assert_equal(coords.tolist(), [[10, 20, 31], [11, 20, 32], [10, 21, 33]])
+
+
+class Test_ScatterRows:
+
+    def test_scatter_rows(self):
+        target = np.zeros((4, 3))
+        mesh_utils.scatter_rows(target, [3, 1, 3, 0, 2], [(1, 1, 1), (2, 2, 2), (3, 3, 3)])
+        nose.tools.assert_equal(target.tolist(), [[0, 0, 0], [2, 2, 2], [0, 0, 0], [3, 3, 3]])
+
+
+def unique_vertquads_reference(vertex_indices, attributes, epsilon):
+    """The original linear scan of the exporter over the earlier corners of
+    the same blender vertex."""
+    vertmap = {}
+    first = []
+    v_index = []
+    for loop_index, (b_v_index, attrs) in enumerate(zip(vertex_indices, attributes)):
+        for j in vertmap.get(b_v_index, []):
+            if all(abs(a - b) <= epsilon for a, b in zip(attrs, attributes[first[j]])):
+                v_index.append(j)
+                break
+        else:
+            vertmap.setdefault(b_v_index, []).append(len(first))
+            v_index.append(len(first))
+            first.append(loop_index)
+    return first, v_index
+
+
+def random_vertquads(num_loops, num_verts, seed):
+    """Corners of a mesh with 2 uv layers, normals and colors; attributes
+    are drawn from a small pool per vertex, so that many corners match."""
+    rng = np.random.RandomState(seed)
+    pool = rng.uniform(-1, 1, (num_verts, 3, 11)).round(2)
+    vertex_indices = rng.randint(0, num_verts, num_loops)
+    attributes = pool[vertex_indices, rng.randint(0, 3, num_loops)]
+    return vertex_indices, attributes
+
+
+class Test_UniqueVertquads:
+
+    def test_unique_vertquads_random(self):
+        for seed in range(5):
+            vertex_indices, attributes = random_vertquads(2000, 300, seed)
+            # noise well below the epsilon, away from the grid lines
+            attributes += np.random.RandomState(seed).uniform(-1e-5, 1e-5, attributes.shape)
+            expected = unique_vertquads_reference(vertex_indices.tolist(), attributes.tolist(), 0.0005)
+            first, v_index = mesh_utils.unique_vertquads(vertex_indices, attributes, 0.0005)
+            nose.tools.assert_equal(first.tolist(), expected[0])
+            nose.tools.assert_equal(v_index.tolist(), expected[1])
+
+    def test_unique_vertquads_within_epsilon(self):
+        rng = np.random.RandomState(0)
+        vertex_indices = rng.randint(0, 10, 1000)
+        attributes = rng.uniform(0, 0.01, (1000, 2))
+        first, v_index = mesh_utils.unique_vertquads(vertex_indices, attributes, 0.001)
+        # corners only share a vertex with their own blender vertex, and
+        # with attributes within epsilon
+        nose.tools.assert_equal(vertex_indices[first][v_index].tolist(), vertex_indices.tolist())
+        nose.tools.assert_true(np.all(np.abs(attributes[first][v_index] - attributes) <= 0.001))
+        # and the first corner of each vertex is the one it is taken from
+        nose.tools.assert_equal(v_index[first].tolist(), list(range(len(first))))
+
+    def test_unique_vertquads_exact(self):
+        vertex_indices = [0, 1, 0, 0, 1]
+        attributes = [(0.5, -0.0), (0.5, 0.0), (0.5, 0.0), (0.5, 1e-9), (0.5, 0.0)]
+        first, v_index = mesh_utils.unique_vertquads(vertex_indices, attributes, 0.0)
+        nose.tools.assert_equal(first.tolist(), [0, 1, 3])
+        nose.tools.assert_equal(v_index.tolist(), [0, 1, 0, 2, 1])
+
+    def test_unique_vertquads_no_attributes(self):
+        first, v_index = mesh_utils.unique_vertquads([3, 1, 3, 2], np.zeros((4, 0)), 0.0005)
+        nose.tools.assert_equal(first.tolist(), [0, 1, 3])
+        nose.tools.assert_equal(v_index.tolist(), [0, 1, 0, 2])
+
+    def test_unique_vertquads_empty(self):
+        first, v_index = mesh_utils.unique_vertquads([], np.zeros((0, 3)), 0.0005)
+        nose.tools.assert_equal(len(first), 0)
+        nose.tools.assert_equal(len(v_index), 0)
+
+
+class Test_FanTriangles:
+
+    def test_fan_triangles(self):
+        # a quad, a degenerate edge and a triangle
+        triangles, polygons = mesh_utils.fan_triangles([0, 4, 6], [4, 2, 3])
+        nose.tools.assert_equal(triangles.tolist(), [[0, 1, 2], [0, 2, 3], [6, 7, 8]])
+        nose.tools.assert_equal(polygons.tolist(), [0, 0, 2])
+        triangles, polygons = mesh_utils.fan_triangles([0, 4, 6], [4, 2, 3], flip=True)
+        nose.tools.assert_equal(triangles.tolist(), [[0, 2, 1], [0, 3, 2], [6, 8, 7]])
+
+
+def cube_arrays(smooth=False):
+    """The arrays of blender's default cube, as read by
+    mesh_builder.get_mesh_arrays, with one uv layer mapping each face onto
+    the unit square and two vertex color layers."""
+    coords = np.array([(1, 1, -1), (1, -1, -1), (-1, -1, -1), (-1, 1, -1),
+                       (1, 1, 1), (1, -1, 1), (-1, -1, 1), (-1, 1, 1)], dtype=np.float32)
+    faces = [(0, 1, 2, 3), (4, 7, 6, 5), (0, 4, 5, 1), (1, 5, 6, 2), (2, 6, 7, 3), (4, 0, 3, 7)]
+    poly_normals = np.array([(0, 0, -1), (0, 0, 1), (1, 0, 0), (0, -1, 0), (-1, 0, 0), (0, 1, 0)],
+                            dtype=np.float32)
+    num_loops = 4 * len(faces)
+    colors = np.linspace(0, 1, num_loops * 3, dtype=np.float32).reshape(num_loops, 3)
+    return {
+        "coords": coords,
+        "normals": coords / np.float32(np.sqrt(3)),
+        "loop_starts": np.arange(0, num_loops, 4, dtype=np.int32),
+        "loop_totals": np.full(len(faces), 4, dtype=np.int32),
+        "material_indices": np.array([0, 0, 1, 1, 1, 0], dtype=np.int32),
+        "smooth": np.full(len(faces), smooth),
+        "poly_normals": poly_normals,
+        "loop_vertices": np.array(faces, dtype=np.int32).reshape(-1),
+        "uv_layers": {"UVMap": np.tile(np.array([(0, 0), (1, 0), (1, 1), (0, 1)], dtype=np.float32),
+                                       (len(faces), 1))},
+        "vertex_colors": [colors, colors[::-1]],
+    }
+
+
+class Test_GetTriShape:
+
+    def test_flat_cube(self):
+        mesh = cube_arrays()
+        tri_shape = mesh_utils.get_tri_shape(mesh, range(6), ["UVMap"], use_normals=True, epsilon=0.0005)
+        # each corner has its own face normal
+        nose.tools.assert_equal(len(tri_shape["vertices"]), 24)
+        nose.tools.assert_equal(tri_shape["uvs"].shape, (24, 1, 2))
+        nose.tools.assert_equal(tri_shape["colors"].shape, (24, 0))
+        nose.tools.assert_equal(tri_shape["triangles"].shape, (12, 3))
+        nose.tools.assert_equal(tri_shape["polygons"].tolist(), [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+        # triangles face along their normal
+        corners = tri_shape["coords"][tri_shape["triangles"]]
+        cross = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        normals = tri_shape["normals"][tri_shape["triangles"][:, 0]]
+        nose.tools.assert_true(np.all(np.einsum("ij,ij->i", cross, normals) > 0))
+        nose.tools.assert_equal(normals.tolist(), np.repeat(mesh["poly_normals"], 2, axis=0).tolist())
+
+    def test_smooth_cube(self):
+        mesh = cube_arrays(smooth=True)
+        tri_shape = mesh_utils.get_tri_shape(mesh, range(6), use_normals=True, epsilon=0.0005)
+        nose.tools.assert_equal(tri_shape["vertices"].tolist(), [0, 1, 2, 3, 4, 7, 6, 5])
+        nose.tools.assert_equal(tri_shape["coords"].tolist(), mesh["coords"][tri_shape["vertices"]].tolist())
+        nose.tools.assert_equal(tri_shape["triangles"][:2].tolist(), [[0, 1, 2], [0, 2, 3]])
+        # mirrored
+        tri_shape = mesh_utils.get_tri_shape(mesh, range(6), flip=True)
+        nose.tools.assert_equal(tri_shape["triangles"][:2].tolist(), [[0, 2, 1], [0, 3, 2]])
+
+    def test_material_polygons(self):
+        mesh = cube_arrays(smooth=True)
+        polygons = np.flatnonzero(mesh["material_indices"] == 1)
+        tri_shape = mesh_utils.get_tri_shape(mesh, polygons)
+        nose.tools.assert_equal(tri_shape["polygons"].tolist(), [2, 2, 3, 3, 4, 4])
+        nose.tools.assert_equal(tri_shape["vertices"].tolist(), [0, 4, 5, 1, 6, 2, 7, 3])
+
+    def test_colors(self):
+        mesh = cube_arrays(smooth=True)
+        tri_shape = mesh_utils.get_tri_shape(mesh, [0], use_colors=True, use_alpha=True)
+        colors, alphas = mesh["vertex_colors"]
+        nose.tools.assert_equal(tri_shape["colors"][:, :3].tolist(), colors[:4].tolist())
+        nose.tools.assert_equal(tri_shape["colors"][:, 3].tolist(), alphas[:4].max(axis=1).tolist())
+        tri_shape = mesh_utils.get_tri_shape(mesh, [0], use_colors=True)
+        nose.tools.assert_equal(tri_shape["colors"][:, 3].tolist(), [1.0] * 4)
+
+    def test_degenerate_polygons(self):
+        mesh = cube_arrays()
+        mesh["loop_totals"][1] = 2
+        tri_shape = mesh_utils.get_tri_shape(mesh, [0, 1])
+        nose.tools.assert_equal(tri_shape["polygons"].tolist(), [0, 0])
+        tri_shape = mesh_utils.get_tri_shape(mesh, [])
+        nose.tools.assert_equal(tri_shape["triangles"].shape, (0, 3))
+        nose.tools.assert_equal(len(tri_shape["vertices"]), 0)
+
+
+class Test_SplitPolygons:
+
+    def test_split_polygons(self):
+        rng = np.random.RandomState(0)
+        material_indices = rng.randint(0, 12, 1000)
+        material_polygons = mesh_utils.split_polygons(material_indices, 12)
+        nose.tools.assert_equal(len(material_polygons), 12)
+        for material_index, polygons in enumerate(material_polygons):
+            nose.tools.assert_equal(polygons.tolist(), np.flatnonzero(material_indices == material_index).tolist())
+        # polygons of missing materials are left out
+        material_polygons = mesh_utils.split_polygons([2, 0, 2, 1], 2)
+        nose.tools.assert_equal([polygons.tolist() for polygons in material_polygons], [[1], [3]])
+        nose.tools.assert_equal([len(polygons) for polygons in mesh_utils.split_polygons([], 2)], [0, 0])
+
+
+def first_common_group_reference(group_vertices, polygons):
+    """The original set based body part test of the exporter."""
+    result = []
+    for poly in polygons:
+        for index, vertices in enumerate(group_vertices):
+            if set(poly) <= vertices:
+                result.append(index)
+                break
+        else:
+            result.append(-1)
+    return result
+
+
+class Test_GroupMasks:
+
+    def check_groups(self, num_groups, seed):
+        rng = np.random.RandomState(seed)
+        num_verts = 50
+        # each vertex is in a few of the groups, some not in any
+        vertices = rng.randint(0, num_verts, 4 * num_verts)
+        groups = rng.randint(0, num_groups + 3, 4 * num_verts)
+        # the mask uses some groups, not in order
+        mask_groups = rng.permutation(num_groups + 3)[:num_groups]
+        masks = mesh_utils.group_masks(vertices, groups, mask_groups, num_verts)
+        group_vertices = [set(vertices[groups == group].tolist()) for group in mask_groups]
+        polygons = [poly.tolist() for poly in rng.randint(0, num_verts, (200, 3))]
+        polygons += [[vert] for vert in range(num_verts)]
+        starts = np.cumsum([0] + [len(poly) for poly in polygons[:-1]])
+        loop_vertices = [vert for poly in polygons for vert in poly]
+        result = mesh_utils.first_common_group(masks, loop_vertices, starts)
+        nose.tools.assert_equal(result.tolist(), first_common_group_reference(group_vertices, polygons))
+
+    def test_group_masks(self):
+        for seed in range(5):
+            self.check_groups(3, seed)
+            self.check_groups(20, seed)
+
+    def test_group_masks_many_words(self):
+        # more groups than fit in a single word
+        self.check_groups(150, 0)
+
+    def test_group_masks_empty(self):
+        masks = mesh_utils.group_masks([], [], [], 4)
+        nose.tools.assert_equal(masks.shape, (4, 1))
+        result = mesh_utils.first_common_group(masks, [0, 1, 2], [0])
+        nose.tools.assert_equal(result.tolist(), [-1])
+        nose.tools.assert_equal(len(mesh_utils.first_common_group(masks, [], [])), 0)
+
+
+def skin_weights_reference(vertex_groups, bone_groups, vertmap):
+    """The original per bone scan of the skin exporter.
+
+    :param vertex_groups: For each blender vertex, a list of (group, weight).
+    :param vertmap: For each blender vertex, its nif vertices.
+    """
+    vert_list = {}
+    vert_norm = {}
+    for bone, bone_group in enumerate(bone_groups):
+        vert_list[bone] = []
+        for b_v_index, groups in enumerate(vertex_groups):
+            for group, weight in groups:
+                if group == bone_group:
+                    vert_list[bone].append((b_v_index, weight))
+                    break
+        for b_v_index, weight in vert_list[bone]:
+            vert_norm[b_v_index] = vert_norm.get(b_v_index, 0) + weight
+    result = []
+    for bone in range(len(bone_groups)):
+        for b_v_index, weight in vert_list[bone]:
+            if vertmap[b_v_index] and vert_norm[b_v_index]:
+                for vert_index in vertmap[b_v_index]:
+                    result.append((bone, vert_index, weight / vert_norm[b_v_index]))
+    return result
+
+
+class Test_SkinWeights:
+
+    def test_skin_weights(self):
+        rng = np.random.RandomState(0)
+        num_verts = 200
+        # up to four of ten groups per vertex, some with zero weight
+        vertex_groups = [list(zip(rng.permutation(10)[:rng.randint(0, 5)].tolist(),
+                                  rng.choice([0.0, 0.25, 0.5, 1.0], 4).tolist()))
+                         for _ in range(num_verts)]
+        bone_groups = [7, 2, 5, 0, 9, 4]
+        # nif vertices of part of the mesh, some blender vertices twice
+        nif_vertices = np.concatenate((rng.permutation(num_verts)[:150], rng.randint(0, num_verts, 40)))
+        vertmap = [np.flatnonzero(nif_vertices == b_v_index).tolist() for b_v_index in range(num_verts)]
+        vertices, groups, weights = zip(*[(b_v_index, group, weight)
+                                          for b_v_index, b_groups in enumerate(vertex_groups)
+                                          for group, weight in b_groups])
+        bones, verts, skin_weights = mesh_utils.skin_weights(vertices, groups, weights, bone_groups, nif_vertices)
+        expected = skin_weights_reference(vertex_groups, bone_groups, vertmap)
+        nose.tools.assert_equal(list(zip(bones.tolist(), verts.tolist())),
+                                [(bone, vert) for bone, vert, weight in expected])
+        np.testing.assert_allclose(skin_weights, [weight for bone, vert, weight in expected])
+        # no bones
+        bones, verts, skin_weights = mesh_utils.skin_weights(vertices, groups, weights, [], nif_vertices)
+        nose.tools.assert_equal(len(bones), 0)
@@ -0,0 +1,79 @@
+import nose
+
+import bpy
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+
+from io_scene_nif.io.cache import FileCache, _Unpickler
+from io_scene_nif.io.egm import EGMFile
+from io_scene_nif.io.nif import NifFile
+from io_scene_nif.utility.nif_logging import NifLog
+
+class Test_Cache_IO:
+
+    @classmethod
+    def setup_class(cls):
+        cls.io_dir = os.path.dirname(os.path.dirname(__file__))
+        cls.nif_path = os.path.join(cls.io_dir, "nif", "readable.nif")
+        cls.egm_path = os.path.join(cls.io_dir, "egm", "readable.egm")
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = FileCache(self.cache_dir, 64 * 1024 * 1024)
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_miss_then_hit(self):
+        loads = []
+        def loader(file_path):
+            loads.append(file_path)
+            return NifFile.load_nif(file_path)
+        data = self.cache.load(self.nif_path, loader)
+        cached = self.cache.load(self.nif_path, loader)
+        nose.tools.assert_equal(loads, [self.nif_path])
+        nose.tools.assert_equal(cached.version, data.version)
+        nose.tools.assert_equal(len(cached.blocks), len(data.blocks))
+        # the cached data must write the same file
+        stream, cached_stream = io.BytesIO(), io.BytesIO()
+        data.write(stream)
+        cached.write(cached_stream)
+        nose.tools.assert_equal(cached_stream.getvalue(), stream.getvalue())
+
+    def test_cache_egm(self):
+        data = self.cache.load(self.egm_path, EGMFile.load_egm)
+        cached = self.cache.load(self.egm_path, EGMFile.load_egm)
+        nose.tools.assert_equal(cached.version, data.version)
+
+    def test_cache_variant(self):
+        nose.tools.assert_not_equal(self.cache.get_key(self.nif_path),
+                                    self.cache.get_key(self.nif_path, "SKELETON_ONLY"))
+
+    def test_cache_eviction(self):
+        self.cache.load(self.nif_path, NifFile.load_nif)
+        self.cache.load(self.nif_path, NifFile.load_nif, "copy")
+        nose.tools.assert_equal(len(os.listdir(self.cache_dir)), 2)
+        self.cache.max_size = 0
+        self.cache.evict()
+        nose.tools.assert_equal(os.listdir(self.cache_dir), [])
+
+    def test_cache_rejects_other_globals(self):
+        marker_path = os.path.join(self.cache_dir, "marker")
+
+        class Exploit():
+            def __reduce__(self):
+                return os.system, ("echo > {0}".format(marker_path),)
+
+        payload = pickle.dumps(Exploit(), protocol=pickle.HIGHEST_PROTOCOL)
+        nose.tools.assert_raises(pickle.UnpicklingError, _Unpickler(io.BytesIO(payload)).load_all)
+        # a crafted entry is discarded as corrupt, and the file is loaded
+        entry_path = self.cache.get_entry_path(self.cache.get_key(self.nif_path))
+        with open(entry_path, "wb") as stream:
+            stream.write(zlib.compress(payload))
+        data = self.cache.load(self.nif_path, NifFile.load_nif)
+        nose.tools.assert_equal(data.version, NifFile.load_nif(self.nif_path).version)
+        nose.tools.assert_false(os.path.exists(marker_path))
@@ -2,6 +2,9 @@ import nose
 
 import bpy
 import os
+import tempfile
+
+from pyffi.formats.nif import NifFormat
 
 from io_scene_nif.io.kf import KFFile
 from io_scene_nif.utility.nif_logging import NifLog
@@ -23,3 +26,27 @@ class Test_KF_IO:
     @nose.tools.raises(Exception)
     def test_load_unsupported_file(self):
         KFFile.load_kf(self.working_dir + os.sep + "notkf.txt")
+
+    def n_write_sequences(self, version, user_version_2, names):
+        n_data = NifFormat.Data(version=version, user_version=11, user_version_2=user_version_2)
+        n_data.header.endian_type = NifFormat.EndianType.ENDIAN_LITTLE
+        for name in names:
+            n_seq = NifFormat.NiControllerSequence()
+            n_seq.name = name
+            n_data.roots.append(n_seq)
+        file_path = os.path.join(tempfile.mkdtemp(), "sequences.kf")
+        with open(file_path, "wb") as stream:
+            n_data.write(stream)
+        return file_path
+
+    def test_list_sequences_from_header(self):
+        # fallout 3, with block sizes in the header
+        file_path = self.n_write_sequences(0x14020007, 34, [b"Idle", b"Walk", b"Run"])
+        nose.tools.assert_equal(KFFile.list_sequences(file_path), ["Idle", "Walk", "Run"])
+
+    def test_list_sequences_full_read(self):
+        # oblivion, without block sizes
+        file_path = self.n_write_sequences(0x14000005, 11, [b"Idle", b"Walk"])
+        nose.tools.assert_equal(KFFile.list_sequences(file_path), ["Idle", "Walk"])
+        nose.tools.assert_equal(KFFile.list_sequences(self.working_dir + os.sep + "readable.kf"), [])
+
@@ -2,8 +2,12 @@ import nose
 
 import bpy
 import os
+import shutil
+import tempfile
 
-from io_scene_nif.io.nif import NifFile
+from pyffi.formats.nif import NifFormat
+
+from io_scene_nif.io.nif import BlockOffsetIndex, MappedStream, NifFile
 from io_scene_nif.utility.nif_logging import NifLog
 
 class Test_Nif_IO:
@@ -11,6 +15,52 @@ class Test_Nif_IO:
     @classmethod
     def setup_class(cls):
         cls.working_dir = os.path.dirname(__file__)
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.collision_nif = os.path.join(cls.temp_dir, "collision.nif")
+        cls.write_collision_nif(cls.collision_nif)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    @staticmethod
+    def write_collision_nif(file_path):
+        """Writes a 20.2.0.7 nif whose root has a render shape and a havok
+        collision, so its header records block sizes."""
+        n_data = NifFormat.Data(version=0x14020007, user_version=11, user_version_2=34)
+        n_data.header.endian_type = NifFormat.EndianType.ENDIAN_LITTLE
+        n_root = NifFormat.NiNode()
+        n_root.name = b'Scene Root'
+        n_shape = NifFormat.NiTriShape()
+        n_shape.name = b'Render'
+        n_shape.data = NifFormat.NiTriShapeData()
+        n_root.num_children = 1
+        n_root.children.update_size()
+        n_root.children[0] = n_shape
+        n_coll = NifFormat.bhkCollisionObject()
+        n_coll.target = n_root
+        n_coll.body = NifFormat.bhkRigidBody()
+        n_coll.body.shape = NifFormat.bhkBoxShape()
+        n_root.collision_object = n_coll
+        n_data.roots = [n_root]
+        with open(file_path, "wb") as stream:
+            n_data.write(stream)
+
+    def read_collision_blocks(self, nif_stream):
+        nif_data = NifFormat.Data()
+        index = BlockOffsetIndex.read(nif_data, nif_stream)
+        NifFile._read_blocks(nif_data, nif_stream, index, NifFile.COLLISION_BLOCK_TYPES)
+        return nif_data
+
+    def check_collision_blocks(self, nif_data):
+        # the render shape and its data are skipped, the havok blocks kept
+        nose.tools.assert_equal(
+            sorted(block.__class__.__name__ for block in nif_data.blocks),
+            ['NiNode', 'bhkBoxShape', 'bhkCollisionObject', 'bhkRigidBody'])
+        n_root = nif_data.roots[0]
+        nose.tools.assert_equal(list(n_root.children), [None])
+        nose.tools.assert_is_instance(n_root.collision_object.body.shape, NifFormat.bhkBoxShape)
+        nose.tools.assert_is(n_root.collision_object.target, n_root)
         
     def test_load_supported_version(self):
         data = NifFile.load_nif(self.working_dir + os.sep + "readable.nif")
@@ -23,3 +73,34 @@ class Test_Nif_IO:
     @nose.tools.raises(Exception)
     def test_load_unsupported_file(self):
         NifFile.load_nif(self.working_dir + os.sep + "notnif.txt")
+
+    def test_load_supported_version_mapped(self):
+        threshold = NifFile.MMAP_THRESHOLD
+        NifFile.MMAP_THRESHOLD = 0
+        try:
+            data = NifFile.load_nif(self.working_dir + os.sep + "readable.nif", use_mmap=True)
+        finally:
+            NifFile.MMAP_THRESHOLD = threshold
+        nose.tools.assert_equal(data.version, 335544325)
+
+    def test_load_index(self):
+        index = NifFile.load_index(self.working_dir + os.sep + "readable.nif")
+        data = NifFile.load_nif(self.working_dir + os.sep + "readable.nif")
+        nose.tools.assert_equal(len(index), len(data.blocks))
+        nose.tools.assert_equal(sum(index.count_by_type().values()), len(data.blocks))
+
+    def test_load_filtered_without_block_sizes(self):
+        # 20.0.0.5 has no block sizes, so every block is read
+        data = NifFile.load_nif(self.working_dir + os.sep + "readable.nif",
+                                block_types=NifFile.SKELETON_BLOCK_TYPES)
+        nose.tools.assert_equal(data.version, 335544325)
+        nose.tools.assert_equal(len(data.blocks), len(NifFile.load_index(self.working_dir + os.sep + "readable.nif")))
+
+    def test_read_collision_blocks(self):
+        with open(self.collision_nif, "rb") as nif_stream:
+            self.check_collision_blocks(self.read_collision_blocks(nif_stream))
+
+    def test_read_collision_blocks_mapped(self):
+        with open(self.collision_nif, "rb") as nif_stream:
+            with MappedStream(nif_stream) as nif_map:
+                self.check_collision_blocks(self.read_collision_blocks(nif_map))
@@ -0,0 +1,109 @@
+import nose
+
+from pyffi.formats.nif import NifFormat
+
+from io_scene_nif.utility.nif_block_index import BlockIndex
+
+
+def n_create_node(name, children=()):
+    n_node = NifFormat.NiNode()
+    n_node.name = name
+    n_node.num_children = len(children)
+    n_node.children.update_size()
+    for i, n_child in enumerate(children):
+        n_node.children[i] = n_child
+    return n_node
+
+
+class Test_BlockIndex:
+
+    def setup(self):
+        self.n_shape_data = NifFormat.NiTriShapeData()
+        self.n_shapes = []
+        for name in (b'Shape0', b'Shape1'):
+            n_shape = NifFormat.NiTriShape()
+            n_shape.name = name
+            # both shapes share their data
+            n_shape.data = self.n_shape_data
+            self.n_shapes.append(n_shape)
+        self.n_bone = n_create_node(b'Bip01 Spine', [self.n_shapes[1]])
+        self.n_skelroot = n_create_node(b'Bip01', [self.n_bone])
+        self.n_root = n_create_node(b'Scene Root', [self.n_shapes[0], self.n_skelroot])
+        self.block_index = BlockIndex([self.n_root])
+
+    def test_blocks_in_tree_order(self):
+        nose.tools.assert_equal(self.block_index.blocks, list(self.n_root.tree(unique=True)))
+        nose.tools.assert_equal(len(self.block_index), 6)
+
+    def test_get_blocks(self):
+        nose.tools.assert_equal(self.block_index.get_blocks(NifFormat.NiNode),
+                                [self.n_root, self.n_skelroot, self.n_bone])
+        nose.tools.assert_equal(self.block_index.get_blocks(NifFormat.NiAVObject, root=self.n_skelroot),
+                                [self.n_skelroot, self.n_bone, self.n_shapes[1]])
+        nose.tools.assert_equal(self.block_index.get_blocks(NifFormat.NiUVData), [])
+
+    def test_find(self):
+        for name in (b'Bip01 Spine', 'Bip01 Spine'):
+            nose.tools.assert_is(self.block_index.find(block_name=name), self.n_root.find(block_name=b'Bip01 Spine'))
+        nose.tools.assert_is(self.block_index.find(block_name=b'Shape0', root=self.n_skelroot), None)
+        nose.tools.assert_is(self.block_index.find(block_type=NifFormat.NiTriShape, root=self.n_skelroot),
+                             self.n_shapes[1])
+
+    def test_parents(self):
+        nose.tools.assert_is(self.block_index.get_parent(self.n_root), None)
+        nose.tools.assert_is(self.block_index.get_parent(self.n_shapes[1]), self.n_bone)
+        nose.tools.assert_equal(self.block_index.get_depth(self.n_shapes[1]), 3)
+        nose.tools.assert_equal(self.block_index.get_depth(self.n_shapes[0]), 1)
+
+    def test_get_names(self):
+        names = self.block_index.get_names(self.n_skelroot)
+        nose.tools.assert_equal(set(names), {b'Bip01', b'Bip01 Spine', b'Shape1'})
+        nose.tools.assert_is(names[b'Shape1'], self.n_shapes[1])
+        # built once per root
+        nose.tools.assert_is(self.block_index.get_names(self.n_skelroot), names)
+        nose.tools.assert_is(self.block_index.find(block_name='Bip01 Spine', root=self.n_root), self.n_bone)
+
+    def test_find_controller(self):
+        n_vis_ctrl = NifFormat.NiVisController()
+        self.n_bone.add_controller(n_vis_ctrl)
+        nose.tools.assert_is(self.block_index.find_controller(self.n_bone, NifFormat.NiVisController), n_vis_ctrl)
+        nose.tools.assert_is(self.block_index.find_controller(self.n_bone, NifFormat.NiKeyframeController), None)
+        n_kf_ctrl = NifFormat.NiTransformController()
+        self.block_index.add_controller(self.n_bone, n_kf_ctrl)
+        nose.tools.assert_is(self.block_index.find_controller(self.n_bone, NifFormat.NiKeyframeController), n_kf_ctrl)
+        nose.tools.assert_is(self.block_index.find_controller(self.n_bone, NifFormat.NiVisController), n_vis_ctrl)
+
+    def test_shared_blocks(self):
+        # the shape data is listed under Shape0, but is also below Bip01
+        nose.tools.assert_equal(self.block_index.get_blocks(NifFormat.NiTriShapeData, root=self.n_skelroot),
+                                [self.n_shape_data])
+        nose.tools.assert_true(self.block_index.is_in_subtree(self.n_shape_data, self.n_bone))
+        nose.tools.assert_false(self.block_index.is_in_subtree(self.n_shapes[0], self.n_skelroot))
+        # in index order, so the shape data comes first
+        nose.tools.assert_equal(self.block_index.get_subtree(self.n_bone),
+                                [self.n_shape_data, self.n_bone, self.n_shapes[1]])
+
+    def test_shared_subtrees(self):
+        # a node that is the child of two nodes, the second one reached
+        # while the first reference is still pending
+        n_shared = n_create_node(b'Shared', self.n_shapes)
+        n_node = n_create_node(b'Node', [n_shared])
+        n_root = n_create_node(b'Root', [n_node, n_shared])
+        block_index = BlockIndex([n_root])
+        nose.tools.assert_equal(block_index.blocks, list(n_root.tree(unique=True)))
+        nose.tools.assert_is(block_index.get_parent(n_shared), n_node)
+        nose.tools.assert_equal(block_index.get_blocks(NifFormat.NiTriShape, root=n_node), self.n_shapes)
+        # a shared node whose own shared blocks are listed elsewhere
+        n_other = n_create_node(b'Other', [n_shared])
+        n_root = n_create_node(b'Root', [self.n_shapes[0], n_shared, n_other])
+        block_index = BlockIndex([n_root])
+        nose.tools.assert_equal(block_index.get_blocks(NifFormat.NiTriShape, root=n_other), self.n_shapes)
+        nose.tools.assert_equal(block_index.get_blocks(NifFormat.NiTriShapeData, root=n_other), [self.n_shape_data])
+        nose.tools.assert_equal(set(block_index.get_names(n_other)), {b'Other', b'Shared', b'Shape0', b'Shape1'})
+
+    def test_unknown_blocks(self):
+        n_node = n_create_node(b'Unknown')
+        nose.tools.assert_false(self.block_index.is_in_subtree(n_node, self.n_root))
+        nose.tools.assert_is(self.block_index.get_parent(n_node), None)
+        nose.tools.assert_is(self.block_index.get_depth(n_node), None)
+        nose.tools.assert_is(self.block_index.find(block_name=b'Unknown', root=self.n_root), None)
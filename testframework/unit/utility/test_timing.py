@@ -0,0 +1,24 @@
+import nose
+
+from io_scene_nif.utility.nif_timing import NifTiming
+
+class Test_Timing:
+
+    def test_stage(self):
+        NifTiming.reset()
+        for _ in range(3):
+            with NifTiming.stage("UV layer UVMap"):
+                pass
+        with NifTiming.stage("UV layer UVMap.001"):
+            pass
+        nose.tools.assert_equal(list(NifTiming.stages), ["UV layer UVMap", "UV layer UVMap.001"])
+        nose.tools.assert_equal(NifTiming.stages["UV layer UVMap"][1], 3)
+
+    def test_stage_exception(self):
+        NifTiming.reset()
+        try:
+            with NifTiming.stage("failing"):
+                raise ValueError
+        except ValueError:
+            pass
+        nose.tools.assert_equal(NifTiming.stages["failing"][1], 1)
@@ -0,0 +1,65 @@
+import nose
+
+import bpy
+import threading
+
+from io_scene_nif.utility.nif_logging import NifLog
+from io_scene_nif.utility.nif_utils import NifError
+from io_scene_nif.utility.nif_workers import NifWorkers
+
+class _RecordingOperator():
+    def __init__(self):
+        self.reports = []
+
+    def report(self, level, message):
+        self.reports.append((level, message))
+
+class Test_Workers:
+
+    def setup(self):
+        self.op = NifLog.op
+        NifLog.op = _RecordingOperator()
+
+    def teardown(self):
+        NifLog.op = self.op
+        NifWorkers.shutdown()
+
+    def test_result(self):
+        futures = [NifWorkers.submit(pow, i, 2) for i in range(10)]
+        nose.tools.assert_equal([NifWorkers.result(future) for future in futures],
+                                [i * i for i in range(10)])
+
+    @nose.tools.raises(NifError)
+    def test_exception(self):
+        def fail():
+            raise NifError("Not a NIF file.")
+        NifWorkers.result(NifWorkers.submit(fail))
+
+    def test_worker_log_deferred(self):
+        def work():
+            NifLog.info("from worker")
+            return len(NifLog.op.reports)
+        # nothing is reported from the worker thread itself
+        nose.tools.assert_equal(NifWorkers.result(NifWorkers.submit(work)), 0)
+        nose.tools.assert_equal(NifLog.op.reports, [({'INFO'}, "from worker")])
+
+    def test_finish(self):
+        started = threading.Event()
+        release = threading.Event()
+        def work(index):
+            started.set()
+            release.wait()
+            NifLog.info("from worker {0}".format(index))
+        def fail():
+            raise NifError("Not a NIF file.")
+        futures = [NifWorkers.submit(fail)]
+        futures.extend(NifWorkers.submit(work, index) for index in range(2 * NifWorkers.max_workers))
+        started.wait()
+        release.set()
+        # the failure is not raised, the queued calls may be cancelled, and
+        # the messages of those that ran are reported
+        NifWorkers.finish(futures)
+        nose.tools.assert_true(all(future.done() for future in futures))
+        num_run = sum(1 for future in futures[1:] if not future.cancelled())
+        nose.tools.assert_equal(len(NifLog.op.reports), num_run)
+        nose.tools.assert_true(all(message.startswith("from worker") for _, message in NifLog.op.reports))